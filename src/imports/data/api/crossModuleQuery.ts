@@ -1,5 +1,6 @@
 import { ChildProcess } from 'child_process';
 import { Readable } from 'node:stream';
+import { randomUUID } from 'node:crypto';
 import pLimit from 'p-limit';
 
 import { getUserSafe } from '@imports/auth/getUser';
@@ -11,8 +12,8 @@ import type { User } from '@imports/model/User';
 import type { Span } from '@opentelemetry/api';
 
 import findStream from './findStream';
-import { createPythonProcess } from './pythonStreamBridge';
-import { NEWLINE_SEPARATOR } from './streamConstants';
+import { createPythonProcess, recordPythonMetrics, recordPythonPayloadTime } from './pythonStreamBridge';
+import { NEWLINE_SEPARATOR, PYTHON_STDOUT_ENCODING } from './streamConstants';
 import { validateCrossModuleQuery, resolveRelationLookup, buildRelationFilter } from './crossModuleQueryValidator';
 
 import type {
@@ -160,7 +161,7 @@ export default async function crossModuleQuery({ authTokenId, contextUser, body,
 
 			// Step 8: Read results from Python
 			tracingSpan?.addEvent('Collecting results from Python');
-			mergedRecords = await collectPythonResults(pythonProcess);
+			mergedRecords = await collectPythonResults(pythonProcess, tracingSpan);
 		} else {
 			mergedRecords = primaryRecords;
 		}
@@ -379,6 +380,7 @@ async function sendRPC(pythonProcess: ChildProcess, config: CrossModulePythonCon
 
 		const request: CrossModuleRPCRequest = {
 			jsonrpc: '2.0',
+			id: randomUUID(),
 			method: 'aggregate',
 			params: { config },
 		};
@@ -413,7 +415,7 @@ async function sendDatasets(pythonProcess: ChildProcess, datasets: Map<string, R
 	});
 }
 
-async function collectPythonResults(pythonProcess: ChildProcess): Promise<Record<string, unknown>[]> {
+async function collectPythonResults(pythonProcess: ChildProcess, tracingSpan?: Span): Promise<Record<string, unknown>[]> {
 	return new Promise((resolve, reject) => {
 		if (pythonProcess.stdout == null) {
 			reject(new Error('Python process stdout is not available'));
@@ -422,10 +424,12 @@ async function collectPythonResults(pythonProcess: ChildProcess): Promise<Record
 
 		let buffer = '';
 		let rpcResponseRead = false;
+		let headerReceivedAt = 0;
 		const results: Record<string, unknown>[] = [];
 
-		pythonProcess.stdout.on('data', (data: Buffer) => {
-			buffer += data.toString();
+		pythonProcess.stdout.setEncoding(PYTHON_STDOUT_ENCODING);
+		pythonProcess.stdout.on('data', (data: string) => {
+			buffer += data;
 			const lines = buffer.split(NEWLINE_SEPARATOR);
 			buffer = lines.pop() ?? '';
 
@@ -440,6 +444,8 @@ async function collectPythonResults(pythonProcess: ChildProcess): Promise<Record
 							return;
 						}
 						rpcResponseRead = true;
+						headerReceivedAt = Date.now();
+						recordPythonMetrics(rpcResponse.metrics, tracingSpan);
 						continue;
 					} catch (error) {
 						reject(new Error(`Failed to parse RPC response: ${(error as Error).message}`));
@@ -465,6 +471,8 @@ async function collectPythonResults(pythonProcess: ChildProcess): Promise<Record
 							return;
 						}
 						rpcResponseRead = true;
+						headerReceivedAt = Date.now();
+						recordPythonMetrics(rpcResponse.metrics, tracingSpan);
 					} catch {
 						reject(new Error('RPC response not received from Python process'));
 						return;
@@ -483,6 +491,7 @@ async function collectPythonResults(pythonProcess: ChildProcess): Promise<Record
 				return;
 			}
 
+			recordPythonPayloadTime(headerReceivedAt, tracingSpan);
 			resolve(results);
 		});
 
@@ -489,7 +489,7 @@ export default async function graphStream({
 
 		// 7. Read RPC response from Python stdout (first line) and collect SVG content
 		tracingSpan?.addEvent('Collecting SVG from Python');
-		const svg = await collectSVGFromPython(pythonProcess);
+		const svg = await collectSVGFromPython(pythonProcess, tracingSpan);
 		const pythonTime = Date.now() - startPython;
 		logger.debug({ pythonTimeMs: pythonTime }, 'Python graph generation completed');
 
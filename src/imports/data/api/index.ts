@@ -1,6 +1,6 @@
 export { default as find } from './find';
 export { default as findStream } from './findStream';
 export { default as findObjectStream } from './findObjectStream';
-export { default as pivotStream } from './pivotStream';
+export { default as pivotStream, pivotExpand, pivotFrames } from './pivotStream';
 export { default as graphStream } from './graphStream';
 export { default as kpiStream } from './kpiStream';
@@ -243,7 +243,7 @@ export default async function kpiStream({ kpiConfig, tracingSpan, ...findParams
 
 		// Collect result from Python
 		tracingSpan?.addEvent('Collecting result from Python');
-		const pythonResult = await collectResultFromPython(pythonProcess);
+		const pythonResult = await collectResultFromPython(pythonProcess, tracingSpan);
 		const pythonTime = Date.now() - startPython;
 		logger.debug({ pythonTimeMs: pythonTime }, 'Python KPI aggregation completed');
 
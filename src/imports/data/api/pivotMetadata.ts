@@ -204,6 +204,8 @@ export function enrichPivotConfig(document: string, pivotConfig: PivotConfig, la
 			type: fieldMeta.type,
 			level: index,
 			lookup: lookupConfig || undefined,
+			limit: row.limit,
+			orderBy: row.orderBy,
 		};
 	});
 
@@ -225,6 +227,8 @@ export function enrichPivotConfig(document: string, pivotConfig: PivotConfig, la
 			values: fieldMeta.options,
 			lookup: lookupConfig || undefined,
 			bucket,
+			limit: column.limit,
+			orderBy: column.orderBy,
 		};
 	});
 
@@ -241,6 +245,7 @@ export function enrichPivotConfig(document: string, pivotConfig: PivotConfig, la
 		return {
 			field: value.field,
 			aggregator: value.aggregator,
+			percentile: value.percentile,
 			label: fieldMeta.label,
 			type: fieldMeta.type,
 			format,
@@ -2,9 +2,22 @@ import { ChildProcess } from 'child_process';
 import { Readable } from 'node:stream';
 import { logger } from '@imports/utils/logger';
 import findStream from './findStream';
-import { createPythonProcess, sendRPCRequest, collectResultFromPython } from './pythonStreamBridge';
+import { createPythonProcess, sendRPCRequest, collectResultFromPython, streamFramesFromPython, PythonRPCError } from './pythonStreamBridge';
 import { enrichPivotConfig } from './pivotMetadata';
-import { PivotStreamParams, PivotEnrichedResult, PivotConfig } from '@imports/types/pivot';
+import {
+	PivotStreamParams,
+	PivotEnrichedResult,
+	PivotConfig,
+	PivotExpandParams,
+	PivotExpandResult,
+	PivotFramesResult,
+	PivotGrandTotals,
+	PivotLimitInfo,
+	PivotPreflightPolicy,
+	PivotPreflightReport,
+	PivotResultFrame,
+	PythonOutputFormat,
+} from '@imports/types/pivot';
 import { KonectyResultError } from '@imports/types/result';
 import { errorReturn } from '@imports/utils/return';
 import { MetaObject } from '@imports/model/MetaObject';
@@ -256,13 +269,95 @@ async function sendDataToPython(pythonProcess: ChildProcess, documents: Record<s
 	});
 }
 
-export default async function pivotStream({
-	pivotConfig,
-	transformDatesToString = true,
-	tracingSpan,
-	lang = 'pt_BR',
-	...findParams
-}: PivotStreamParams): Promise<PivotEnrichedResult | KonectyResultError> {
+// JSON-RPC error code of pivot_table.py for a pivot over its pre-flight thresholds (pivot_preflight.py)
+const PREFLIGHT_ERROR_CODE = -32001;
+const PREFLIGHT_ERROR = 'pivot.error.preflight.exceeded';
+// Message of pivot_table.py for an expansion key whose state is unknown, expired or someone else's
+const EXPIRED_EXPANSION_KEY_MESSAGE = 'Unknown or expired expansion key';
+
+const PREFLIGHT_ON_EXCEED: ReadonlyArray<NonNullable<PivotPreflightPolicy['onExceed']>> = ['error', 'topN'];
+
+/**
+ * Value of a pre-flight threshold variable, undefined when unset
+ * @throws When it is not a positive number (or integer), instead of leaving the guard off
+ */
+function preflightThreshold(name: string, integer: boolean): number | undefined {
+	const text = process.env[name];
+	if (text == null) {
+		return undefined;
+	}
+	const value = Number(text);
+	if (!Number.isFinite(value) || value <= 0 || (integer && !Number.isInteger(value))) {
+		throw new Error(`${name} must be a positive ${integer ? 'integer' : 'number'}: ${text}`);
+	}
+	return value;
+}
+
+/**
+ * Thresholds of the size pre-flight pivot_table.py runs before grouping, from the environment:
+ * PIVOT_PREFLIGHT_MAX_CELLS, PIVOT_PREFLIGHT_MAX_MEMORY_MB, PIVOT_PREFLIGHT_ON_EXCEED (error or topN) and
+ * PIVOT_PREFLIGHT_TOP_N. Undefined (no pre-flight) unless a maximum is set.
+ * @throws When a variable is malformed
+ */
+function preflightPolicy(): PivotPreflightPolicy | undefined {
+	const maxCells = preflightThreshold('PIVOT_PREFLIGHT_MAX_CELLS', true);
+	const maxMemoryMb = preflightThreshold('PIVOT_PREFLIGHT_MAX_MEMORY_MB', false);
+	const topN = preflightThreshold('PIVOT_PREFLIGHT_TOP_N', true);
+	const onExceed = PREFLIGHT_ON_EXCEED.find(value => value === (process.env.PIVOT_PREFLIGHT_ON_EXCEED ?? 'error'));
+	if (onExceed == null) {
+		throw new Error(`PIVOT_PREFLIGHT_ON_EXCEED must be one of ${PREFLIGHT_ON_EXCEED.join(', ')}: ${process.env.PIVOT_PREFLIGHT_ON_EXCEED}`);
+	}
+	if (maxCells == null && maxMemoryMb == null) {
+		return undefined;
+	}
+	return { maxCells, maxMemoryMb, onExceed, topN };
+}
+
+// Read once, when the module loads: a malformed variable fails the startup instead of silently switching the guard off
+const PREFLIGHT_POLICY = preflightPolicy();
+
+/**
+ * Error returned for a failed pivot or expansion: the pre-flight estimate of one over its thresholds, a reload hint for an
+ * expired expansion key, the generic message otherwise (details stay in the log)
+ */
+function pivotErrorReturn(error: Error): KonectyResultError {
+	if (error instanceof PythonRPCError && error.code === PREFLIGHT_ERROR_CODE) {
+		const report = error.data as PivotPreflightReport;
+		return errorReturn([
+			{
+				code: PREFLIGHT_ERROR,
+				message: `Pivot too large: about ${report.cells} cells and ${report.memoryMb} MB projected, please filter the data or limit its rows and columns`,
+				details: JSON.stringify(report),
+			},
+		]);
+	}
+	if (error instanceof PythonRPCError && error.message.includes(EXPIRED_EXPANSION_KEY_MESSAGE)) {
+		return errorReturn('Pivot expansion expired, please reload the pivot');
+	}
+	return errorReturn('Oops something went wrong, please try again later... if this message persisits, please contact our support');
+}
+
+/**
+ * A pivot whose records were sent to Python: the process writing its result (null when the query returned
+ * no records), the metadata of the result and how many records the query matched
+ */
+interface PivotRun {
+	pythonProcess: ChildProcess | null;
+	metadata: PivotEnrichedResult['metadata'];
+	total?: number;
+	limitInfo?: PivotLimitInfo;
+	// When the data started being sent to Python, the start point of the Python aggregation time
+	startPython?: number;
+}
+
+/**
+ * Queries the records of a pivot, populates their lookups and sends them to pivot_table.py
+ * with the result written in outputFormat; kills the Python process if any step fails after it started
+ */
+async function runPivot(
+	{ pivotConfig, transformDatesToString = true, tracingSpan, lang = 'pt_BR', ownerId, ...findParams }: PivotStreamParams,
+	outputFormat: PythonOutputFormat,
+): Promise<PivotRun | KonectyResultError> {
 	let pythonProcess: ChildProcess | null = null;
 
 	try {
@@ -271,6 +366,11 @@ export default async function pivotStream({
 		// 0. Enrich pivot config with metadata
 		tracingSpan?.addEvent('Enriching pivot config with metadata');
 		const enrichedConfig = enrichPivotConfig(findParams.document, pivotConfig, lang);
+		const metadata: PivotEnrichedResult['metadata'] = {
+			rows: enrichedConfig.rows,
+			columns: enrichedConfig.columns,
+			values: enrichedConfig.values,
+		};
 
 		// 0.1 Extract fields from pivot config for proper projection
 		const pivotFields = extractFieldsFromPivotConfig(findParams.document, pivotConfig);
@@ -327,19 +427,10 @@ export default async function pivotStream({
 		if (limitReached) {
 			logger.warn(`Pivot result limited to ${PIVOT_MAX_RECORDS} of ${totalRecords} records. Results may be incomplete.`);
 		}
+		const limitInfo: PivotLimitInfo | undefined = limitReached ? { limited: true, limit: PIVOT_MAX_RECORDS, total: totalRecords } : undefined;
 
 		if (populatedData.length === 0) {
-			return {
-				success: true,
-				metadata: {
-					rows: enrichedConfig.rows,
-					columns: enrichedConfig.columns,
-					values: enrichedConfig.values,
-				},
-				data: [],
-				grandTotals: { cells: {}, totals: {} },
-				total: 0,
-			};
+			return { pythonProcess: null, metadata, total: 0 };
 		}
 
 		// 3. Create Python process
@@ -347,10 +438,12 @@ export default async function pivotStream({
 		pythonProcess = createPythonProcess();
 
 		// 4. Send RPC request with enriched pivot config
-		// Include blankText translated based on language
+		// Include blankText and othersText (label of the Others key of limited levels) translated based on language,
+		// and the owner of the cached state of a depth-limited pivot
 		const blankText = lang === 'pt_BR' ? '(vazio)' : '(blank)';
+		const othersText = lang === 'pt_BR' ? 'Outros' : 'Others';
 		tracingSpan?.addEvent('Sending RPC request to Python');
-		await sendRPCRequest(pythonProcess, 'pivot', { config: enrichedConfig, blankText } as any);
+		await sendRPCRequest(pythonProcess, 'pivot', { config: enrichedConfig, blankText, othersText, owner: ownerId, outputFormat, preflight: PREFLIGHT_POLICY } as any);
 
 		// 5. Send populated data to Python
 		tracingSpan?.addEvent('Sending data to Python');
@@ -358,10 +451,56 @@ export default async function pivotStream({
 		const startPython = Date.now();
 		await sendDataToPython(pythonProcess, populatedData);
 
+		return { pythonProcess, metadata, total, limitInfo, startPython };
+	} catch (err) {
+		killPythonProcess(pythonProcess);
+		throw err;
+	}
+}
+
+function killPythonProcess(pythonProcess: ChildProcess | null): void {
+	if (pythonProcess != null && !pythonProcess.killed) {
+		try {
+			pythonProcess.kill();
+		} catch (killError) {
+			logger.warn(killError, 'Error killing Python process during cleanup');
+		}
+	}
+}
+
+async function* framesOf(frames: PivotResultFrame[]): AsyncGenerator<PivotResultFrame> {
+	yield* frames;
+}
+
+function emptyGrandTotals(pivotConfig: PivotConfig): PivotGrandTotals {
+	return (pivotConfig.options?.cellFormat ?? 'keyed') === 'keyed' ? { cells: {}, totals: {} } : { cells: [], totals: [] };
+}
+
+export default async function pivotStream(params: PivotStreamParams): Promise<PivotEnrichedResult | KonectyResultError> {
+	const { tracingSpan } = params;
+	let pythonProcess: ChildProcess | null = null;
+
+	try {
+		const run = await runPivot(params, 'json');
+		if ('success' in run) {
+			return run;
+		}
+		pythonProcess = run.pythonProcess;
+
+		if (pythonProcess == null) {
+			return {
+				success: true,
+				metadata: run.metadata,
+				data: [],
+				grandTotals: emptyGrandTotals(params.pivotConfig),
+				total: 0,
+			};
+		}
+
 		// 6. Collect result from Python
 		tracingSpan?.addEvent('Collecting result from Python');
-		const { data: hierarchyData, grandTotals, columnHeaders } = await collectResultFromPython(pythonProcess);
-		const pythonTime = Date.now() - startPython;
+		const { data: hierarchyData, grandTotals, columnHeaders, cellLayout, preflight } = await collectResultFromPython(pythonProcess, tracingSpan);
+		const pythonTime = Date.now() - (run.startPython as number);
 		logger.info(`Python aggregation completed in ${pythonTime}ms, columnHeaders: ${columnHeaders?.length ?? 0}`);
 
 		// 7. Return enriched result
@@ -372,26 +511,26 @@ export default async function pivotStream({
 
 		const result: PivotEnrichedResult = {
 			success: true,
-			metadata: {
-				rows: enrichedConfig.rows,
-				columns: enrichedConfig.columns,
-				values: enrichedConfig.values,
-			},
+			metadata: run.metadata,
 			data: hierarchyData as PivotEnrichedResult['data'],
 			grandTotals: grandTotals as unknown as PivotEnrichedResult['grandTotals'],
 			columnHeaders: columnHeaders as PivotEnrichedResult['columnHeaders'],
 		};
 
-		if (total != null) {
-			result.total = total;
+		if (cellLayout != null) {
+			result.cellLayout = cellLayout as unknown as PivotEnrichedResult['cellLayout'];
+		}
+		if (preflight != null) {
+			logger.warn(`Pivot levels limited by the pre-flight: ${JSON.stringify(preflight.limited)}`);
+			result.preflight = preflight as unknown as PivotEnrichedResult['preflight'];
+		}
+
+		if (run.total != null) {
+			result.total = run.total;
 		}
 		// Add limit info if limit was reached
-		if (limitReached) {
-			(result as any).limitInfo = {
-				limited: true,
-				limit: PIVOT_MAX_RECORDS,
-				total: totalRecords,
-			};
+		if (run.limitInfo != null) {
+			result.limitInfo = run.limitInfo;
 		}
 
 		return result;
@@ -399,15 +538,90 @@ export default async function pivotStream({
 		const error = err as Error;
 		tracingSpan?.setAttribute('error', error.message);
 		logger.error(error, `Error executing pivotStream: ${error.message}`);
+		killPythonProcess(pythonProcess);
+
+		return pivotErrorReturn(error);
+	}
+}
 
-		if (pythonProcess != null && !pythonProcess.killed) {
+/**
+ * Pivot result as frames, forwarded as pivot_table.py writes them (outputFormat 'ndjson'): a metadata frame,
+ * the header frame (columnHeaders, cellLayout), one row frame per node in depth-first order (without children;
+ * its level places it under the last row of the level above) and the grandTotals frame.
+ * Python errors are returned before the first frame, since its RPC header is read before this resolves;
+ * closing the frames early kills the Python process.
+ */
+export async function pivotFrames(params: PivotStreamParams): Promise<PivotFramesResult | KonectyResultError> {
+	const { tracingSpan } = params;
+	let pythonProcess: ChildProcess | null = null;
+
+	try {
+		const run = await runPivot(params, 'ndjson');
+		if ('success' in run) {
+			return run;
+		}
+		pythonProcess = run.pythonProcess;
+		const metadataFrame: PivotResultFrame = { type: 'metadata', metadata: run.metadata, total: run.total, limitInfo: run.limitInfo };
+
+		if (pythonProcess == null) {
+			return { success: true, frames: framesOf([metadataFrame, { type: 'header', columnHeaders: [] }, { type: 'grandTotals', grandTotals: emptyGrandTotals(params.pivotConfig) }]) };
+		}
+
+		tracingSpan?.addEvent('Streaming result from Python');
+		const pythonFrames = streamFramesFromPython(pythonProcess, tracingSpan) as AsyncGenerator<PivotResultFrame>;
+		const first = await pythonFrames.next();
+		const runningProcess = pythonProcess;
+
+		async function* frames(): AsyncGenerator<PivotResultFrame> {
 			try {
-				pythonProcess.kill();
-			} catch (killError) {
-				logger.warn(killError, 'Error killing Python process during cleanup');
+				yield metadataFrame;
+				if (first.done !== true) {
+					yield first.value;
+				}
+				yield* pythonFrames;
+			} finally {
+				killPythonProcess(runningProcess.exitCode == null ? runningProcess : null);
 			}
 		}
 
-		return errorReturn('Oops something went wrong, please try again later... if this message persisits, please contact our support');
+		return { success: true, frames: frames() };
+	} catch (err) {
+		const error = err as Error;
+		tracingSpan?.setAttribute('error', error.message);
+		logger.error(error, `Error executing pivotFrames: ${error.message}`);
+		killPythonProcess(pythonProcess);
+
+		return pivotErrorReturn(error);
+	}
+}
+
+/**
+ * Children of a node of a depth-limited pivot (options.maxDepth), read by pivot_table.py from the aggregation
+ * state it cached for that pivot, without querying or sending the records again
+ * @param expansionKey Opaque expansionKey of the node
+ * @param maxDepth Levels of children returned; the last one carries expansionKeys again
+ * @param cellFormat Format of cells and totals, the one the pivot was requested with (ordinals of its cellLayout)
+ * @param ownerId User id the pivot was computed for
+ */
+export async function pivotExpand({ expansionKey, maxDepth, cellFormat, ownerId, tracingSpan }: PivotExpandParams): Promise<PivotExpandResult | KonectyResultError> {
+	let pythonProcess: ChildProcess | null = null;
+
+	try {
+		tracingSpan?.addEvent('Expanding pivot node');
+		pythonProcess = createPythonProcess();
+		await sendRPCRequest(pythonProcess, 'pivot.expand', { expansionKey, maxDepth, cellFormat, owner: ownerId });
+		pythonProcess.stdin?.end();
+
+		const { data } = await collectResultFromPython(pythonProcess, tracingSpan);
+		tracingSpan?.addEvent('Pivot node expanded', { rowCount: String(data.length) });
+
+		return { success: true, data: data as PivotExpandResult['data'] };
+	} catch (err) {
+		const error = err as Error;
+		tracingSpan?.setAttribute('error', error.message);
+		logger.error(error, `Error executing pivotExpand: ${error.message}`);
+		killPythonProcess(pythonProcess);
+
+		return pivotErrorReturn(error);
 	}
 }
@@ -1,8 +1,12 @@
 import { spawn, ChildProcess } from 'child_process';
+import { randomUUID } from 'node:crypto';
+import { createInterface } from 'node:readline';
 import { Readable } from 'node:stream';
+import type { Span } from '@opentelemetry/api';
 import { logger } from '@imports/utils/logger';
-import { RPCRequest, RPCResponse, PivotEnrichedConfig } from '@imports/types/pivot';
-import { NEWLINE_SEPARATOR } from './streamConstants';
+import { RPCRequest, RPCResponse, PivotEnrichedConfig, PivotExpandRPCParams, PivotPreflightPolicy, PythonDataParams, PythonStageMetrics } from '@imports/types/pivot';
+import { NEWLINE_SEPARATOR, PYTHON_STDOUT_ENCODING } from './streamConstants';
+import { createWorkerBackedProcess, isPythonWorkerEnabled } from './pythonWorkerPool';
 import path from 'node:path';
 
 const PYTHON_SCRIPT_PATH = path.join(process.cwd(), 'src', 'scripts', 'python', 'pivot_table.py');
@@ -11,14 +15,33 @@ const PYTHON_SCRIPT_PATH_DOCKER = path.join('/app', 'scripts', 'python', 'pivot_
 const PYTHON_GRAPH_SCRIPT_PATH = path.join(process.cwd(), 'src', 'scripts', 'python', 'graph_generator.py');
 const PYTHON_GRAPH_SCRIPT_PATH_DOCKER = path.join('/app', 'scripts', 'python', 'graph_generator.py');
 
+/**
+ * JSON-RPC error header written by a Python script instead of its result
+ */
+export class PythonRPCError extends Error {
+	constructor(
+		readonly code: number,
+		message: string,
+		readonly data?: unknown,
+	) {
+		super(`RPC error: ${message}`);
+		this.name = 'PythonRPCError';
+	}
+}
+
 /**
  * Creates a Python process using uv to run a Python script
+ * When PYTHON_WORKER_ENABLED=true the script runs in a persistent worker instead (see pythonWorkerPool.ts)
  * @param scriptPath Optional path to the script (defaults to pivot table script)
  * @returns ChildProcess instance
  */
 export function createPythonProcess(scriptPath?: string): ChildProcess {
 	const script = scriptPath ?? (process.env.NODE_ENV === 'production' ? PYTHON_SCRIPT_PATH_DOCKER : PYTHON_SCRIPT_PATH);
 
+	if (isPythonWorkerEnabled()) {
+		return createWorkerBackedProcess(script);
+	}
+
 	const pythonProcess = spawn('uv', ['run', '--script', script], {
 		stdio: ['pipe', 'pipe', 'pipe'],
 	});
@@ -38,9 +61,13 @@ export function createPythonProcess(scriptPath?: string): ChildProcess {
  * Sends an RPC request to Python process stdin (first line)
  * @param pythonProcess Python child process
  * @param method RPC method name
- * @param params RPC parameters (must contain config: PivotEnrichedConfig)
+ * @param params RPC parameters (config: PivotEnrichedConfig with optional dataFormat/dataPath and preflight thresholds, or the pivot.expand params)
  */
-export async function sendRPCRequest(pythonProcess: ChildProcess, method: string, params: { config: PivotEnrichedConfig }): Promise<void> {
+export async function sendRPCRequest(
+	pythonProcess: ChildProcess,
+	method: string,
+	params: (PythonDataParams & { config: PivotEnrichedConfig; preflight?: PivotPreflightPolicy }) | PivotExpandRPCParams,
+): Promise<void> {
 	return new Promise((resolve, reject) => {
 		if (pythonProcess.stdin == null) {
 			reject(new Error('Python process stdin is not available'));
@@ -49,6 +76,7 @@ export async function sendRPCRequest(pythonProcess: ChildProcess, method: string
 
 		const request: RPCRequest = {
 			jsonrpc: '2.0',
+			id: randomUUID(),
 			method,
 			params,
 		};
@@ -113,6 +141,83 @@ export function parseRPCResponse(firstLine: string): RPCResponse {
 	}
 }
 
+/**
+ * Records the per-stage metrics of a Python script (sent in its RPC response header) on the tracing span
+ * @param metrics Metrics from the RPC response header, absent on errors
+ * @param tracingSpan Optional span receiving one attribute per stage
+ */
+export function recordPythonMetrics(metrics: PythonStageMetrics | undefined, tracingSpan?: Span): void {
+	if (metrics == null) {
+		return;
+	}
+
+	tracingSpan?.setAttribute('python.totalMs', metrics.totalMs);
+	tracingSpan?.setAttribute('python.peakRssMb', metrics.peakRssMb);
+	for (const stage of metrics.stages) {
+		tracingSpan?.setAttribute(`python.stage.${stage.name}.ms`, stage.ms);
+	}
+	tracingSpan?.addEvent('Python stage metrics', { stages: JSON.stringify(metrics.stages) });
+	logger.debug({ pythonMetrics: metrics }, 'Python stage metrics');
+}
+
+/**
+ * Records how long the payload took to arrive after the RPC response header (Python write + pipe transfer),
+ * the part of the Python time that its own metrics cannot include
+ * @param headerReceivedAt Timestamp (ms) at which the RPC response header was parsed
+ * @param tracingSpan Optional span receiving the attribute
+ */
+export function recordPythonPayloadTime(headerReceivedAt: number, tracingSpan?: Span): void {
+	tracingSpan?.setAttribute('python.payloadMs', Date.now() - headerReceivedAt);
+}
+
+/**
+ * Reads a Python result written as NDJSON frames (outputFormat 'ndjson') line by line, yielding each frame as it
+ * arrives, so neither the payload nor the whole result is buffered
+ * @param pythonProcess Python child process
+ * @param tracingSpan Optional span receiving the per-stage metrics of the script
+ * @throws On an RPC error header, a missing header or a non-zero exit code
+ */
+export async function* streamFramesFromPython(pythonProcess: ChildProcess, tracingSpan?: Span): AsyncGenerator<Record<string, unknown>> {
+	if (pythonProcess.stdout == null) {
+		throw new Error('Python process stdout is not available');
+	}
+
+	const exited = new Promise<number | null>(resolve => pythonProcess.once('exit', (code: number | null) => resolve(code)));
+	const lines = createInterface({ input: pythonProcess.stdout, crlfDelay: Infinity });
+	let rpcResponseRead = false;
+	let headerReceivedAt = 0;
+
+	for await (const line of lines) {
+		if (!line.trim()) {
+			continue;
+		}
+
+		// First non-empty line is the RPC response, every other one a result frame
+		if (!rpcResponseRead) {
+			const rpcResponse = parseRPCResponse(line);
+			if (rpcResponse.error != null) {
+				throw new PythonRPCError(rpcResponse.error.code, rpcResponse.error.message, rpcResponse.error.data);
+			}
+			rpcResponseRead = true;
+			headerReceivedAt = Date.now();
+			recordPythonMetrics(rpcResponse.metrics, tracingSpan);
+			continue;
+		}
+
+		yield JSON.parse(line) as Record<string, unknown>;
+	}
+
+	if (!rpcResponseRead) {
+		throw new Error('RPC response not received from Python process');
+	}
+
+	const code = pythonProcess.exitCode ?? (await exited);
+	if (code !== 0 && code != null) {
+		throw new Error(`Python process exited with code ${code}`);
+	}
+	recordPythonPayloadTime(headerReceivedAt, tracingSpan);
+}
+
 /**
  * Result type from Python pivot processing
  */
@@ -120,14 +225,17 @@ export interface PivotPythonResult {
 	data: unknown[];
 	grandTotals: Record<string, unknown>;
 	columnHeaders?: unknown[]; // Hierarchical column headers
+	cellLayout?: Record<string, unknown>; // Column and measure ordinals of compact cells
+	preflight?: Record<string, unknown>; // Estimate of a pivot whose levels the pre-flight limited
 }
 
 /**
  * Collects hierarchical result data from Python stdout (after RPC response)
  * @param pythonProcess Python child process
+ * @param tracingSpan Optional span receiving the per-stage metrics of the script
  * @returns Promise resolving to hierarchical result object with data, grandTotals, and columnHeaders
  */
-export async function collectResultFromPython(pythonProcess: ChildProcess): Promise<PivotPythonResult> {
+export async function collectResultFromPython(pythonProcess: ChildProcess, tracingSpan?: Span): Promise<PivotPythonResult> {
 	return new Promise((resolve, reject) => {
 		if (pythonProcess.stdout == null) {
 			reject(new Error('Python process stdout is not available'));
@@ -136,10 +244,12 @@ export async function collectResultFromPython(pythonProcess: ChildProcess): Prom
 
 		let buffer = '';
 		let rpcResponseRead = false;
+		let headerReceivedAt = 0;
 		let resultData: PivotPythonResult | null = null;
 
-		pythonProcess.stdout.on('data', (data: Buffer) => {
-			buffer += data.toString();
+		pythonProcess.stdout.setEncoding(PYTHON_STDOUT_ENCODING);
+		pythonProcess.stdout.on('data', (data: string) => {
+			buffer += data;
 
 			// Split by newlines
 			const lines = buffer.split(NEWLINE_SEPARATOR);
@@ -156,10 +266,12 @@ export async function collectResultFromPython(pythonProcess: ChildProcess): Prom
 					try {
 						const rpcResponse = parseRPCResponse(line);
 						if (rpcResponse.error != null) {
-							reject(new Error(`RPC error: ${rpcResponse.error.message}`));
+							reject(new PythonRPCError(rpcResponse.error.code, rpcResponse.error.message, rpcResponse.error.data));
 							return;
 						}
 						rpcResponseRead = true;
+						headerReceivedAt = Date.now();
+						recordPythonMetrics(rpcResponse.metrics, tracingSpan);
 						continue;
 					} catch (error) {
 						reject(error);
@@ -198,6 +310,7 @@ export async function collectResultFromPython(pythonProcess: ChildProcess): Prom
 				return;
 			}
 
+			recordPythonPayloadTime(headerReceivedAt, tracingSpan);
 			resolve(resultData);
 		});
 
@@ -221,12 +334,17 @@ export async function collectResultFromPython(pythonProcess: ChildProcess): Prom
 
 /**
  * Creates a Python process for graph generation
+ * When PYTHON_WORKER_ENABLED=true the script runs in a persistent worker instead (see pythonWorkerPool.ts)
  * @param scriptPath Optional path to the graph script (defaults to detected path)
  * @returns ChildProcess instance
  */
 export function createGraphPythonProcess(scriptPath?: string): ChildProcess {
 	const script = scriptPath ?? (process.env.NODE_ENV === 'production' ? PYTHON_GRAPH_SCRIPT_PATH_DOCKER : PYTHON_GRAPH_SCRIPT_PATH);
 
+	if (isPythonWorkerEnabled()) {
+		return createWorkerBackedProcess(script);
+	}
+
 	const pythonProcess = spawn('uv', ['run', '--script', script], {
 		stdio: ['pipe', 'pipe', 'pipe'],
 	});
@@ -246,9 +364,9 @@ export function createGraphPythonProcess(scriptPath?: string): ChildProcess {
  * Sends an RPC request to Python process for graph generation
  * @param pythonProcess Python child process
  * @param method RPC method name
- * @param params RPC parameters (must contain config: GraphConfig, optional lang)
+ * @param params RPC parameters (must contain config: GraphConfig, optional lang, dataFormat/dataPath)
  */
-export async function sendGraphRPCRequest(pythonProcess: ChildProcess, method: string, params: { config: unknown; lang?: string }): Promise<void> {
+export async function sendGraphRPCRequest(pythonProcess: ChildProcess, method: string, params: PythonDataParams & { config: unknown; lang?: string }): Promise<void> {
 	return new Promise((resolve, reject) => {
 		if (pythonProcess.stdin == null) {
 			reject(new Error('Python process stdin is not available'));
@@ -257,6 +375,7 @@ export async function sendGraphRPCRequest(pythonProcess: ChildProcess, method: s
 
 		const request = {
 			jsonrpc: '2.0',
+			id: randomUUID(),
 			method,
 			params,
 		};
@@ -277,9 +396,10 @@ export async function sendGraphRPCRequest(pythonProcess: ChildProcess, method: s
  * Collects SVG content from Python stdout (after RPC response)
  * SVG can span multiple lines, so we read everything after the RPC response
  * @param pythonProcess Python child process
+ * @param tracingSpan Optional span receiving the per-stage metrics of the script
  * @returns Promise resolving to SVG string
  */
-export async function collectSVGFromPython(pythonProcess: ChildProcess): Promise<string> {
+export async function collectSVGFromPython(pythonProcess: ChildProcess, tracingSpan?: Span): Promise<string> {
 	return new Promise((resolve, reject) => {
 		if (pythonProcess.stdout == null) {
 			reject(new Error('Python process stdout is not available'));
@@ -288,10 +408,12 @@ export async function collectSVGFromPython(pythonProcess: ChildProcess): Promise
 
 		let buffer = '';
 		let rpcResponseRead = false;
+		let headerReceivedAt = 0;
 		let svgStartIndex = -1;
 
-		pythonProcess.stdout.on('data', (data: Buffer) => {
-			buffer += data.toString();
+		pythonProcess.stdout.setEncoding(PYTHON_STDOUT_ENCODING);
+		pythonProcess.stdout.on('data', (data: string) => {
+			buffer += data;
 
 			// If we haven't read the RPC response yet, try to find it
 			if (!rpcResponseRead) {
@@ -305,6 +427,8 @@ export async function collectSVGFromPython(pythonProcess: ChildProcess): Promise
 							return;
 						}
 						rpcResponseRead = true;
+						headerReceivedAt = Date.now();
+						recordPythonMetrics(rpcResponse.metrics, tracingSpan);
 						// SVG starts after the first newline
 						svgStartIndex = firstNewlineIndex + NEWLINE_SEPARATOR.length;
 					} catch (error) {
@@ -328,6 +452,7 @@ export async function collectSVGFromPython(pythonProcess: ChildProcess): Promise
 				return;
 			}
 
+			recordPythonPayloadTime(headerReceivedAt, tracingSpan);
 			resolve(svgContent);
 		});
 
@@ -0,0 +1,349 @@
+import { spawn, ChildProcess } from 'child_process';
+import { EventEmitter } from 'node:events';
+import { PassThrough } from 'node:stream';
+import path from 'node:path';
+import { logger } from '@imports/utils/logger';
+import ShutdownManager from '@imports/lib/ShutdownManager';
+import { NEWLINE_SEPARATOR } from './streamConstants';
+
+/**
+ * Persistent Python worker pool (analytics_worker.py).
+ *
+ * Each worker imports polars/pandas/matplotlib once and serves many framed requests, so a widget
+ * load no longer pays interpreter and import startup. Requests are routed through a ChildProcess-like
+ * adapter, which keeps sendRPCRequest / collectResultFromPython / collectSVGFromPython unchanged.
+ *
+ * A response is a run of output frames (header without exitCode) closed by an end frame (header with exitCode).
+ * Output frames are written to the adapter stdout as they arrive, so a streamed result (pivot outputFormat 'ndjson')
+ * is parsed while the script still runs and is never buffered whole.
+ *
+ * Enabled with PYTHON_WORKER_ENABLED=true. PYTHON_WORKER_MODE=fork runs the worker as a zygote that forks
+ * one pre-imported child per request, keeping process-per-request isolation.
+ *
+ * A request running longer than PYTHON_WORKER_REQUEST_TIMEOUT_MS, or one whose process handle is killed, kills its
+ * worker (with its forked children: workers lead their own process group) so a hung script can't hold it; the next
+ * dispatch spawns a replacement. A killed handle whose request is still queued just leaves the queue.
+ * ADR-0010: no-magic-numbers, prefer-const, functional style
+ */
+
+const PYTHON_WORKER_SCRIPT_PATH = path.join(process.cwd(), 'src', 'scripts', 'python', 'analytics_worker.py');
+const PYTHON_WORKER_SCRIPT_PATH_DOCKER = path.join('/app', 'scripts', 'python', 'analytics_worker.py');
+
+const WORKER_POOL_SIZE_DEFAULT = 2;
+const WORKER_MAX_REQUESTS_DEFAULT = 500;
+// Matches the longest analytics route timeout (pivot)
+const WORKER_REQUEST_TIMEOUT_MS_DEFAULT = 600000;
+const DECIMAL_RADIX = 10;
+const WORKER_FORK_MODE = 'fork';
+const WORKER_FORK_FLAG = '--fork';
+const EMPTY_BUFFER = Buffer.alloc(0);
+
+interface FrameHeader {
+	id: number | null;
+	// Only on the end frame of a response
+	exitCode?: number;
+	length: number;
+}
+
+interface WorkerResponse {
+	exitCode: number;
+	output: Buffer;
+}
+
+interface WorkerRequest {
+	id: number;
+	script: string;
+	payload: Buffer;
+	onOutput: (chunk: Buffer) => void;
+	resolve: (response: WorkerResponse) => void;
+	reject: (error: Error) => void;
+}
+
+interface PythonWorker {
+	process: ChildProcess;
+	chunks: Buffer[];
+	received: number;
+	header: FrameHeader | null;
+	current: WorkerRequest | null;
+	handled: number;
+	timer: NodeJS.Timeout | null;
+	killed: boolean;
+}
+
+interface WorkerRun {
+	response: Promise<WorkerResponse>;
+	cancel: () => void;
+}
+
+export const isPythonWorkerEnabled = (): boolean => process.env.PYTHON_WORKER_ENABLED === 'true';
+
+class PythonWorkerPool {
+	private readonly workers: PythonWorker[] = [];
+	private readonly queue: WorkerRequest[] = [];
+	private nextRequestId = 1;
+	private readonly poolSize = parseInt(process.env.PYTHON_WORKER_POOL_SIZE ?? String(WORKER_POOL_SIZE_DEFAULT), DECIMAL_RADIX);
+	private readonly maxRequests = parseInt(process.env.PYTHON_WORKER_MAX_REQUESTS ?? String(WORKER_MAX_REQUESTS_DEFAULT), DECIMAL_RADIX);
+	private readonly requestTimeoutMs = parseInt(process.env.PYTHON_WORKER_REQUEST_TIMEOUT_MS ?? String(WORKER_REQUEST_TIMEOUT_MS_DEFAULT), DECIMAL_RADIX);
+
+	run(script: string, payload: Buffer, onOutput: (chunk: Buffer) => void): WorkerRun {
+		const requestHolder: { request: WorkerRequest | null } = { request: null };
+		const response = new Promise<WorkerResponse>((resolve, reject) => {
+			requestHolder.request = { id: this.nextRequestId++, script, payload, onOutput, resolve, reject };
+			this.queue.push(requestHolder.request);
+			this.dispatch();
+		});
+		return { response, cancel: () => this.cancel(requestHolder.request as WorkerRequest) };
+	}
+
+	shutdown(): void {
+		this.workers.splice(0).forEach(worker => worker.process.stdin?.end());
+	}
+
+	private cancel(request: WorkerRequest): void {
+		const error = new Error(`Python worker request ${request.id} cancelled`);
+		const queued = this.queue.indexOf(request);
+		if (queued !== -1) {
+			this.queue.splice(queued, 1);
+			request.reject(error);
+			return;
+		}
+
+		const worker = this.workers.find(candidate => candidate.current === request);
+		if (worker != null) {
+			this.killWorker(worker, error);
+		}
+	}
+
+	private killWorker(worker: PythonWorker, error: Error): void {
+		worker.killed = true;
+		try {
+			// Negative pid: the whole process group (uv, the interpreter and, in fork mode, its request children)
+			process.kill(-(worker.process.pid as number), 'SIGKILL');
+		} catch {
+			worker.process.kill('SIGKILL');
+		}
+		this.removeWorker(worker, error);
+	}
+
+	private dispatch(): void {
+		if (this.queue.length === 0) {
+			return;
+		}
+
+		const worker = this.workers.find(candidate => candidate.current == null) ?? (this.workers.length < this.poolSize ? this.spawnWorker() : null);
+		if (worker == null) {
+			return;
+		}
+
+		const request = this.queue.shift() as WorkerRequest;
+		worker.current = request;
+		worker.timer = setTimeout(() => {
+			logger.warn({ pid: worker.process.pid, script: request.script, timeoutMs: this.requestTimeoutMs }, 'Python worker request timed out, killing worker');
+			this.killWorker(worker, new Error(`Python worker request timed out after ${this.requestTimeoutMs} ms`));
+		}, this.requestTimeoutMs);
+
+		const header = JSON.stringify({ id: request.id, script: request.script, length: request.payload.length }) + NEWLINE_SEPARATOR;
+		worker.process.stdin?.write(header);
+		worker.process.stdin?.write(request.payload);
+
+		this.dispatch();
+	}
+
+	private spawnWorker(): PythonWorker {
+		const script = process.env.NODE_ENV === 'production' ? PYTHON_WORKER_SCRIPT_PATH_DOCKER : PYTHON_WORKER_SCRIPT_PATH;
+		const modeArgs = process.env.PYTHON_WORKER_MODE === WORKER_FORK_MODE ? [WORKER_FORK_FLAG] : [];
+		const workerProcess = spawn('uv', ['run', '--script', script, ...modeArgs], {
+			stdio: ['pipe', 'pipe', 'pipe'],
+			// Own process group, so killWorker reaches every process of the worker
+			detached: true,
+		});
+
+		const worker: PythonWorker = { process: workerProcess, chunks: [], received: 0, header: null, current: null, handled: 0, timer: null, killed: false };
+		this.workers.push(worker);
+
+		workerProcess.stdout?.on('data', (chunk: Buffer) => {
+			if (worker.killed) {
+				return;
+			}
+			worker.chunks.push(chunk);
+			worker.received += chunk.length;
+			this.drainFrames(worker);
+		});
+
+		workerProcess.stderr?.on('data', (data: Buffer) => {
+			logger.warn({ stderr: data.toString() }, 'Python worker stderr');
+		});
+
+		workerProcess.on('error', (error: Error) => {
+			logger.error(error, 'Error spawning Python worker');
+			this.removeWorker(worker, error);
+		});
+
+		workerProcess.on('exit', (code: number | null, signal: string | null) => {
+			this.removeWorker(worker, new Error(`Python worker exited with code ${code ?? 'null'} and signal ${signal ?? 'null'}`));
+		});
+
+		logger.info({ pid: workerProcess.pid }, 'Python worker started');
+		return worker;
+	}
+
+	private drainFrames(worker: PythonWorker): void {
+		if (worker.header == null) {
+			const buffered = Buffer.concat(worker.chunks, worker.received);
+			const headerEnd = buffered.indexOf(NEWLINE_SEPARATOR);
+			if (headerEnd === -1) {
+				return;
+			}
+
+			worker.header = JSON.parse(buffered.subarray(0, headerEnd).toString()) as FrameHeader;
+			const rest = buffered.subarray(headerEnd + NEWLINE_SEPARATOR.length);
+			worker.chunks = [rest];
+			worker.received = rest.length;
+		}
+
+		const { header } = worker;
+		if (worker.received < header.length) {
+			return;
+		}
+
+		const buffered = Buffer.concat(worker.chunks, worker.received);
+		const rest = buffered.subarray(header.length);
+		worker.chunks = rest.length > 0 ? [rest] : [];
+		worker.received = rest.length;
+		worker.header = null;
+
+		const output = buffered.subarray(0, header.length);
+		if (header.exitCode == null) {
+			worker.current?.onOutput(output);
+		} else {
+			this.completeRequest(worker, { exitCode: header.exitCode, output });
+		}
+		this.drainFrames(worker);
+	}
+
+	private completeRequest(worker: PythonWorker, response: WorkerResponse): void {
+		const request = worker.current;
+		clearTimeout(worker.timer ?? undefined);
+		worker.timer = null;
+		worker.current = null;
+		worker.handled += 1;
+		request?.resolve(response);
+
+		if (worker.handled >= this.maxRequests) {
+			// Recycle long-lived workers to bound memory held by the interpreter
+			this.retireWorker(worker);
+		}
+
+		this.dispatch();
+	}
+
+	private retireWorker(worker: PythonWorker): void {
+		const index = this.workers.indexOf(worker);
+		if (index !== -1) {
+			this.workers.splice(index, 1);
+		}
+		worker.process.stdin?.end();
+	}
+
+	private removeWorker(worker: PythonWorker, error: Error): void {
+		const index = this.workers.indexOf(worker);
+		if (index !== -1) {
+			this.workers.splice(index, 1);
+		}
+
+		clearTimeout(worker.timer ?? undefined);
+		worker.timer = null;
+		if (worker.current != null) {
+			worker.current.reject(error);
+			worker.current = null;
+		}
+
+		if (worker.handled === 0 && !worker.killed) {
+			// A worker that dies before serving anything would die again: fail fast instead of respawning
+			this.queue.splice(0).forEach(request => request.reject(error));
+			return;
+		}
+
+		this.dispatch();
+	}
+}
+
+const getPool = (() => {
+	const state: { pool: PythonWorkerPool | null } = { pool: null };
+	return (): PythonWorkerPool => {
+		if (state.pool == null) {
+			const pool = new PythonWorkerPool();
+			ShutdownManager.addHandler(() => pool.shutdown());
+			state.pool = pool;
+		}
+		return state.pool;
+	};
+})();
+
+/**
+ * ChildProcess-compatible adapter backed by the worker pool.
+ * Collects stdin until it ends, runs the script in a worker and writes its output to stdout as the frames arrive.
+ */
+class WorkerBackedProcess extends EventEmitter {
+	readonly stdin = new PassThrough();
+	readonly stdout = new PassThrough();
+	readonly stderr = new PassThrough();
+	killed = false;
+	private cancel: (() => void) | null = null;
+
+	constructor(script: string) {
+		super();
+		const chunks: Buffer[] = [];
+
+		this.stdin.on('data', (chunk: Buffer) => chunks.push(Buffer.from(chunk)));
+		this.stdin.on('end', () => {
+			if (this.killed) {
+				return;
+			}
+			const run = getPool().run(script, chunks.length > 0 ? Buffer.concat(chunks) : EMPTY_BUFFER, (chunk: Buffer) => {
+				if (!this.killed) {
+					this.stdout.write(chunk);
+				}
+			});
+			this.cancel = run.cancel;
+			run.response
+				.then(({ exitCode, output }) => {
+					if (this.killed) {
+						return;
+					}
+					this.stdout.once('end', () => {
+						this.emit('exit', exitCode, null);
+						this.emit('close', exitCode, null);
+					});
+					this.stdout.end(output);
+				})
+				.catch((error: Error) => {
+					if (!this.killed) {
+						this.emit('error', error);
+					}
+				});
+		});
+	}
+
+	/**
+	 * Drops the request like killing a one-shot process would: a queued one leaves the queue, a running one takes its
+	 * worker down with it
+	 */
+	kill(): boolean {
+		if (!this.killed) {
+			this.killed = true;
+			this.cancel?.();
+		}
+		this.stdout.destroy();
+		return true;
+	}
+}
+
+/**
+ * Creates a ChildProcess-like handle that runs the given analytics script in a persistent worker
+ * @param scriptPath Path of the one-shot script (only its file name is sent to the worker)
+ * @returns ChildProcess-compatible instance
+ */
+export function createWorkerBackedProcess(scriptPath: string): ChildProcess {
+	return new WorkerBackedProcess(path.basename(scriptPath)) as unknown as ChildProcess;
+}
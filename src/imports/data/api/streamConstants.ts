@@ -1,5 +1,7 @@
 export const NANOSECONDS_TO_MILLISECONDS = 1_000_000;
 export const NEWLINE_SEPARATOR = '\n';
+// Python stdout is decoded as a stream so multi-byte UTF-8 characters split across chunks stay intact
+export const PYTHON_STDOUT_ENCODING = 'utf8';
 export const MEMORY_MONITOR_INTERVAL_MS = 50;
 export const WARMUP_RECORD_LIMIT = 100;
 export const ITERATION_DELAY_MS = 2000;
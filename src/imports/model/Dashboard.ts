@@ -115,11 +115,19 @@ const ListWidgetConfigSchema = z.object({
 // ADR-0012: no-magic-numbers
 const DEFAULT_TABLE_CACHE_TTL_SECONDS = 300;
 
+// Top-N of a level: keys past the limit collapse into an Others key, ranked by a value field
+const PivotTopOrderSchema = z.object({
+	field: z.string().min(1).optional(),
+	order: z.enum(['ASC', 'DESC']).optional(),
+});
+
 const PivotRowItemSchema = z.object({
 	field: z.string().min(1),
 	order: z.enum(['ASC', 'DESC']).default('ASC'),
 	showSubtotal: z.boolean().optional(),
 	width: z.number().optional(),
+	limit: z.number().int().min(1).optional(),
+	orderBy: PivotTopOrderSchema.optional(),
 });
 
 const PivotColumnItemSchema = z.object({
@@ -127,11 +135,16 @@ const PivotColumnItemSchema = z.object({
 	aggregator: z.enum(['D', 'W', 'M', 'Q', 'Y']).optional(),
 	order: z.enum(['ASC', 'DESC']).default('ASC'),
 	width: z.number().optional(),
+	limit: z.number().int().min(1).optional(),
+	orderBy: PivotTopOrderSchema.optional(),
 });
 
+const MAX_PIVOT_PERCENTILE = 100;
+
 const PivotValueItemSchema = z.object({
 	field: z.string().min(1),
-	aggregator: z.enum(['count', 'sum', 'avg', 'min', 'max']),
+	aggregator: z.enum(['count', 'sum', 'avg', 'min', 'max', 'countDistinct', 'median', 'percentile']),
+	percentile: z.number().min(0).max(MAX_PIVOT_PERCENTILE).optional(),
 	format: z.string().optional(),
 	width: z.number().optional(),
 });
@@ -144,6 +157,10 @@ const PivotOptionsSchema = z
 		showColSubtotals: z.boolean().optional(),
 		enableGrouping: z.boolean().optional(),
 		hideGroupedLeftAxisCols: z.boolean().optional(),
+		timezone: z.string().min(1).optional(),
+		partitions: z.number().int().min(1).optional(),
+		maxDepth: z.number().int().min(1).optional(),
+		cellFormat: z.enum(['keyed', 'dense', 'sparse']).optional(),
 	})
 	.optional();
 
@@ -103,6 +103,8 @@ export interface CrossModulePythonConfig {
 
 export interface CrossModuleRPCRequest {
 	jsonrpc: '2.0';
+	/** Request id, used by the Python script to tag its debug log lines */
+	id?: string;
 	method: 'aggregate';
 	params: {
 		config: CrossModulePythonConfig;
@@ -5,7 +5,11 @@ import type { Span } from '@opentelemetry/api';
  * Pivot table configuration types
  */
 
-export type PivotAggregator = 'count' | 'sum' | 'avg' | 'min' | 'max';
+/**
+ * Value aggregators. avg, min, max, median and percentile only take the numeric values of a group (null
+ * without any); avg used to count missing and non-numeric values as 0, so their averages are no longer pulled toward 0.
+ */
+export type PivotAggregator = 'count' | 'sum' | 'avg' | 'min' | 'max' | 'countDistinct' | 'median' | 'percentile';
 
 /**
  * Date bucketing options for columns
@@ -13,7 +17,31 @@ export type PivotAggregator = 'count' | 'sum' | 'avg' | 'min' | 'max';
  */
 export type DateBucket = 'D' | 'W' | 'M' | 'Q' | 'Y';
 
-export interface PivotColumn {
+/**
+ * Format of the cells and totals of a pivot result
+ * keyed = objects keyed by column key and value field (default)
+ * dense = arrays indexed by column and measure ordinal (see PivotCellLayout), null where a row has no records
+ * sparse = one [column ordinal, ...values] array per column a row has records in
+ */
+export type PivotCellFormat = 'keyed' | 'dense' | 'sparse';
+
+/**
+ * Value field ranking the keys of a limited level (top-N); defaults to the first value field, descending
+ */
+export interface PivotTopOrder {
+	field?: string;
+	/** DESC keeps the largest values, ASC the smallest */
+	order?: 'ASC' | 'DESC';
+}
+
+/** Top-N of a row or column level: keys past the limit (within their parent) collapse into one Others key */
+export interface PivotLevelLimit {
+	/** Keys kept per parent */
+	limit?: number;
+	orderBy?: PivotTopOrder;
+}
+
+export interface PivotColumn extends PivotLevelLimit {
 	field: string;
 	order?: 'ASC' | 'DESC';
 	format?: string;
@@ -21,7 +49,7 @@ export interface PivotColumn {
 	aggregator?: DateBucket;
 }
 
-export interface PivotRow {
+export interface PivotRow extends PivotLevelLimit {
 	field: string;
 	order?: 'ASC' | 'DESC';
 	/** Show subtotals for this row level */
@@ -31,6 +59,8 @@ export interface PivotRow {
 export interface PivotValue {
 	field: string;
 	aggregator: PivotAggregator;
+	/** Rank (0-100) of the 'percentile' aggregator, defaults to 50 */
+	percentile?: number;
 	/** Display format (e.g., 'currency', 'percentage') */
 	format?: string;
 }
@@ -39,6 +69,17 @@ export interface PivotOptions {
 	showRowGrandTotals?: boolean;
 	showColGrandTotals?: boolean;
 	showSubtotals?: boolean;
+	/**
+	 * IANA timezone date bucket columns are computed in (e.g. 'America/Sao_Paulo'); without it dates are bucketed by their
+	 * written wall time, with any offset or 'Z' dropped
+	 */
+	timezone?: string;
+	/** Hash partitions the Python group-by runs in parallel (polars thread pool); defaults to 1 (serial) */
+	partitions?: number;
+	/** Row levels returned; nodes of the last one carry an expansionKey instead of their children (see pivot.expand) */
+	maxDepth?: number;
+	/** Format of cells and totals, defaults to 'keyed' */
+	cellFormat?: PivotCellFormat;
 }
 
 export interface PivotConfig {
@@ -51,12 +92,94 @@ export interface PivotConfig {
 /**
  * RPC Protocol types for Python communication
  */
+
+/**
+ * Payload format written to the Python scripts after the RPC line
+ * ndjson = one JSON document per line (default), arrow = Arrow IPC stream (or Arrow IPC file via dataPath)
+ */
+export type PythonDataFormat = 'ndjson' | 'arrow';
+
+/**
+ * Result format written by pivot_table.py after the RPC header
+ * json = the whole result as one JSON line (default), ndjson = result frames written as they are encoded (PivotResultFrame)
+ */
+export type PythonOutputFormat = 'json' | 'ndjson';
+
+export interface PythonDataParams {
+	/** Payload format, defaults to 'ndjson' */
+	dataFormat?: PythonDataFormat;
+	/** Path of an Arrow IPC file read (memory-mapped) instead of stdin when dataFormat is 'arrow' */
+	dataPath?: string;
+	/** Result format, defaults to 'json' */
+	outputFormat?: PythonOutputFormat;
+}
+
+/**
+ * Thresholds of the size pre-flight pivot_table.py runs before grouping (pivot_preflight.py), from the
+ * PIVOT_PREFLIGHT_* environment variables; without them no pre-flight runs
+ */
+export interface PivotPreflightPolicy {
+	/** Projected cells (cells of every shown row node, plus grand total cells) a pivot may reach */
+	maxCells?: number;
+	/** Projected Python memory a pivot may reach */
+	maxMemoryMb?: number;
+	/** Over a threshold: fail with the estimate (default), or limit the widest levels to their top keys with an Others key */
+	onExceed?: 'error' | 'topN';
+	/** Keys kept per parent by levels limited by onExceed 'topN', defaults to 50 */
+	topN?: number;
+}
+
+/** Estimate of the pre-flight: the error data of a pivot over its thresholds, or the preflight of a result it limited */
+export interface PivotPreflightReport {
+	records: number;
+	/** Projected nodes of every row level */
+	rows: number[];
+	/** Projected header nodes of every column level */
+	columns: number[];
+	/** Projected row x column groups */
+	leaves: number;
+	cells: number;
+	memoryMb: number;
+	maxCells: number | null;
+	maxMemoryMb: number | null;
+	/** Levels onExceed 'topN' limited to their top keys */
+	limited: { axis: 'rows' | 'columns'; field: string; limit: number }[];
+}
+
+/** Params of the pivot.expand method: children of a node of a depth-limited pivot, from its cached state */
+export interface PivotExpandRPCParams {
+	expansionKey: string;
+	maxDepth?: number;
+	cellFormat?: PivotCellFormat;
+	/** Owner the cached state was saved for (the user id passed with the pivot request) */
+	owner?: string;
+}
+
 export interface RPCRequest {
 	jsonrpc: '2.0';
+	/** Request id, used by the Python scripts to tag their debug log lines */
+	id?: string;
 	method: string;
-	params: {
-		config: PivotEnrichedConfig;
-	};
+	params: (PythonDataParams & { config: PivotEnrichedConfig; preflight?: PivotPreflightPolicy }) | PivotExpandRPCParams;
+}
+
+export interface PythonStageMetric {
+	/** read, decode, flatten, dataframe, preflight, aggregate, join, render or serialize */
+	name: string;
+	ms: number;
+	rows?: number;
+	bytes?: number;
+	rssMb: number;
+	peakRssMb: number;
+}
+
+/** Per-stage timing and memory reported by the Python scripts in the RPC header (stage_metrics.py) */
+export interface PythonStageMetrics {
+	/** Time from script start until the header was sent; writing the payload comes after it */
+	totalMs: number;
+	rssMb: number;
+	peakRssMb: number;
+	stages: PythonStageMetric[];
 }
 
 export interface RPCResponse {
@@ -68,7 +191,10 @@ export interface RPCResponse {
 	error?: {
 		code: number;
 		message: string;
+		/** Structured error data (the PivotPreflightReport of a pivot over its pre-flight thresholds) */
+		data?: unknown;
 	};
+	metrics?: PythonStageMetrics;
 }
 
 /**
@@ -79,6 +205,22 @@ export interface PivotStreamParams extends BuildFindQueryParams {
 	transformDatesToString?: boolean;
 	tracingSpan?: Span;
 	lang?: string;
+	/** User id the cached aggregation state of a depth-limited pivot (options.maxDepth) belongs to */
+	ownerId?: string;
+}
+
+export interface PivotExpandParams {
+	expansionKey: string;
+	maxDepth?: number;
+	cellFormat?: PivotCellFormat;
+	/** User id the expanded pivot was computed for */
+	ownerId?: string;
+	tracingSpan?: Span;
+}
+
+export interface PivotExpandResult {
+	success: true;
+	data: PivotHierarchyNode[];
 }
 
 export interface PivotStreamResult {
@@ -109,7 +251,7 @@ export interface PicklistOption {
 /**
  * Metadata for pivot row
  */
-export interface PivotRowMeta {
+export interface PivotRowMeta extends PivotLevelLimit {
 	field: string;
 	label: string;
 	type: string;
@@ -120,7 +262,7 @@ export interface PivotRowMeta {
 /**
  * Metadata for pivot column
  */
-export interface PivotColumnMeta {
+export interface PivotColumnMeta extends PivotLevelLimit {
 	field: string;
 	label: string;
 	type: string;
@@ -136,6 +278,7 @@ export interface PivotColumnMeta {
 export interface PivotValueMeta {
 	field: string;
 	aggregator: PivotAggregator;
+	percentile?: number;
 	label: string;
 	type: string;
 	format?: string; // Ex: "currency"
@@ -151,24 +294,43 @@ export interface PivotEnrichedConfig {
 	options?: PivotOptions;
 }
 
+/**
+ * Cells of a row: column key -> value field -> aggregated value (keyed), the value of column ordinal c and
+ * measure ordinal m at c * measures.length + m (dense) or [column ordinal, ...values] per column (sparse)
+ */
+export type PivotCells = Record<string, Record<string, number | null>> | (number | null)[] | [number, ...(number | null)[]][];
+
+/** Totals of a row: value field -> value (keyed) or one value per measure ordinal (dense and sparse) */
+export type PivotTotals = Record<string, number | null> | (number | null)[];
+
+/** Header of the dense and sparse cell formats, listing column keys and value fields once */
+export interface PivotCellLayout {
+	format: Exclude<PivotCellFormat, 'keyed'>;
+	/** Column key of every column ordinal */
+	columns: string[];
+	/** Value field of every measure ordinal */
+	measures: string[];
+}
+
 /**
  * Pivot hierarchy node with nested children
  */
 export interface PivotHierarchyNode {
-	key: string; // Unique key for the row (e.g., _id or composite key)
+	key: string; // Unique key for the row (e.g., _id or composite key); '__others__' for the Others row of a limited level
 	label: string; // Formatted label for display
 	level: number; // Hierarchy level (0 = root)
-	cells: Record<string, Record<string, number>>; // Column key -> value field -> aggregated value
-	totals: Record<string, number>; // Value field -> total for this row
+	cells: PivotCells; // Column key -> value field -> aggregated value (see PivotCells for compact formats)
+	totals: PivotTotals; // Value field -> total for this row (null for avg/min/max/median/percentile without numeric values)
 	children?: PivotHierarchyNode[]; // Nested rows
+	expansionKey?: string; // Opaque key fetching the children of a node cut by options.maxDepth (pivot.expand)
 }
 
 /**
  * Grand totals for all data
  */
 export interface PivotGrandTotals {
-	cells: Record<string, Record<string, number>>; // Column key -> value field -> aggregated value
-	totals: Record<string, number>; // Value field -> grand total
+	cells: PivotCells; // Column key -> value field -> aggregated value (see PivotCells for compact formats)
+	totals: PivotTotals; // Value field -> grand total
 }
 
 /**
@@ -198,6 +360,33 @@ export interface PivotEnrichedResult {
 	grandTotals: PivotGrandTotals;
 	/** Hierarchical column headers - each level represents a column dimension */
 	columnHeaders?: PivotColumnHeaderNode[];
+	/** Column and measure ordinals of the cells, with options.cellFormat 'dense' or 'sparse' */
+	cellLayout?: PivotCellLayout;
+	/** Set when the pre-flight limited levels to their top keys (PIVOT_PREFLIGHT_ON_EXCEED=topN) */
+	preflight?: PivotPreflightReport;
 	total?: number;
+	limitInfo?: PivotLimitInfo;
+}
+
+/** Set when the query matched more records than PIVOT_MAX_RECORDS and only the first ones were aggregated */
+export interface PivotLimitInfo {
+	limited: true;
+	limit: number;
+	total: number;
+}
+
+/**
+ * Frame of a streamed pivot result, in this order: metadata (added by Node), header, one row per node in
+ * depth-first order (without children; its level places it under the last row of the level above), grandTotals
+ */
+export type PivotResultFrame =
+	| { type: 'metadata'; metadata: PivotEnrichedResult['metadata']; total?: number; limitInfo?: PivotLimitInfo }
+	| { type: 'header'; columnHeaders?: PivotColumnHeaderNode[]; cellLayout?: PivotCellLayout; preflight?: PivotPreflightReport }
+	| { type: 'row'; node: PivotHierarchyNode }
+	| { type: 'grandTotals'; grandTotals: PivotGrandTotals };
+
+export interface PivotFramesResult {
+	success: true;
+	frames: AsyncGenerator<PivotResultFrame>;
 }
 
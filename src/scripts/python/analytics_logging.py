@@ -0,0 +1,99 @@
+# analytics_logging.py
+# Per-request debug logging shared by the analytics scripts.
+#
+# ANALYTICS_DEBUG_LOG selects the target:
+#   unset / off: disabled, every debug_log(...) call returns immediately (default)
+#   stderr:      buffered lines written to stderr, prefixed with script and request id
+#   file:        buffered lines written to one file per request in ANALYTICS_DEBUG_LOG_DIR
+# Lines are buffered in memory and written in blocks, and once more when the request ends
+# (process exit for one-shot scripts, end of each request inside analytics_worker.py).
+# Build expensive messages only under `if debug_log.enabled:`.
+# ADR-0010: no-magic-numbers, functional style.
+
+import atexit
+import os
+import re
+import sys
+import tempfile
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List
+
+LOG_ENV = 'ANALYTICS_DEBUG_LOG'
+LOG_DIR_ENV = 'ANALYTICS_DEBUG_LOG_DIR'
+LOG_TARGET_STDERR = 'stderr'
+LOG_TARGET_FILE = 'file'
+LOG_TARGETS = (LOG_TARGET_STDERR, LOG_TARGET_FILE)
+DEFAULT_LOG_DIR = os.path.join(tempfile.gettempdir(), 'konecty-analytics-logs')
+LOG_BUFFER_MAX_LINES = 1000
+REQUEST_ID_LENGTH = 12
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+TIMESTAMP_TRIM = -3
+UNSAFE_FILENAME_CHARS = re.compile(r'[^A-Za-z0-9_-]')
+
+
+class DebugLog:
+    """Debug logger bound to one script run. Calling it is a no-op when logging is disabled."""
+
+    __slots__ = ('enabled', 'target', 'prefix', 'path', 'lines')
+
+    def __init__(self, target: str, script: str, request_id: str, log_dir: str):
+        self.enabled = target in LOG_TARGETS
+        self.target = target
+        self.prefix = f'[{script}] [{request_id}]'
+        self.path = os.path.join(log_dir, f'{script}-{request_id}.log')
+        self.lines: List[str] = []
+
+    def __call__(self, message: str) -> None:
+        if not self.enabled:
+            return
+        timestamp = datetime.now().strftime(TIMESTAMP_FORMAT)[:TIMESTAMP_TRIM]
+        self.lines.append(f'[{timestamp}] {self.prefix} {message}\n')
+        if len(self.lines) >= LOG_BUFFER_MAX_LINES:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.lines:
+            return
+        text = ''.join(self.lines)
+        self.lines.clear()
+        try:
+            if self.target == LOG_TARGET_STDERR:
+                sys.stderr.write(text)
+                sys.stderr.flush()
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(text)
+        except OSError:
+            pass
+
+
+# Loggers with pending lines, drained by flush_debug_logs() when a request ends
+OPEN_LOGS: List[DebugLog] = []
+
+
+def request_id_of(request: Dict[str, Any]) -> str:
+    """JSON-RPC id of the request, or a random short id when the caller sent none."""
+    request_id = UNSAFE_FILENAME_CHARS.sub('', str(request.get('id') or ''))
+    return request_id or uuid.uuid4().hex[:REQUEST_ID_LENGTH]
+
+
+def open_debug_log(script: str, request: Dict[str, Any]) -> DebugLog:
+    """Create the debug logger for one request, configured from the environment."""
+    target = os.environ.get(LOG_ENV, '').lower()
+    log = DebugLog(target, script, request_id_of(request), os.environ.get(LOG_DIR_ENV, DEFAULT_LOG_DIR))
+    if log.enabled:
+        OPEN_LOGS.append(log)
+    return log
+
+
+def flush_debug_logs() -> None:
+    """Write the pending lines of every logger opened since the last call."""
+    pending = OPEN_LOGS[:]
+    OPEN_LOGS.clear()
+    for log in pending:
+        log.flush()
+
+
+atexit.register(flush_debug_logs)
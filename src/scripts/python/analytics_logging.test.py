@@ -0,0 +1,67 @@
+# /// script
+# dependencies = [
+#   "pytest",
+# ]
+# ///
+
+"""
+Tests for analytics_logging.py
+Run with: uv run --script pytest analytics_logging.test.py
+"""
+
+import json
+import os
+import subprocess
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).parent
+SUBPROCESS_TIMEOUT = 60
+KPI_REQUEST = {'jsonrpc': '2.0', 'id': 'req-42', 'method': 'aggregate', 'params': {'config': {'operation': 'sum', 'field': 'amount'}}}
+SAMPLE_DATA = [{'amount': 10}, {'amount': 20}]
+
+
+def run_kpi(env_overrides: dict, request: dict = KPI_REQUEST) -> subprocess.CompletedProcess:
+    """Helper: runs kpi_aggregator.py with the given logging environment."""
+    env = {k: v for k, v in os.environ.items() if not k.startswith('ANALYTICS_DEBUG_LOG')}
+    stdin_input = '\n'.join([json.dumps(request), *(json.dumps(row) for row in SAMPLE_DATA)]) + '\n'
+    return subprocess.run(
+        ['uv', 'run', '--script', str(SCRIPTS_DIR / 'kpi_aggregator.py')],
+        input=stdin_input,
+        capture_output=True,
+        text=True,
+        timeout=SUBPROCESS_TIMEOUT,
+        env={**env, **env_overrides},
+    )
+
+
+def test_disabled_by_default(tmp_path):
+    result = run_kpi({'ANALYTICS_DEBUG_LOG_DIR': str(tmp_path)})
+
+    assert json.loads(result.stdout.splitlines()[1])['result'] == 30.0
+    assert '[kpi_aggregator]' not in result.stderr
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_stderr_target_prefixes_request_id():
+    result = run_kpi({'ANALYTICS_DEBUG_LOG': 'stderr'})
+
+    lines = [line for line in result.stderr.splitlines() if '[kpi_aggregator]' in line]
+    assert lines
+    assert all('[req-42]' in line for line in lines)
+    assert any('Aggregation result' in line for line in lines)
+
+
+def test_file_target_writes_one_file_per_request(tmp_path):
+    env = {'ANALYTICS_DEBUG_LOG': 'file', 'ANALYTICS_DEBUG_LOG_DIR': str(tmp_path)}
+    run_kpi(env)
+    run_kpi(env, {**KPI_REQUEST, 'id': 'req-43'})
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['kpi_aggregator-req-42.log', 'kpi_aggregator-req-43.log']
+    assert 'Aggregation result' in (tmp_path / 'kpi_aggregator-req-42.log').read_text()
+
+
+def test_generates_request_id_when_missing(tmp_path):
+    request = {k: v for k, v in KPI_REQUEST.items() if k != 'id'}
+    run_kpi({'ANALYTICS_DEBUG_LOG': 'file', 'ANALYTICS_DEBUG_LOG_DIR': str(tmp_path)}, request)
+
+    assert len(list(tmp_path.glob('kpi_aggregator-*.log'))) == 1
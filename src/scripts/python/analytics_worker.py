@@ -0,0 +1,205 @@
+# /// script
+# dependencies = [
+#   "polars",
+#   "orjson",
+#   "pandas",
+#   "matplotlib",
+#   "pyarrow",
+# ]
+# ///
+
+# analytics_worker.py
+# Long-lived host for the analytics scripts (pivot, graph, KPI and cross-module aggregate).
+# Imports polars/pandas/matplotlib once and serves many requests per process.
+#
+# Protocol (stdin/stdout, binary framed):
+#   Request frame:  {"id": <any>, "script": "pivot_table.py", "length": <payload bytes>}\n<payload>
+#   Output frames:  {"id": <any>, "length": <output bytes>}\n<output>, zero or more
+#   End frame:      {"id": <any>, "exitCode": <int>, "length": <output bytes>}\n<output>
+#
+# The payload is exactly what the one-shot script reads from stdin (RPC request line + NDJSON)
+# and the output frames, then the end frame, carry exactly what it writes to stdout, so the Node
+# parsers stay unchanged. Output is forwarded as the script flushes it (or every OUTPUT_CHUNK_BYTES),
+# so streamed results (pivot outputFormat 'ndjson') reach Node while the script still runs and the
+# worker never holds a whole result.
+# Each request runs the script in a fresh module namespace (runpy), so globals such as
+# `df_polars` never leak between requests. EOF on stdin shuts the worker down.
+#
+# With `--fork` the worker acts as a zygote: the parent only imports the libraries and forks
+# one child per request, keeping process-per-request isolation with copy-on-write memory.
+# The parent must never run polars queries itself, since forking after the polars thread
+# pool has started can deadlock the child.
+# ADR-0010: no-magic-numbers, functional style, structured logging.
+
+import gc
+import io
+import json
+import os
+import runpy
+import sys
+from typing import Any, BinaryIO, Dict, Tuple
+
+import polars as pl  # noqa: F401 - imported once so hosted scripts reuse the loaded module
+import pandas as pd  # noqa: F401
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+from analytics_logging import flush_debug_logs
+
+RPC_VERSION = '2.0'
+RPC_ERROR_METHOD_NOT_FOUND = -32601
+RPC_ERROR_INVALID_REQUEST = -32600
+RPC_ERROR_INTERNAL = -32603
+EXIT_OK = 0
+EXIT_ERROR = 1
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+HOSTED_SCRIPTS = ('pivot_table.py', 'graph_generator.py', 'kpi_aggregator.py', 'cross_module_join.py')
+FRAME_ENCODING = 'utf-8'
+FORK_FLAG = '--fork'
+OUTPUT_CHUNK_BYTES = 64 * 1024
+
+
+def rpc_error_output(code: int, message: str) -> bytes:
+    """Build the stdout a one-shot script would have produced for an RPC error."""
+    response = json.dumps({
+        'jsonrpc': RPC_VERSION,
+        'error': {'code': code, 'message': message},
+    })
+    return f'{response}\n'.encode(FRAME_ENCODING)
+
+
+class FrameWriter(io.RawIOBase):
+    """Raw stdout of a hosted script: every write goes to the worker output channel as an output frame."""
+
+    def __init__(self, channel: Any, request_id: Any) -> None:
+        super().__init__()
+        self.channel, self.request_id = channel, request_id
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: Any) -> int:
+        if data:
+            write_frame(self.channel, {'id': self.request_id}, bytes(data))
+        return len(data)
+
+
+def exit_code_from(exit_request: SystemExit) -> int:
+    """Translate SystemExit.code the same way the interpreter does for the process exit status."""
+    if exit_request.code is None:
+        return EXIT_OK
+    if isinstance(exit_request.code, int):
+        return exit_request.code
+    return EXIT_ERROR
+
+
+def reset_request_state() -> None:
+    """Drop state that hosted scripts leave behind in shared modules."""
+    plt.close('all')
+    gc.collect()
+
+
+def run_hosted_script(script: str, payload: bytes, output: BinaryIO, reset_state: bool = True) -> Tuple[int, bytes]:
+    """Run one hosted script against an in-memory stdin with its stdout written to output (flushed when it
+    returns). Returns the exit code and the output of an error that happened outside the script."""
+    if script not in HOSTED_SCRIPTS:
+        return EXIT_ERROR, rpc_error_output(RPC_ERROR_METHOD_NOT_FOUND, f'Script not hosted by worker: {script}')
+
+    request_stdin = io.TextIOWrapper(io.BytesIO(payload), encoding=FRAME_ENCODING)
+    request_stdout = io.TextIOWrapper(output, encoding=FRAME_ENCODING, write_through=True)
+    saved_stdin, saved_stdout = sys.stdin, sys.stdout
+    sys.stdin, sys.stdout = request_stdin, request_stdout
+
+    try:
+        runpy.run_path(os.path.join(SCRIPTS_DIR, script), run_name='__main__')
+        exit_code = EXIT_OK
+    except SystemExit as exit_request:
+        exit_code = exit_code_from(exit_request)
+    except Exception as e:
+        print(f'[analytics_worker] {script} failed: {e}', file=sys.stderr, flush=True)
+        request_stdout.write(rpc_error_output(RPC_ERROR_INTERNAL, f'Worker error: {str(e)}').decode(FRAME_ENCODING))
+        exit_code = EXIT_ERROR
+    finally:
+        sys.stdin, sys.stdout = saved_stdin, saved_stdout
+        request_stdout.flush()
+        request_stdout.detach()
+        flush_debug_logs()
+        if reset_state:
+            reset_request_state()
+
+    return exit_code, b''
+
+
+def run_inline_script(script: str, payload: bytes, channel: Any, request_id: Any) -> Tuple[int, bytes]:
+    """Run one hosted script in the worker process, its stdout forwarded as output frames."""
+    output = io.BufferedWriter(FrameWriter(channel, request_id), OUTPUT_CHUNK_BYTES)
+    try:
+        return run_hosted_script(script, payload, output)
+    finally:
+        output.flush()
+        output.detach()
+
+
+def run_forked_script(script: str, payload: bytes, channel: Any, request_id: Any) -> Tuple[int, bytes]:
+    """Run one hosted script in a forked child, forwarding its stdout from a pipe as output frames."""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+
+    if pid == 0:
+        exit_code = EXIT_ERROR
+        try:
+            os.close(read_fd)
+            with os.fdopen(write_fd, 'wb', buffering=OUTPUT_CHUNK_BYTES) as pipe_out:
+                # The child is discarded, so a gc pass would only dirty copy-on-write pages
+                exit_code, error_output = run_hosted_script(script, payload, pipe_out, reset_state=False)
+                pipe_out.write(error_output)
+        finally:
+            # Never return into the serve loop; skip teardown of buffers shared with the parent
+            os._exit(exit_code)
+
+    os.close(write_fd)
+    for chunk in iter(lambda: os.read(read_fd, OUTPUT_CHUNK_BYTES), b''):
+        write_frame(channel, {'id': request_id}, chunk)
+    os.close(read_fd)
+    _, status = os.waitpid(pid, 0)
+    exit_code = os.waitstatus_to_exitcode(status)
+
+    if exit_code < EXIT_OK:
+        return EXIT_ERROR, rpc_error_output(RPC_ERROR_INTERNAL, f'Worker child killed by signal {-exit_code}')
+    return exit_code, b''
+
+
+def write_frame(channel: Any, header: Dict[str, Any], body: bytes) -> None:
+    """Write one response frame to the worker output channel."""
+    channel.write(json.dumps({**header, 'length': len(body)}).encode(FRAME_ENCODING) + b'\n')
+    channel.write(body)
+    channel.flush()
+
+
+def serve(requests_in: Any, responses_out: Any, fork_per_request: bool = False) -> None:
+    """Serve framed requests until EOF."""
+    run_script = run_forked_script if fork_per_request else run_inline_script
+    # Move the imported modules out of gc bookkeeping: per-request collections stay cheap
+    # and forked children do not dirty the shared pages
+    gc.freeze()
+
+    for header_line in iter(requests_in.readline, b''):
+        if not header_line.strip():
+            continue
+
+        try:
+            header = json.loads(header_line)
+            length = int(header['length'])
+        except (ValueError, KeyError, TypeError) as e:
+            # Without a valid length the stream cannot be resynchronized
+            write_frame(responses_out, {'id': None, 'exitCode': EXIT_ERROR}, rpc_error_output(RPC_ERROR_INVALID_REQUEST, f'Invalid frame header: {str(e)}'))
+            sys.exit(EXIT_ERROR)
+
+        payload = requests_in.read(length)
+        exit_code, output = run_script(header.get('script', ''), payload, responses_out, header.get('id'))
+        write_frame(responses_out, {'id': header.get('id'), 'exitCode': exit_code}, output)
+
+
+if __name__ == '__main__':
+    serve(sys.stdin.buffer, sys.stdout.buffer, fork_per_request=FORK_FLAG in sys.argv[1:])
@@ -0,0 +1,169 @@
+# /// script
+# dependencies = [
+#   "pytest",
+# ]
+# ///
+
+"""
+Tests for analytics_worker.py
+Run with: uv run --script pytest analytics_worker.test.py
+"""
+
+import json
+import subprocess
+from pathlib import Path
+
+SCRIPT_PATH = Path(__file__).parent / 'analytics_worker.py'
+SUBPROCESS_TIMEOUT = 120
+EXIT_OK = 0
+EXIT_ERROR = 1
+
+
+def make_frame(request_id: int, script: str, rpc_request: dict, ndjson_data: list[dict]) -> bytes:
+    """Helper: builds one worker request frame from an RPC request and its NDJSON data."""
+    lines = [json.dumps(rpc_request)]
+    lines.extend(json.dumps(row) for row in ndjson_data)
+    payload = ('\n'.join(lines) + '\n').encode('utf-8')
+    header = json.dumps({'id': request_id, 'script': script, 'length': len(payload)}).encode('utf-8')
+    return header + b'\n' + payload
+
+
+def run_worker_frames(frames: list[bytes], extra_args: list[str] | None = None) -> list[tuple[dict, bytes]]:
+    """Helper: runs the worker with all frames on stdin and returns its output and end frames as (header, body)."""
+    result = subprocess.run(
+        ['uv', 'run', '--script', str(SCRIPT_PATH), *(extra_args or [])],
+        input=b''.join(frames),
+        capture_output=True,
+        timeout=SUBPROCESS_TIMEOUT,
+    )
+    assert result.returncode == EXIT_OK, f'Worker failed. stderr: {result.stderr.decode()}'
+
+    response_frames = []
+    stream = result.stdout
+    while stream:
+        header_line, stream = stream.split(b'\n', 1)
+        header = json.loads(header_line)
+        body, stream = stream[:header['length']], stream[header['length']:]
+        response_frames.append((header, body))
+    return response_frames
+
+
+def run_worker(frames: list[bytes], extra_args: list[str] | None = None) -> list[dict]:
+    """Helper: runs the worker and returns one response per request, its output frames joined up to the end frame."""
+    responses = []
+    output = b''
+    for header, body in run_worker_frames(frames, extra_args):
+        output += body
+        if 'exitCode' in header:
+            lines = [l for l in output.decode('utf-8').split('\n') if l.strip()]
+            responses.append({**header, 'lines': lines})
+            output = b''
+    assert output == b'', 'Output frames without an end frame'
+    return responses
+
+
+def kpi_request(operation: str, field: str) -> dict:
+    return {'jsonrpc': '2.0', 'method': 'aggregate', 'params': {'config': {'operation': operation, 'field': field}}}
+
+
+PIVOT_REQUEST = {
+    'jsonrpc': '2.0',
+    'method': 'pivot',
+    'params': {
+        'config': {
+            'rows': [{'field': 'status'}],
+            'values': [{'field': 'amount', 'aggregator': 'sum'}],
+        },
+    },
+}
+
+
+def test_serves_multiple_requests_in_order():
+    responses = run_worker([
+        make_frame(1, 'kpi_aggregator.py', kpi_request('sum', 'amount'), [{'amount': 10}, {'amount': 20}]),
+        make_frame(2, 'kpi_aggregator.py', kpi_request('max', 'amount'), [{'amount': 5}, {'amount': 7}]),
+    ])
+
+    assert [r['id'] for r in responses] == [1, 2]
+    assert all(r['exitCode'] == EXIT_OK for r in responses)
+    assert json.loads(responses[0]['lines'][1])['result'] == 30.0
+    assert json.loads(responses[1]['lines'][1])['result'] == 7.0
+
+
+def test_isolates_state_between_requests():
+    responses = run_worker([
+        make_frame(1, 'pivot_table.py', PIVOT_REQUEST, [{'status': 'Nova', 'amount': 1}, {'status': 'Ganha', 'amount': 2}]),
+        make_frame(2, 'pivot_table.py', PIVOT_REQUEST, [{'status': 'Perdida', 'amount': 3}]),
+    ])
+
+    second = json.loads(responses[1]['lines'][1])
+    assert [node['key'] for node in second['data']] == ['Perdida']
+    assert second['grandTotals']['totals'] == {'amount': 3.0}
+
+
+def test_cross_module_aggregate():
+    config = {
+        'parentDataset': 'contacts',
+        'relations': [{
+            'dataset': 'opportunities',
+            'parentKey': '_id',
+            'childKey': 'contact._id',
+            'aggregators': {'opportunityCount': {'aggregator': 'count'}},
+        }],
+    }
+    records = [
+        {'_id': 'c1', '_dataset': 'contacts'},
+        {'_id': 'o1', 'contact': {'_id': 'c1'}, '_dataset': 'opportunities'},
+        {'_id': 'o2', 'contact': {'_id': 'c1'}, '_dataset': 'opportunities'},
+    ]
+    responses = run_worker([
+        make_frame(1, 'cross_module_join.py', {'jsonrpc': '2.0', 'method': 'aggregate', 'params': {'config': config}}, records),
+    ])
+
+    assert responses[0]['exitCode'] == EXIT_OK
+    assert json.loads(responses[0]['lines'][1])['opportunityCount'] == 2
+
+
+def test_script_error_keeps_worker_alive():
+    responses = run_worker([
+        make_frame(1, 'kpi_aggregator.py', kpi_request('median', 'amount'), [{'amount': 1}]),
+        make_frame(2, 'kpi_aggregator.py', kpi_request('sum', 'amount'), [{'amount': 1}]),
+    ])
+
+    assert responses[0]['exitCode'] == EXIT_ERROR
+    assert 'error' in json.loads(responses[0]['lines'][0])
+    assert responses[1]['exitCode'] == EXIT_OK
+
+
+def test_rejects_unknown_script():
+    responses = run_worker([make_frame(1, 'other.py', kpi_request('sum', 'amount'), [])])
+
+    assert responses[0]['exitCode'] == EXIT_ERROR
+    assert json.loads(responses[0]['lines'][0])['error']['code'] == -32601
+
+
+def test_fork_mode_runs_each_request_in_a_child():
+    responses = run_worker([
+        make_frame(1, 'pivot_table.py', PIVOT_REQUEST, [{'status': 'Nova', 'amount': 1}]),
+        make_frame(2, 'kpi_aggregator.py', kpi_request('median', 'amount'), [{'amount': 1}]),
+        make_frame(3, 'kpi_aggregator.py', kpi_request('sum', 'amount'), [{'amount': 4}, {'amount': 6}]),
+    ], extra_args=['--fork'])
+
+    assert [r['exitCode'] for r in responses] == [EXIT_OK, EXIT_ERROR, EXIT_OK]
+    assert json.loads(responses[0]['lines'][1])['grandTotals']['totals'] == {'amount': 1.0}
+    assert json.loads(responses[2]['lines'][1])['result'] == 10.0
+
+
+def test_streams_output_frames_before_the_end_frame():
+    request = {**PIVOT_REQUEST, 'params': {**PIVOT_REQUEST['params'], 'outputFormat': 'ndjson'}}
+    records = [{'status': f'status-{index:05d}', 'amount': index} for index in range(5000)]
+
+    for extra_args in ([], ['--fork']):
+        response_frames = run_worker_frames([make_frame(1, 'pivot_table.py', request, records)], extra_args)
+        *output_frames, (end_header, _) = response_frames
+
+        assert end_header == {'id': 1, 'exitCode': EXIT_OK, 'length': 0}
+        assert all(header == {'id': 1, 'length': len(body)} for header, body in output_frames)
+        # The RPC header line leaves as soon as the script flushes it, the rows follow in bounded chunks
+        assert len(output_frames) > 2
+        assert json.loads(output_frames[0][1].split(b'\n', 1)[0])['result']['status'] == 'success'
@@ -0,0 +1,141 @@
+# codec_benchmark.py
+# Compares the JSON codecs available to json_codec.py (orjson, msgspec, stdlib json) on the payload
+# shapes the analytics scripts actually handle:
+#   decode-documents: NDJSON lines with Konecty-like documents (lookups, money, dates), one loads per line
+#   encode-pivot:     one large pivot result (hierarchy of rows x column-key cells), a single dumps
+#   encode-records:   cross-module output records with datetimes and ObjectId-like values, one dumps per record
+# Codecs that are not installed are skipped.
+#
+# Usage: python3 codec_benchmark.py [--documents 100000] [--rows 2000] [--columns 24] [--repeat 5]
+# ADR-0010: no-magic-numbers, functional style.
+
+import argparse
+import datetime
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from json_codec import CODEC_BUILDERS, CODEC_STDLIB, Codec  # noqa: E402
+
+DEFAULT_DOCUMENTS = 100_000
+DEFAULT_ROWS = 2_000
+DEFAULT_COLUMNS = 24
+DEFAULT_REPEAT = 5
+MS_PER_SECOND = 1000
+BYTES_PER_MB = 1024 * 1024
+STATUSES = ('Nova', 'Em Andamento', 'Ganha', 'Perdida')
+USER_COUNT = 25
+BASE_DATE = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+VALUES_PER_CELL = ('amount.value', 'score_sum', 'score_count', '_id')
+
+
+class ObjectIdLike:
+    """Stand-in for bson.ObjectId: only serializable through str()."""
+
+    __slots__ = ('value',)
+
+    def __init__(self, value: str):
+        self.value = value
+
+    def __str__(self) -> str:
+        return self.value
+
+
+def make_document(i: int) -> Dict[str, Any]:
+    return {
+        '_id': f'{i:024x}',
+        'code': i,
+        'status': STATUSES[i % len(STATUSES)],
+        'amount': {'value': round(i * 1.37, 2), 'currency': 'BRL'},
+        '_user': [{'_id': f'user{i % USER_COUNT}', 'name': f'Usuário {i % USER_COUNT}', 'group': {'_id': 'g1', 'name': 'Vendas'}}],
+        'contact': {'_id': f'c{i % 1000}', 'name': {'full': f'Contato Número {i % 1000}'}},
+        '_createdAt': (BASE_DATE + datetime.timedelta(hours=i)).isoformat().replace('+00:00', 'Z'),
+    }
+
+
+def make_pivot_result(rows: int, columns: int) -> Dict[str, Any]:
+    column_keys = [f'2024|{month:02d}' for month in range(1, columns + 1)]
+
+    def cells(seed: int) -> Dict[str, Any]:
+        return {key: {name: float(seed * (j + 1) + k) for k, name in enumerate(VALUES_PER_CELL)} for j, key in enumerate(column_keys)}
+
+    return {
+        'data': [
+            {'key': f'row{i}', 'label': f'Linha {i}', 'level': 0, 'cells': cells(i), 'totals': {name: float(i) for name in VALUES_PER_CELL}}
+            for i in range(rows)
+        ],
+        'grandTotals': {'cells': cells(rows), 'totals': {name: float(rows) for name in VALUES_PER_CELL}},
+        'columnHeaders': [{'key': key, 'value': key, 'label': key, 'level': 0} for key in column_keys],
+    }
+
+
+def make_output_record(i: int) -> Dict[str, Any]:
+    return {
+        '_id': ObjectIdLike(f'{i:024x}'),
+        'name': f'Contato {i}',
+        '_createdAt': BASE_DATE + datetime.timedelta(minutes=i),
+        'opportunityCount': i % 7,
+        'opportunities': [{'_id': ObjectIdLike(f'{i * 3 + j:024x}'), 'amount': j * 10.5} for j in range(3)],
+    }
+
+
+def best_ms(call: Callable[[], Any], repeat: int) -> float:
+    def timed() -> float:
+        start = time.perf_counter()
+        call()
+        return (time.perf_counter() - start) * MS_PER_SECOND
+
+    return min(timed() for _ in range(repeat))
+
+
+def available_codecs() -> List[Codec]:
+    codecs = []
+    for name, build in CODEC_BUILDERS.items():
+        try:
+            codecs.append(build())
+        except ImportError:
+            print(f'  skipping {name}: not installed')
+    return codecs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='JSON codec benchmark on analytics payload shapes')
+    parser.add_argument('--documents', type=int, default=DEFAULT_DOCUMENTS)
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS)
+    parser.add_argument('--columns', type=int, default=DEFAULT_COLUMNS)
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    args = parser.parse_args()
+
+    lines = [json.dumps(make_document(i)).encode('utf-8') for i in range(args.documents)]
+    pivot_result = make_pivot_result(args.rows, args.columns)
+    records = [make_output_record(i) for i in range(args.documents)]
+    codecs = available_codecs()
+
+    print(f'documents={args.documents} pivot={args.rows}x{args.columns} repeat={args.repeat} (best of)')
+    results = {
+        codec.name: {
+            'decode-documents': best_ms(lambda: [codec.loads(line) for line in lines], args.repeat),
+            'encode-pivot': best_ms(lambda: codec.dumps(pivot_result), args.repeat),
+            'encode-records': best_ms(lambda: [codec.dumps(record) for record in records], args.repeat),
+        }
+        for codec in codecs
+    }
+
+    if not codecs:
+        print('  no codec available')
+        return
+
+    print(f'pivot result size: {len(codecs[0].dumps(pivot_result)) / BYTES_PER_MB:.1f} MB')
+    baseline = results.get(CODEC_STDLIB, {})
+    for name, timings in results.items():
+        print(f'  {name:<8} ' + '  '.join(
+            f'{shape}={ms:.1f}ms' + (f' (x{baseline[shape] / ms:.1f})' if baseline and name != CODEC_STDLIB else '')
+            for shape, ms in timings.items()
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+# konecty_documents.py
+# Deterministic generator of Konecty-shaped documents for the analytics benchmarks, with the field
+# shapes the Node side actually streams to the Python scripts:
+#   lookups:        contact {_id, code, name: {full}}, campaign {_id, name} (sparse)
+#   isList lookups: _user [{_id, name, group: {_id, name}, active}], product [{_id, name}] (0..3 items)
+#   money:          value {value, currency}
+#   picklists:      status, type (strings, status sometimes missing or empty)
+#   dates:          _createdAt / _updatedAt ISO timestamps with 'Z', closeDate ISO date
+# Two datasets are produced: plain opportunities (pivot, graph, KPI) and contacts + opportunities
+# tagged with '_dataset' (cross-module join). Files are cached per (dataset, rows, seed) in the
+# system temp dir, since 1M-row payloads take a while to build.
+#
+# Usage: python3 konecty_documents.py --rows 100000 [--seed 42] [--dataset opportunities|cross-module] > data.ndjson
+# ADR-0010: no-magic-numbers, functional style.
+
+import argparse
+import datetime
+import os
+import random
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, Iterator
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from json_codec import dumps  # noqa: E402
+
+DEFAULT_SEED = 42
+DATASET_OPPORTUNITIES = 'opportunities'
+DATASET_CROSS_MODULE = 'cross-module'
+DATASETS = (DATASET_OPPORTUNITIES, DATASET_CROSS_MODULE)
+PARENT_DATASET = 'Contact'
+CHILD_DATASET = 'Opportunity'
+DATASET_TAG = '_dataset'
+CACHE_DIR = Path(tempfile.gettempdir()) / 'konecty-analytics-bench'
+WRITE_BATCH_ROWS = 10_000
+
+STATUSES = ('Nova', 'Em Andamento', 'Em Visitação', 'Proposta', 'Ganha', 'Perdida', 'Suspensa')
+OPPORTUNITY_TYPES = ('Compra', 'Locação', 'Temporada')
+CAMPAIGNS = tuple({'_id': f'camp{i:04d}', 'name': f'Campanha {i}'} for i in range(40))
+PRODUCTS = tuple({'_id': f'prod{i:05d}', 'name': f'Imóvel {i}'} for i in range(500))
+GROUPS = tuple({'_id': f'group{i}', 'name': name} for i, name in enumerate(('Vendas', 'Locação', 'Lançamentos', 'Parcerias')))
+USERS = tuple(
+    {'_id': f'user{i:03d}', 'name': f'Corretor {i}', 'group': GROUPS[i % len(GROUPS)], 'active': i % 9 != 0}
+    for i in range(120)
+)
+CONTACTS_PER_OPPORTUNITY = 10
+MISSING_STATUS_RATE = 0.05
+EMPTY_STATUS_RATE = 0.02
+CAMPAIGN_RATE = 0.6
+SECOND_USER_RATE = 0.15
+MAX_PRODUCTS = 3
+MAX_VALUE = 2_500_000
+MONEY_DECIMALS = 2
+MAX_PROBABILITY = 100
+BASE_DATE = datetime.datetime(2022, 1, 1, tzinfo=datetime.timezone.utc)
+DATE_RANGE_MINUTES = 4 * 365 * 24 * 60
+MAX_CLOSE_DAYS = 180
+MAX_UPDATE_MINUTES = 30 * 24 * 60
+TIMESTAMP_TRIM = -3  # microseconds -> milliseconds, as MongoDB dates are serialized by Node
+
+
+def iso_timestamp(value: datetime.datetime) -> str:
+    return value.strftime('%Y-%m-%dT%H:%M:%S.%f')[:TIMESTAMP_TRIM] + 'Z'
+
+
+def object_id(prefix: int, i: int) -> str:
+    return f'{prefix:08x}{i:016x}'
+
+
+def make_contact(i: int) -> Dict[str, Any]:
+    return {
+        '_id': object_id(1, i),
+        'code': i + 1,
+        'name': {'first': 'Contato', 'last': str(i), 'full': f'Contato {i}'},
+        'type': ['Cliente'] if i % 3 else ['Cliente', 'Proprietário'],
+        '_createdAt': iso_timestamp(BASE_DATE + datetime.timedelta(minutes=i)),
+    }
+
+
+def make_opportunity(i: int, rng: random.Random, contact_count: int) -> Dict[str, Any]:
+    contact_index = rng.randrange(contact_count)
+    created_at = BASE_DATE + datetime.timedelta(minutes=rng.randrange(DATE_RANGE_MINUTES))
+    users = [rng.choice(USERS)] + ([rng.choice(USERS)] if rng.random() < SECOND_USER_RATE else [])
+    document = {
+        '_id': object_id(2, i),
+        'code': i + 1,
+        'status': rng.choice(STATUSES),
+        'type': rng.choice(OPPORTUNITY_TYPES),
+        'value': {'value': round(rng.uniform(0, MAX_VALUE), MONEY_DECIMALS), 'currency': 'BRL'},
+        'probability': rng.randrange(MAX_PROBABILITY + 1),
+        'contact': {'_id': object_id(1, contact_index), 'code': contact_index + 1, 'name': {'full': f'Contato {contact_index}'}},
+        '_user': users,
+        'product': rng.sample(PRODUCTS, rng.randrange(MAX_PRODUCTS + 1)),
+        'closeDate': (created_at + datetime.timedelta(days=rng.randrange(MAX_CLOSE_DAYS))).date().isoformat(),
+        '_createdAt': iso_timestamp(created_at),
+        '_updatedAt': iso_timestamp(created_at + datetime.timedelta(minutes=rng.randrange(MAX_UPDATE_MINUTES))),
+    }
+    if rng.random() < CAMPAIGN_RATE:
+        document['campaign'] = rng.choice(CAMPAIGNS)
+
+    status_roll = rng.random()
+    if status_roll < MISSING_STATUS_RATE:
+        document.pop('status')
+    elif status_roll < MISSING_STATUS_RATE + EMPTY_STATUS_RATE:
+        document['status'] = ''
+    return document
+
+
+def contact_count_for(rows: int) -> int:
+    return max(1, rows // CONTACTS_PER_OPPORTUNITY)
+
+
+def iter_opportunities(rows: int, seed: int = DEFAULT_SEED) -> Iterator[Dict[str, Any]]:
+    rng = random.Random(seed)
+    contact_count = contact_count_for(rows)
+    return (make_opportunity(i, rng, contact_count) for i in range(rows))
+
+
+def iter_cross_module(rows: int, seed: int = DEFAULT_SEED) -> Iterator[Dict[str, Any]]:
+    """Contacts (parent dataset) followed by their opportunities, each tagged with its dataset name.
+    rows counts the opportunities; there is one contact for every CONTACTS_PER_OPPORTUNITY of them."""
+    yield from ({**make_contact(i), DATASET_TAG: PARENT_DATASET} for i in range(contact_count_for(rows)))
+    yield from ({**document, DATASET_TAG: CHILD_DATASET} for document in iter_opportunities(rows, seed))
+
+
+DATASET_BUILDERS = {
+    DATASET_OPPORTUNITIES: iter_opportunities,
+    DATASET_CROSS_MODULE: iter_cross_module,
+}
+
+
+def write_ndjson(documents: Iterator[Dict[str, Any]], out) -> None:
+    batch = []
+    for document in documents:
+        batch.append(dumps(document) + b'\n')
+        if len(batch) >= WRITE_BATCH_ROWS:
+            out.writelines(batch)
+            batch = []
+    out.writelines(batch)
+
+
+def cached_ndjson(dataset: str, rows: int, seed: int = DEFAULT_SEED) -> Path:
+    """Path of the NDJSON file for (dataset, rows, seed), generating it on first use."""
+    path = CACHE_DIR / f'{dataset}-{rows}-{seed}.ndjson'
+    if path.exists():
+        return path
+
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    partial = path.with_suffix(f'.{os.getpid()}.partial')
+    with open(partial, 'wb') as out:
+        write_ndjson(DATASET_BUILDERS[dataset](rows, seed), out)
+    partial.replace(path)
+    return path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Synthetic Konecty document generator (NDJSON on stdout)')
+    parser.add_argument('--rows', type=int, required=True)
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--dataset', default=DATASET_OPPORTUNITIES, choices=DATASETS)
+    args = parser.parse_args()
+
+    write_ndjson(DATASET_BUILDERS[args.dataset](args.rows, args.seed), sys.stdout.buffer)
+    sys.stdout.buffer.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+# pipeline_benchmark.py
+# End-to-end benchmark of the analytics scripts on synthetic Konecty documents (konecty_documents.py).
+# Each case runs one script through its real stdin/stdout protocol (RPC request line + NDJSON payload
+# in, RPC header + result out) and records, per (script, rows):
+#   latency:    p50 / p95 / max wall time of the whole process (startup included), over --iterations runs
+#   throughput: input rows per second at the p50 latency
+#   memory:     peak RSS of the process tree (wait4 rusage, so it works through `uv run` too)
+#   stages:     median per-stage ms from the `metrics` object of the RPC header (stage_metrics.py)
+#
+# Regression gate: results are compared with pipeline_baseline.json. A case fails when its p95 latency
+# or peak RSS exceeds the baseline by more than the tolerance, or its throughput drops below
+# baseline / (1 + tolerance). The process exits with status 1 when any case regresses.
+# --record merges the measured cases into the baseline instead (run it on the reference machine).
+#
+# Usage: python3 pipeline_benchmark.py [--sizes 10000,100000,1000000] [--scripts pivot_table.py,...]
+#                                      [--iterations 5] [--runner uv|python] [--tolerance 0.5]
+#                                      [--baseline pipeline_baseline.json] [--record] [--output results.json]
+# ADR-0010: no-magic-numbers, functional style.
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from konecty_documents import DATASET_CROSS_MODULE, DATASET_OPPORTUNITIES, DEFAULT_SEED, cached_ndjson
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+SCRIPTS_DIR = BENCHMARKS_DIR.parent
+DEFAULT_BASELINE = BENCHMARKS_DIR / 'pipeline_baseline.json'
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+DEFAULT_ITERATIONS = 5
+DEFAULT_TOLERANCE = 0.5
+MS_PER_SECOND = 1000
+KB_PER_MB = 1024
+P95 = 95
+PERCENTILE_BUCKETS = 100
+PIPE_CHUNK_BYTES = 1024 * 1024
+ROUND_DECIMALS = 1
+EXIT_REGRESSION = 1
+
+# Lower is better for latency and memory, higher is better for throughput
+GATED_METRICS = {'p95Ms': 'max', 'peakRssMb': 'max', 'rowsPerSec': 'min'}
+
+CASES = {
+    'pivot_table.py': (
+        DATASET_OPPORTUNITIES,
+        {
+            'method': 'pivot',
+            'params': {
+                'config': {
+                    'rows': [
+                        {'field': 'status', 'label': 'Situação', 'type': 'picklist'},
+                        {'field': '_user', 'label': 'Corretor', 'type': 'lookup', 'lookup': {'simpleFields': ['name']}},
+                    ],
+                    'columns': [{'field': '_createdAt', 'bucket': 'Y'}, {'field': '_createdAt', 'bucket': 'm'}],
+                    'values': [
+                        {'field': 'value.value', 'aggregator': 'sum'},
+                        {'field': 'probability', 'aggregator': 'avg'},
+                        {'field': '_id', 'aggregator': 'count'},
+                    ],
+                },
+            },
+        },
+    ),
+    'graph_generator.py': (
+        DATASET_OPPORTUNITIES,
+        {
+            'method': 'graph',
+            'params': {'config': {'type': 'bar', 'categoryField': 'status', 'aggregation': 'sum', 'yAxis': {'field': 'value.value'}}},
+        },
+    ),
+    'kpi_aggregator.py': (
+        DATASET_OPPORTUNITIES,
+        {'method': 'aggregate', 'params': {'config': {'operation': 'sum', 'field': 'value.value'}}},
+    ),
+    'cross_module_join.py': (
+        DATASET_CROSS_MODULE,
+        {
+            'method': 'aggregate',
+            'params': {
+                'config': {
+                    'parentDataset': 'Contact',
+                    'relations': [
+                        {
+                            'dataset': 'Opportunity',
+                            'parentKey': '_id',
+                            'childKey': 'contact._id',
+                            'aggregators': {
+                                'opportunityCount': {'aggregator': 'count'},
+                                'opportunityValue': {'aggregator': 'sum', 'field': 'value'},
+                            },
+                        },
+                    ],
+                },
+            },
+        },
+    ),
+}
+
+
+def command_for(runner: str, script: str) -> List[str]:
+    script_path = str(SCRIPTS_DIR / script)
+    if runner == 'uv':
+        return ['uv', 'run', '--script', script_path]
+    return [sys.executable, script_path]
+
+
+def feed_stdin(stdin, request_line: bytes, data_path: Path) -> None:
+    try:
+        stdin.write(request_line)
+        with open(data_path, 'rb') as data:
+            shutil.copyfileobj(data, stdin, PIPE_CHUNK_BYTES)
+    except BrokenPipeError:
+        pass
+    finally:
+        stdin.close()
+
+
+def run_once(command: List[str], request_line: bytes, data_path: Path) -> Tuple[float, float, Dict[str, Any]]:
+    """Run one request; returns (wall ms, peak RSS MB of the process tree, RPC header)."""
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    feeder = threading.Thread(target=feed_stdin, args=(process.stdin, request_line, data_path))
+    feeder.start()
+    header_line = process.stdout.readline()
+    for _ in iter(lambda: process.stdout.read(PIPE_CHUNK_BYTES), b''):
+        pass
+    feeder.join()
+    # wait4 instead of Popen.wait: its rusage covers the child and the children it waited for (uv -> python)
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    wall_ms = (time.perf_counter() - start) * MS_PER_SECOND
+    process.stdout.close()
+
+    header = json.loads(header_line) if header_line.strip() else {}
+    if process.returncode != 0 or 'result' not in header:
+        raise RuntimeError(f'{command[-1]} failed (exit {process.returncode}): {header.get("error")}')
+    return wall_ms, usage.ru_maxrss / KB_PER_MB, header
+
+
+def percentile(samples: List[float], pct: int) -> float:
+    if len(samples) < 2:
+        return samples[0]
+    return statistics.quantiles(samples, n=PERCENTILE_BUCKETS, method='inclusive')[pct - 1]
+
+
+def median_stages(headers: List[Dict[str, Any]]) -> Dict[str, float]:
+    timings: Dict[str, List[float]] = {}
+    for header in headers:
+        for stage in header.get('metrics', {}).get('stages', []):
+            timings.setdefault(stage['name'], []).append(stage['ms'])
+    return {name: round(statistics.median(values), ROUND_DECIMALS) for name, values in timings.items()}
+
+
+def bench_case(runner: str, script: str, rows: int, iterations: int, seed: int) -> Dict[str, Any]:
+    dataset, request = CASES[script]
+    data_path = cached_ndjson(dataset, rows, seed)
+    request_line = json.dumps({'jsonrpc': '2.0', 'id': f'bench-{rows}', **request}).encode('utf-8') + b'\n'
+    command = command_for(runner, script)
+
+    runs = [run_once(command, request_line, data_path) for _ in range(iterations)]
+    latencies = [wall_ms for wall_ms, _, _ in runs]
+    p50 = statistics.median(latencies)
+    return {
+        'p50Ms': round(p50, ROUND_DECIMALS),
+        'p95Ms': round(percentile(latencies, P95), ROUND_DECIMALS),
+        'maxMs': round(max(latencies), ROUND_DECIMALS),
+        'rowsPerSec': round(rows / (p50 / MS_PER_SECOND)),
+        'peakRssMb': round(max(peak for _, peak, _ in runs), ROUND_DECIMALS),
+        'stages': median_stages([header for _, _, header in runs]),
+    }
+
+
+def case_key(script: str, rows: int) -> str:
+    return f'{script}@{rows}'
+
+
+def regressions(key: str, result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    reference = baseline.get(key)
+    if reference is None:
+        return []
+
+    def regressed(metric: str, bound: str) -> bool:
+        if metric not in reference:
+            return False
+        if bound == 'max':
+            return result[metric] > reference[metric] * (1 + tolerance)
+        return result[metric] < reference[metric] / (1 + tolerance)
+
+    return [
+        f'{key}: {metric} {result[metric]} vs baseline {reference[metric]} (tolerance {tolerance:.0%})'
+        for metric, bound in GATED_METRICS.items()
+        if regressed(metric, bound)
+    ]
+
+
+def load_baseline(path: Path) -> Dict[str, Any]:
+    if not path.exists():
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baseline(path: Path, baseline: Dict[str, Any], results: Dict[str, Dict[str, Any]]) -> None:
+    merged = {**baseline, **{key: {metric: result[metric] for metric in GATED_METRICS} for key, result in results.items()}}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(dict(sorted(merged.items())), f, indent=2)
+        f.write('\n')
+
+
+def parse_list(value: str) -> List[str]:
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='End-to-end analytics script benchmark with regression thresholds')
+    parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES))
+    parser.add_argument('--scripts', default=','.join(CASES))
+    parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument('--runner', default='uv', choices=['uv', 'python'])
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--baseline', type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument('--record', action='store_true', help='merge the results into the baseline instead of gating on it')
+    parser.add_argument('--output', type=Path, help='write the full results as JSON')
+    args = parser.parse_args()
+
+    scripts = parse_list(args.scripts)
+    unknown = [script for script in scripts if script not in CASES]
+    if unknown:
+        parser.error(f'unknown scripts: {", ".join(unknown)} (choose from {", ".join(CASES)})')
+
+    sizes = [int(size) for size in parse_list(args.sizes)]
+    baseline = load_baseline(args.baseline)
+    results: Dict[str, Dict[str, Any]] = {}
+    failures: List[str] = []
+
+    print(f'runner={args.runner} iterations={args.iterations} seed={args.seed}')
+    for rows in sizes:
+        for script in scripts:
+            key = case_key(script, rows)
+            result = bench_case(args.runner, script, rows, args.iterations, args.seed)
+            results[key] = result
+            case_failures = [] if args.record else regressions(key, result, baseline, args.tolerance)
+            failures.extend(case_failures)
+
+            status = 'REGRESSION' if case_failures else ('new' if key not in baseline else 'ok')
+            print(
+                f'  {key:<30} p50={result["p50Ms"]}ms p95={result["p95Ms"]}ms max={result["maxMs"]}ms '
+                f'rows/s={result["rowsPerSec"]} peakRss={result["peakRssMb"]}MB [{status}]'
+            )
+            print('    stages: ' + ' '.join(f'{name}={ms}ms' for name, ms in result['stages'].items()))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.record:
+        save_baseline(args.baseline, baseline, results)
+        print(f'baseline updated: {args.baseline}')
+        return
+
+    if failures:
+        print('regressions:')
+        print('\n'.join(f'  {failure}' for failure in failures))
+        sys.exit(EXIT_REGRESSION)
+
+
+if __name__ == '__main__':
+    main()
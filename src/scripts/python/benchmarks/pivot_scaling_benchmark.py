@@ -0,0 +1,157 @@
+# pivot_scaling_benchmark.py
+# Scaling of the pivot with the number of cores, on two separate axes. Each case runs pivot_table.py
+# through its real stdin/stdout protocol on synthetic opportunities (konecty_documents.py) with
+# POLARS_MAX_THREADS fixed to the thread count, once serial (options.partitions 1) and once partitioned
+# (options.partitions equal to the thread count, pivot_engine.group_records), and records, per thread count:
+#   latency:           p50 wall time of the whole process and p50 of the 'aggregate' stage (RPC header
+#                      metrics), serial and partitioned
+#   thread speedup:    serial p50 of the first thread count divided by this one's serial p50 (polars' own
+#                      parallelism, no partitioning)
+#   partition speedup: serial p50 divided by partitioned p50 at the same thread count (what partitioning
+#                      adds on top of it)
+#   identical:         whether both payloads match the first thread count's serial one (float values up to
+#                      summation order, which polars' own group-by does not fix either)
+# Thread counts above the machine's cores are measured anyway and flagged as oversubscribed.
+#
+# Usage: python3 pivot_scaling_benchmark.py [--rows 1000000] [--threads 1,4,8,16] [--iterations 3]
+#                                           [--runner uv|python] [--output results.json]
+# ADR-0010: no-magic-numbers, functional style.
+
+import argparse
+import json
+import math
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from konecty_documents import DATASET_OPPORTUNITIES, DEFAULT_SEED, cached_ndjson
+from pipeline_benchmark import CASES, MS_PER_SECOND, PIPE_CHUNK_BYTES, ROUND_DECIMALS, command_for, feed_stdin, parse_list
+
+SCRIPT = 'pivot_table.py'
+DEFAULT_ROWS = 1_000_000
+DEFAULT_THREADS = (1, 4, 8, 16)
+DEFAULT_ITERATIONS = 3
+AGGREGATE_STAGE = 'aggregate'
+# Same tolerance as float values that only differ by summation order
+REL_TOLERANCE = 1e-9
+ABS_TOLERANCE = 1e-6
+
+
+def same_payload(left: Any, right: Any) -> bool:
+    """Structural equality (key order included), with floats compared up to summation order."""
+    if isinstance(left, float) or isinstance(right, float):
+        return isinstance(left, (int, float)) and isinstance(right, (int, float)) and math.isclose(left, right, rel_tol=REL_TOLERANCE, abs_tol=ABS_TOLERANCE)
+    if isinstance(left, dict) and isinstance(right, dict):
+        return list(left) == list(right) and all(same_payload(left[key], right[key]) for key in left)
+    if isinstance(left, list) and isinstance(right, list):
+        return len(left) == len(right) and all(same_payload(a, b) for a, b in zip(left, right))
+    return left == right
+
+
+def request_line(partitions: int) -> bytes:
+    _, request = CASES[SCRIPT]
+    config = request['params']['config']
+    partitioned = {**request, 'params': {**request['params'], 'config': {**config, 'options': {**config.get('options', {}), 'partitions': partitions}}}}
+    return json.dumps({'jsonrpc': '2.0', 'id': f'scaling-{partitions}', **partitioned}).encode('utf-8') + b'\n'
+
+
+def run_once(command: List[str], threads: int, partitions: int, data_path: Path) -> Tuple[float, float, Any]:
+    """Run one request; returns (wall ms, aggregate stage ms, parsed payload)."""
+    environment = {**os.environ, 'POLARS_MAX_THREADS': str(threads)}
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, env=environment)
+    feeder = threading.Thread(target=feed_stdin, args=(process.stdin, request_line(partitions), data_path))
+    feeder.start()
+    header_line = process.stdout.readline()
+    payload = b''.join(iter(lambda: process.stdout.read(PIPE_CHUNK_BYTES), b''))
+    feeder.join()
+    process.wait()
+    wall_ms = (time.perf_counter() - start) * MS_PER_SECOND
+    process.stdout.close()
+
+    header = json.loads(header_line) if header_line.strip() else {}
+    if process.returncode != 0 or 'result' not in header:
+        raise RuntimeError(f'{SCRIPT} failed with {threads} threads and {partitions} partitions (exit {process.returncode}): {header.get("error")}')
+    stages = {stage['name']: stage['ms'] for stage in header.get('metrics', {}).get('stages', [])}
+    return wall_ms, stages.get(AGGREGATE_STAGE, 0.0), json.loads(payload)
+
+
+def bench_case(command: List[str], threads: int, partitions: int, data_path: Path, iterations: int) -> Tuple[Dict[str, float], Any]:
+    """p50 wall and aggregate stage ms of (threads, partitions), with the payload of the first run."""
+    runs = [run_once(command, threads, partitions, data_path) for _ in range(iterations)]
+    return (
+        {
+            'p50Ms': round(statistics.median(wall_ms for wall_ms, _, _ in runs), ROUND_DECIMALS),
+            'aggregateMs': round(statistics.median(aggregate_ms for _, aggregate_ms, _ in runs), ROUND_DECIMALS),
+        },
+        runs[0][2],
+    )
+
+
+def speedup(before_ms: float, after_ms: float) -> Optional[float]:
+    return round(before_ms / after_ms, ROUND_DECIMALS + 1) if after_ms else None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Scaling of the pivot with the number of cores, serial and partitioned')
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS)
+    parser.add_argument('--threads', default=','.join(str(threads) for threads in DEFAULT_THREADS))
+    parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument('--runner', default='uv', choices=['uv', 'python'])
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--output', type=Path, help='write the results as JSON')
+    args = parser.parse_args()
+
+    thread_counts = [int(threads) for threads in parse_list(args.threads)]
+    data_path = cached_ndjson(DATASET_OPPORTUNITIES, args.rows, args.seed)
+    command = command_for(args.runner, SCRIPT)
+    cores = os.cpu_count() or 1
+
+    print(f'rows={args.rows} cores={cores} runner={args.runner} iterations={args.iterations}')
+    results: List[Dict[str, Any]] = []
+    reference = None
+    for threads in thread_counts:
+        serial, serial_payload = bench_case(command, threads, 1, data_path, args.iterations)
+        # One partition per thread; with a single thread that is the serial run itself
+        partitioned, partitioned_payload = (serial, serial_payload) if threads == 1 else bench_case(command, threads, threads, data_path, args.iterations)
+        if reference is None:
+            reference = (serial, serial_payload)
+        first, first_payload = reference
+        result = {
+            'threads': threads,
+            'p50Ms': serial['p50Ms'],
+            'aggregateMs': serial['aggregateMs'],
+            'threadSpeedup': speedup(first['p50Ms'], serial['p50Ms']),
+            'aggregateThreadSpeedup': speedup(first['aggregateMs'], serial['aggregateMs']),
+            'partitionedP50Ms': partitioned['p50Ms'],
+            'partitionedAggregateMs': partitioned['aggregateMs'],
+            'partitionSpeedup': speedup(serial['p50Ms'], partitioned['p50Ms']),
+            'aggregatePartitionSpeedup': speedup(serial['aggregateMs'], partitioned['aggregateMs']),
+            'identical': same_payload(serial_payload, first_payload) and same_payload(partitioned_payload, first_payload),
+        }
+        results.append(result)
+        flag = ' [oversubscribed]' if threads > cores else ''
+        print(
+            f'  threads={threads:<3} serial: p50={result["p50Ms"]}ms aggregate={result["aggregateMs"]}ms '
+            f'threadSpeedup={result["threadSpeedup"]}x aggregateThreadSpeedup={result["aggregateThreadSpeedup"]}x{flag}'
+        )
+        print(
+            f'  {"":<11} partitions={threads:<3} p50={result["partitionedP50Ms"]}ms aggregate={result["partitionedAggregateMs"]}ms '
+            f'partitionSpeedup={result["partitionSpeedup"]}x aggregatePartitionSpeedup={result["aggregatePartitionSpeedup"]}x identical={result["identical"]}'
+        )
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'rows': args.rows, 'cores': cores, 'results': results}, f, indent=2)
+
+    if not all(result['identical'] for result in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+# startup_benchmark.py
+# Measures per-request latency of the analytics scripts with and without process startup:
+#   oneshot: a fresh process per request (`uv run --script <script>`, current behaviour)
+#   worker:  analytics_worker.py serving every request in one long-lived process
+#   fork:    analytics_worker.py --fork, one pre-imported child forked per request
+# The payload is deliberately tiny so the numbers are dominated by startup and import time.
+#
+# Usage: python3 startup_benchmark.py [--iterations 20] [--script pivot_table.py] [--runner uv|python]
+# ADR-0010: no-magic-numbers, functional style.
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent
+WORKER_SCRIPT = SCRIPTS_DIR / 'analytics_worker.py'
+DEFAULT_ITERATIONS = 20
+DEFAULT_SCRIPT = 'pivot_table.py'
+MS_PER_SECOND = 1000
+P95 = 95
+PERCENTILE_BUCKETS = 100
+WARMUP_REQUESTS = 1
+
+SAMPLE_REQUESTS = {
+    'pivot_table.py': {
+        'jsonrpc': '2.0',
+        'method': 'pivot',
+        'params': {'config': {'rows': [{'field': 'status'}], 'values': [{'field': 'amount', 'aggregator': 'sum'}]}},
+    },
+    'kpi_aggregator.py': {
+        'jsonrpc': '2.0',
+        'method': 'aggregate',
+        'params': {'config': {'operation': 'sum', 'field': 'amount'}},
+    },
+    'graph_generator.py': {
+        'jsonrpc': '2.0',
+        'method': 'graph',
+        'params': {'config': {'type': 'bar', 'categoryField': 'status', 'aggregation': 'sum', 'yAxis': {'field': 'amount'}}},
+    },
+    'cross_module_join.py': {
+        'jsonrpc': '2.0',
+        'method': 'aggregate',
+        'params': {'config': {'parentDataset': 'sample', 'groupBy': ['status'], 'aggregators': {'total': {'aggregator': 'sum', 'field': 'amount'}}}},
+    },
+}
+SAMPLE_RECORDS = [{'_id': str(i), 'status': status, 'amount': i} for i, status in enumerate(['Nova', 'Ganha', 'Perdida'])]
+
+
+def build_payload(script: str) -> bytes:
+    lines = [json.dumps(SAMPLE_REQUESTS[script])] + [json.dumps(record) for record in SAMPLE_RECORDS]
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def command_for(runner: str, script_path: Path, extra_args: List[str]) -> List[str]:
+    if runner == 'uv':
+        return ['uv', 'run', '--script', str(script_path), *extra_args]
+    return [sys.executable, str(script_path), *extra_args]
+
+
+def time_call(call: Callable[[], None]) -> float:
+    start = time.perf_counter()
+    call()
+    return (time.perf_counter() - start) * MS_PER_SECOND
+
+
+def bench_oneshot(runner: str, script: str, payload: bytes, iterations: int) -> Dict[str, float]:
+    command = command_for(runner, SCRIPTS_DIR / script, [])
+
+    def run_once() -> None:
+        result = subprocess.run(command, input=payload, capture_output=True, check=False)
+        if not result.stdout:
+            raise RuntimeError(f'{script} produced no output: {result.stderr.decode()[-500:]}')
+
+    [run_once() for _ in range(WARMUP_REQUESTS)]
+    return summarize([time_call(run_once) for _ in range(iterations)])
+
+
+def bench_worker(runner: str, script: str, payload: bytes, iterations: int, fork: bool) -> Dict[str, float]:
+    command = command_for(runner, WORKER_SCRIPT, ['--fork'] if fork else [])
+    spawned_at = time.perf_counter()
+    worker = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    frame = json.dumps({'id': 0, 'script': script, 'length': len(payload)}).encode('utf-8') + b'\n' + payload
+
+    def run_once() -> None:
+        worker.stdin.write(frame)
+        worker.stdin.flush()
+        header = json.loads(worker.stdout.readline())
+        worker.stdout.read(header['length'])
+
+    try:
+        run_once()
+        ready_ms = (time.perf_counter() - spawned_at) * MS_PER_SECOND
+        summary = summarize([time_call(run_once) for _ in range(iterations)])
+    finally:
+        worker.stdin.close()
+        worker.wait()
+
+    return {**summary, 'firstResponseMs': round(ready_ms, 1)}
+
+
+def percentile(samples: List[float], pct: int) -> float:
+    if len(samples) < 2:
+        return samples[0]
+    return statistics.quantiles(samples, n=PERCENTILE_BUCKETS, method='inclusive')[pct - 1]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    return {
+        'p50Ms': round(statistics.median(samples), 1),
+        'p95Ms': round(percentile(samples, P95), 1),
+        'meanMs': round(statistics.fmean(samples), 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Analytics script startup benchmark')
+    parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument('--script', default=DEFAULT_SCRIPT, choices=sorted(SAMPLE_REQUESTS))
+    parser.add_argument('--runner', default='uv', choices=['uv', 'python'])
+    args = parser.parse_args()
+
+    payload = build_payload(args.script)
+    results = {
+        'oneshot': bench_oneshot(args.runner, args.script, payload, args.iterations),
+        'worker': bench_worker(args.runner, args.script, payload, args.iterations, fork=False),
+        'fork': bench_worker(args.runner, args.script, payload, args.iterations, fork=True),
+    }
+
+    print(f'{args.script} ({args.iterations} requests, runner={args.runner})')
+    for mode, summary in results.items():
+        print(f'  {mode:<8} ' + '  '.join(f'{key}={value}' for key, value in summary.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 # /// script
 # dependencies = [
 #   "polars",
+#   "orjson",
 # ]
 # ///
 
@@ -10,44 +11,48 @@
 # ADR-0010: no-magic-numbers, functional style, structured logging.
 
 import json
-import os
 import sys
-from datetime import datetime
+import time
 from typing import Any, Dict, List, Optional
 
-RPC_VERSION = '2.0'
+from data_ingest import DATA_FORMATS, data_format_of, iter_input_records
+from json_codec import encode_json_lines, loads, send_rpc_error, send_rpc_result, write_payload
+from analytics_logging import open_debug_log
+from stage_metrics import StageMetrics
+
 RPC_ERROR_METHOD_NOT_FOUND = -32601
 RPC_ERROR_INVALID_PARAMS = -32602
 RPC_ERROR_INTERNAL = -32603
 DATASET_TAG = '_dataset'
 
-DEBUG_LOG_FILE = os.path.join(os.path.dirname(__file__), 'cross_module_debug.log')
+metrics = StageMetrics()
 
+def send_error(code: int, message: str) -> None:
+    send_rpc_error(code, message)
+    sys.exit(1)
 
-def debug_log(message: str) -> None:
-    try:
-        with open(DEBUG_LOG_FILE, 'a', encoding='utf-8') as f:
-            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
-            f.write(f'[{timestamp}] {message}\n')
-    except Exception:
-        pass
 
+def send_rpc_ok(payload: bytes = b'') -> None:
+    """Send the success header (with per-stage metrics), then the already encoded records."""
+    send_rpc_result('ok', metrics.summary())
+    if payload:
+        write_payload(payload)
 
-def send_error(code: int, message: str) -> None:
-    response = json.dumps({
-        'jsonrpc': RPC_VERSION,
-        'error': {'code': code, 'message': message},
-    })
-    print(response, flush=True)
-    sys.exit(1)
 
+def send_records(records: List[Dict[str, Any]], prefixes: List[str]) -> None:
+    with metrics.stage('serialize') as counts:
+        payload = encode_json_lines(output_record(record, prefixes) for record in records)
+        counts['rows'] = len(records)
+        counts['bytes'] = len(payload)
+    send_rpc_ok(payload)
 
-def send_rpc_ok() -> None:
-    rpc_response = json.dumps({
-        'jsonrpc': RPC_VERSION,
-        'result': 'ok',
-    })
-    print(rpc_response, flush=True)
+
+def output_record(record: Dict[str, Any], prefixes: List[str]) -> Dict[str, Any]:
+    """Strip internal tags from a record before it is written."""
+    record.pop(DATASET_TAG, None)
+    for prefix in prefixes:
+        record.pop(f'_rel_{prefix}_matches', None)
+    return record
 
 
 def extract_nested_value(record: Dict[str, Any], field_path: str) -> Any:
@@ -284,23 +289,18 @@ def expand_records_for_relations(
 
 # --- Main execution ---
 
-try:
-    with open(DEBUG_LOG_FILE, 'w', encoding='utf-8') as f:
-        f.write(f'=== Cross Module Join Debug Log - Started at {datetime.now().strftime("%Y-%m-%d %H:%M:%S")} ===\n')
-except Exception:
-    pass
-
-request_line = sys.stdin.readline()
+request_line = sys.stdin.buffer.readline()
 if not request_line:
     sys.exit(1)
 
 try:
-    request = json.loads(request_line)
+    request = loads(request_line)
 except json.JSONDecodeError as e:
     send_error(RPC_ERROR_INTERNAL, f'Invalid JSON in RPC request: {str(e)}')
 
 method = request.get('method')
 params = request.get('params', {})
+debug_log = open_debug_log('cross_module_join', request)
 
 if method != 'aggregate':
     send_error(RPC_ERROR_METHOD_NOT_FOUND, f'Method not found: {method}')
@@ -315,21 +315,15 @@ if not parent_dataset:
 if not relations:
     relations = []
 
+if data_format_of(params) not in DATA_FORMATS:
+    send_error(RPC_ERROR_INVALID_PARAMS, f'Unsupported data format: {data_format_of(params)}')
+
 debug_log(f'Config: parentDataset={parent_dataset}, relations={len(relations)}')
 
+# Records stay row-oriented: relations are resolved per document and outputs keep the whole record
 datasets: Dict[str, List[Dict[str, Any]]] = {}
-for line in sys.stdin:
-    stripped = line.strip()
-    if not stripped:
-        continue
-    try:
-        record = json.loads(stripped)
-        tag = record.get(DATASET_TAG, parent_dataset)
-        if tag not in datasets:
-            datasets[tag] = []
-        datasets[tag].append(record)
-    except json.JSONDecodeError:
-        debug_log(f'Skipping invalid JSON line: {stripped[:100]}')
+for record in iter_input_records(sys.stdin.buffer, params, on_invalid=lambda line: debug_log(f'Skipping invalid JSON line: {line[:100]!r}'), metrics=metrics):
+    datasets.setdefault(record.get(DATASET_TAG, parent_dataset), []).append(record)
 
 parent_records = datasets.get(parent_dataset, [])
 debug_log(f'Read datasets: {", ".join(f"{k}={len(v)}" for k, v in datasets.items())}')
@@ -340,6 +334,7 @@ if len(parent_records) == 0:
     sys.exit(0)
 
 try:
+    join_started = time.perf_counter()
     prefixes = []
     for relation in relations:
         process_relation(parent_records, relation, datasets)
@@ -351,8 +346,10 @@ try:
 
     if relations and group_by_fields:
         parent_records = expand_records_for_relations(parent_records, group_by_fields, root_aggregators, relations)
+    metrics.add('join', time.perf_counter() - join_started, rows=len(parent_records))
 
     if group_by_fields:
+        aggregate_started = time.perf_counter()
         grouped: Dict[str, List[Dict[str, Any]]] = {}
         for record in parent_records:
             key_parts = []
@@ -374,20 +371,11 @@ try:
                 agg_field = agg_config.get('field')
                 row[agg_alias] = apply_aggregator(agg_name, agg_field, records_in_group)
             aggregated_records.append(row)
+        metrics.add('aggregate', time.perf_counter() - aggregate_started, rows=len(parent_records))
 
-        send_rpc_ok()
-        for record in aggregated_records:
-            record.pop(DATASET_TAG, None)
-            for prefix in prefixes:
-                record.pop(f'_rel_{prefix}_matches', None)
-            print(json.dumps(record, default=str), flush=True)
+        send_records(aggregated_records, prefixes)
     else:
-        send_rpc_ok()
-        for record in parent_records:
-            record.pop(DATASET_TAG, None)
-            for prefix in prefixes:
-                record.pop(f'_rel_{prefix}_matches', None)
-            print(json.dumps(record, default=str), flush=True)
+        send_records(parent_records, prefixes)
 
 except Exception as e:
     debug_log(f'Error during processing: {str(e)}')
@@ -0,0 +1,335 @@
+# data_ingest.py
+# Shared data ingestion for the analytics scripts (pivot, graph, KPI and cross-module join).
+# NDJSON (default): stdin is read in large binary chunks and each chunk is parsed straight into
+# a polars record batch with the native JSON reader, instead of allocating one Python dict per line.
+# Arrow (params.dataFormat == 'arrow'): stdin carries an Arrow IPC stream, or params.dataPath points
+# to an Arrow IPC file that polars memory-maps, so no text decoding happens at all.
+# Scripts must read their RPC request line from the same binary stream (sys.stdin.buffer),
+# since a text wrapper reads ahead and would swallow the first data lines.
+# Batch readers accept `columns`, the top-level fields the caller reads: NDJSON chunks are scanned with
+# that projection, so unreferenced fields are not materialized (see field_projection.py).
+# Chunks the native reader rejects (invalid lines, or a field whose type differs between documents, such
+# as a lookup stored as an object in some and a list in others) are decoded line by line and built
+# leniently: a column whose values share no type is flattened into dot-path columns with the rules of
+# field_projection.py (a list of objects contributes its first element), the last resort being its text.
+# Booleans keep the text the per-line reader gives them ('True') in every path: a column mixing them with
+# other plain values is built as text, and chunks the native reader read with a boolean turned into
+# 'true'/'false' text (a field that also holds strings) take the per-line path too.
+# Readers accept an optional StageMetrics and record their work under the 'read' (stream I/O,
+# with bytes) and 'decode' (parsing, with rows) stages.
+# ADR-0010: no-magic-numbers, functional style.
+
+import io
+import json
+from typing import Any, BinaryIO, Callable, Collection, Dict, Iterator, List, Optional
+
+import polars as pl
+import polars.selectors as cs
+
+from field_projection import PATH_SEP
+from json_codec import loads
+from stage_metrics import StageMetrics
+
+INGEST_CHUNK_BYTES = 8 * 1024 * 1024
+ARROW_BATCH_ROWS = 64 * 1024
+NEWLINE = b'\n'
+DATA_FORMAT_NDJSON = 'ndjson'
+DATA_FORMAT_ARROW = 'arrow'
+DATA_FORMATS = (DATA_FORMAT_NDJSON, DATA_FORMAT_ARROW)
+BOOLEAN_TEXTS = ('true', 'false')
+
+
+def timed_read(stream: BinaryIO, chunk_bytes: int, metrics: StageMetrics) -> bytes:
+    with metrics.stage('read') as counts:
+        block = stream.read(chunk_bytes)
+        counts['bytes'] = len(block)
+    return block
+
+
+def iter_ndjson_chunks(stream: BinaryIO, chunk_bytes: int = INGEST_CHUNK_BYTES, metrics: Optional[StageMetrics] = None) -> Iterator[bytes]:
+    """Yield blocks of complete NDJSON lines read from a binary stream."""
+    metrics = metrics or StageMetrics()
+    pending = b''
+    for block in iter(lambda: timed_read(stream, chunk_bytes, metrics), b''):
+        cut = block.rfind(NEWLINE)
+        if cut == -1:
+            pending += block
+            continue
+        yield pending + block[:cut + 1]
+        pending = block[cut + 1:]
+
+    if pending.strip():
+        yield pending
+
+
+def iter_chunk_records(chunk: bytes, on_invalid: Optional[Callable[[bytes], None]] = None) -> Iterator[Dict[str, Any]]:
+    """Decode the lines of one chunk one by one, skipping blank and invalid lines."""
+    for line in chunk.splitlines():
+        if not line.strip():
+            continue
+        try:
+            yield loads(line)
+        except json.JSONDecodeError:
+            if on_invalid is not None:
+                on_invalid(line)
+
+
+def project_columns(frame: pl.DataFrame, columns: Optional[Collection[str]]) -> pl.DataFrame:
+    """Keep only the given top-level columns (those present). A frame left without columns keeps its height,
+    so documents that lack every referenced field are still counted."""
+    if columns is None:
+        return frame
+    projected = frame.select(cs.by_name(columns, require_all=False))
+    return projected if projected.width else pl.DataFrame(height=frame.height)
+
+
+def is_objects(value: Any) -> bool:
+    return isinstance(value, list) and bool(value) and isinstance(value[0], dict)
+
+
+def flatten_value(name: str, value: Any) -> Dict[str, Any]:
+    """Dot-path leaves of one value: objects are walked, a non-empty list of objects contributes its
+    first element and null leaves are left out."""
+    if is_objects(value):
+        value = value[0]
+    if not isinstance(value, dict):
+        return {} if value is None else {name: value}
+    return {path: leaf for key, item in value.items() for path, leaf in flatten_value(f'{name}{PATH_SEP}{key}', item).items()}
+
+
+def value_kind(value: Any) -> type:
+    return list if is_objects(value) else dict if isinstance(value, dict) else object
+
+
+def scalar_kind(value: Any) -> type:
+    return float if isinstance(value, (int, float)) and not isinstance(value, bool) else type(value)
+
+
+def text_series(name: str, values: List[Any]) -> pl.Series:
+    return pl.Series(name, [None if value is None else str(value) for value in values], dtype=pl.String)
+
+
+def lenient_series(name: str, values: List[Any]) -> List[pl.Series]:
+    """Series of one column; the dot-path leaves of its values when they mix objects, lists of objects
+    and plain values (or polars can't type them), their text when even those can't be typed or when
+    booleans or strings share the column with other plain values (polars would cast True to 1 or 'true')."""
+    kinds = {value_kind(value) for value in values if value is not None}
+    if len(kinds) > 1 and kinds != {object}:
+        return lenient_columns([flatten_value(name, value) for value in values])
+    if kinds == {object} and len({scalar_kind(value) for value in values if value is not None}) > 1:
+        return [text_series(name, values)]
+    try:
+        series = pl.Series(name, values, strict=False)
+        if series.dtype != pl.Object and not has_boolean_text(series.to_frame()):
+            return [series]
+    except pl.exceptions.PolarsError:
+        pass
+    if kinds != {object}:
+        return lenient_columns([flatten_value(name, value) for value in values])
+    return [text_series(name, values)]
+
+
+def lenient_columns(records: List[Dict[str, Any]]) -> List[pl.Series]:
+    names = dict.fromkeys(name for record in records for name in record)
+    return [series for name in names for series in lenient_series(name, [record.get(name) for record in records])]
+
+
+def records_frame(records: List[Dict[str, Any]], columns: Optional[Collection[str]] = None) -> pl.DataFrame:
+    """Frame of decoded documents restricted to the top-level `columns` when given, built column by
+    column so that documents disagreeing on the type of a field can't fail it."""
+    if columns is not None:
+        records = [{name: value for name, value in record.items() if name in columns} for record in records]
+    series = lenient_columns(records)
+    return pl.DataFrame(series) if series else pl.DataFrame(height=len(records))
+
+
+def string_leaves(frame: pl.DataFrame) -> List[pl.Series]:
+    """String columns of a frame, fields of struct columns included."""
+    return [
+        leaf
+        for series in frame.get_columns()
+        for leaf in ([series] if series.dtype == pl.String else string_leaves(series.struct.unnest()) if isinstance(series.dtype, pl.Struct) else [])
+    ]
+
+
+def has_boolean_text(frame: pl.DataFrame) -> bool:
+    """Whether a String column holds 'true' or 'false', the text the native reader gives booleans of a
+    field that also holds strings."""
+    return any(leaf.is_in(BOOLEAN_TEXTS).any() for leaf in string_leaves(frame))
+
+
+def count_lines(chunk: bytes) -> int:
+    return sum(1 for line in chunk.splitlines() if line.strip())
+
+
+def parse_ndjson_batch(
+    chunk: bytes,
+    on_invalid: Optional[Callable[[bytes], None]] = None,
+    columns: Optional[Collection[str]] = None,
+) -> pl.DataFrame:
+    """Parse one chunk into a DataFrame with the native reader, projected to `columns` when given.
+    Falls back to per-line decoding (records_frame) when the reader rejects the chunk, or read booleans
+    as text (has_boolean_text)."""
+    try:
+        if columns is None:
+            frame = pl.read_ndjson(io.BytesIO(chunk), infer_schema_length=None)
+        else:
+            projected = pl.scan_ndjson(io.BytesIO(chunk), infer_schema_length=None).select(cs.by_name(columns, require_all=False)).collect()
+            frame = projected if projected.width else pl.DataFrame(height=count_lines(chunk))
+        if not has_boolean_text(frame):
+            return frame
+    except pl.exceptions.PolarsError:
+        pass
+    return records_frame(list(iter_chunk_records(chunk, on_invalid)), columns)
+
+
+def iter_ndjson_batches(
+    stream: BinaryIO,
+    chunk_bytes: int = INGEST_CHUNK_BYTES,
+    on_invalid: Optional[Callable[[bytes], None]] = None,
+    metrics: Optional[StageMetrics] = None,
+    columns: Optional[Collection[str]] = None,
+) -> Iterator[pl.DataFrame]:
+    """Yield one polars record batch per chunk of the stream, restricted to `columns` when given."""
+    metrics = metrics or StageMetrics()
+    for chunk in iter_ndjson_chunks(stream, chunk_bytes, metrics):
+        with metrics.stage('decode') as counts:
+            batch = parse_ndjson_batch(chunk, on_invalid, columns)
+            counts['rows'] = batch.height
+        if batch.height > 0:
+            yield batch
+
+
+def read_ndjson_frame(
+    stream: BinaryIO,
+    chunk_bytes: int = INGEST_CHUNK_BYTES,
+    on_invalid: Optional[Callable[[bytes], None]] = None,
+    metrics: Optional[StageMetrics] = None,
+) -> pl.DataFrame:
+    """Read the whole stream into a single DataFrame.
+    Batches are concatenated diagonally, so fields missing from a batch become nulls
+    and diverging types are promoted to a common supertype."""
+    metrics = metrics or StageMetrics()
+    batches: List[pl.DataFrame] = list(iter_ndjson_batches(stream, chunk_bytes, on_invalid, metrics))
+    if not batches:
+        return pl.DataFrame()
+    if len(batches) == 1:
+        return batches[0]
+    with metrics.stage('decode'):
+        return pl.concat(batches, how='diagonal_relaxed')
+
+
+def iter_ndjson_records(
+    stream: BinaryIO,
+    chunk_bytes: int = INGEST_CHUNK_BYTES,
+    on_invalid: Optional[Callable[[bytes], None]] = None,
+    metrics: Optional[StageMetrics] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Yield one dict per line for consumers that need whole documents (e.g. cross-module joins).
+    Each chunk is decoded before its records are yielded, so 'decode' excludes the consumer's time."""
+    metrics = metrics or StageMetrics()
+    for chunk in iter_ndjson_chunks(stream, chunk_bytes, metrics):
+        with metrics.stage('decode') as counts:
+            records = list(iter_chunk_records(chunk, on_invalid))
+            counts['rows'] = len(records)
+        yield from records
+
+
+def read_arrow_frame(stream: BinaryIO, data_path: Optional[str] = None, metrics: Optional[StageMetrics] = None) -> pl.DataFrame:
+    """Read an Arrow payload: the IPC file at data_path (memory-mapped by polars) or an IPC stream."""
+    with (metrics or StageMetrics()).stage('read') as counts:
+        frame = load_arrow_frame(stream, data_path)
+        counts['rows'] = frame.height
+    return frame
+
+
+def load_arrow_frame(stream: BinaryIO, data_path: Optional[str]) -> pl.DataFrame:
+    if data_path:
+        return pl.read_ipc(data_path)
+    try:
+        return pl.read_ipc_stream(stream)
+    except pl.exceptions.NoDataError:
+        return pl.DataFrame()
+
+
+def compact_record(value: Any) -> Any:
+    """Drop null fields from a row, recursively, so Arrow rows match the documents sent as NDJSON."""
+    if isinstance(value, dict):
+        return {k: compact_record(v) for k, v in value.items() if v is not None}
+    if isinstance(value, list):
+        return [compact_record(v) for v in value]
+    return value
+
+
+def data_format_of(params: Dict[str, Any]) -> str:
+    """Data format requested in the RPC params (NDJSON when absent)."""
+    return params.get('dataFormat') or DATA_FORMAT_NDJSON
+
+
+def is_arrow_input(params: Dict[str, Any]) -> bool:
+    return data_format_of(params) == DATA_FORMAT_ARROW
+
+
+def iter_input_batches(
+    stream: BinaryIO,
+    params: Dict[str, Any],
+    on_invalid: Optional[Callable[[bytes], None]] = None,
+    metrics: Optional[StageMetrics] = None,
+    columns: Optional[Collection[str]] = None,
+) -> Iterator[pl.DataFrame]:
+    """Yield record batches from the payload in the format selected by the RPC params,
+    restricted to the top-level `columns` when given."""
+    if not is_arrow_input(params):
+        yield from iter_ndjson_batches(stream, on_invalid=on_invalid, metrics=metrics, columns=columns)
+        return
+
+    frame = project_columns(read_arrow_frame(stream, params.get('dataPath'), metrics), columns)
+    yield from (batch for batch in frame.iter_slices(ARROW_BATCH_ROWS) if batch.height > 0)
+
+
+def read_input_frame(
+    stream: BinaryIO,
+    params: Dict[str, Any],
+    on_invalid: Optional[Callable[[bytes], None]] = None,
+    metrics: Optional[StageMetrics] = None,
+) -> pl.DataFrame:
+    """Read the whole payload into a single DataFrame in the format selected by the RPC params."""
+    if is_arrow_input(params):
+        return read_arrow_frame(stream, params.get('dataPath'), metrics)
+    return read_ndjson_frame(stream, on_invalid=on_invalid, metrics=metrics)
+
+
+def iter_input_records(
+    stream: BinaryIO,
+    params: Dict[str, Any],
+    on_invalid: Optional[Callable[[bytes], None]] = None,
+    metrics: Optional[StageMetrics] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Yield one dict per document in the format selected by the RPC params."""
+    if not is_arrow_input(params):
+        yield from iter_ndjson_records(stream, on_invalid=on_invalid, metrics=metrics)
+        return
+
+    for batch in iter_input_batches(stream, params, metrics=metrics):
+        yield from (compact_record(row) for row in batch.iter_rows(named=True))
+
+
+def nested_field_expr(schema: pl.Schema, field_path: str) -> Optional[pl.Expr]:
+    """Build an expression for a dot-notation path through struct columns (e.g. 'value.amount').
+    Returns None when the path does not exist in the schema."""
+    if field_path in schema:
+        return pl.col(field_path)
+
+    root, *parts = field_path.split('.')
+    dtype = schema.get(root)
+    expr = pl.col(root)
+    for part in parts:
+        if not isinstance(dtype, pl.Struct):
+            return None
+        fields = {f.name: f.dtype for f in dtype.fields}
+        if part not in fields:
+            return None
+        expr = expr.struct.field(part)
+        dtype = fields[part]
+
+    return expr if dtype is not None else None
@@ -0,0 +1,227 @@
+# /// script
+# dependencies = [
+#   "polars",
+#   "pytest",
+# ]
+# ///
+
+"""
+Tests for data_ingest.py
+Run with: uv run --script pytest data_ingest.test.py
+"""
+
+import io
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import polars as pl
+
+sys.path.insert(0, str(Path(__file__).parent))
+from data_ingest import (  # noqa: E402
+    iter_input_batches,
+    iter_input_records,
+    iter_ndjson_batches,
+    iter_ndjson_chunks,
+    iter_ndjson_records,
+    nested_field_expr,
+    parse_ndjson_batch,
+    read_input_frame,
+    read_ndjson_frame,
+)
+
+SCRIPTS_DIR = Path(__file__).parent
+SMALL_CHUNK_BYTES = 64
+SUBPROCESS_TIMEOUT = 60
+ARROW_PARAMS = {'dataFormat': 'arrow'}
+
+
+def arrow_stream(records: list) -> io.BytesIO:
+    """Helper: builds a binary Arrow IPC stream."""
+    payload = io.BytesIO()
+    pl.DataFrame(records).write_ipc_stream(payload)
+    payload.seek(0)
+    return payload
+
+
+def run_script(script: str, rpc_request: dict, payload: bytes) -> list:
+    """Helper: runs an analytics script with the RPC line followed by a binary payload."""
+    result = subprocess.run(
+        ['uv', 'run', '--script', str(SCRIPTS_DIR / script)],
+        input=json.dumps(rpc_request).encode('utf-8') + b'\n' + payload,
+        capture_output=True,
+        timeout=SUBPROCESS_TIMEOUT,
+    )
+    return [json.loads(line) for line in result.stdout.decode('utf-8').splitlines() if line.strip()]
+
+
+def ndjson(records: list) -> io.BytesIO:
+    """Helper: builds a binary NDJSON stream."""
+    return io.BytesIO(('\n'.join(json.dumps(r) for r in records) + '\n').encode('utf-8'))
+
+
+RECORDS = [{'_id': str(i), 'status': 'Nova' if i % 2 else 'Ganha', 'value': {'amount': i, 'currency': 'BRL'}} for i in range(50)]
+
+
+def test_chunks_end_on_line_boundaries():
+    chunks = list(iter_ndjson_chunks(ndjson(RECORDS), SMALL_CHUNK_BYTES))
+
+    assert len(chunks) > 1
+    assert all(chunk.endswith(b'\n') for chunk in chunks)
+    assert b''.join(chunks) == ndjson(RECORDS).getvalue()
+
+
+def test_chunks_keep_last_line_without_newline():
+    chunks = list(iter_ndjson_chunks(io.BytesIO(b'{"a": 1}\n{"a": 2}'), SMALL_CHUNK_BYTES))
+
+    assert b''.join(chunks) == b'{"a": 1}\n{"a": 2}'
+
+
+def test_reads_all_batches_into_one_frame():
+    df = read_ndjson_frame(ndjson(RECORDS), SMALL_CHUNK_BYTES)
+
+    assert df.height == len(RECORDS)
+    assert df['_id'].to_list() == [r['_id'] for r in RECORDS]
+
+
+def test_unifies_fields_missing_from_some_batches():
+    records = [{'a': 1}] * 10 + [{'a': 2, 'b': {'c': 'x'}}]
+    df = read_ndjson_frame(ndjson(records), SMALL_CHUNK_BYTES)
+
+    assert df.height == len(records)
+    assert df['b'].struct.field('c').to_list() == [None] * 10 + ['x']
+
+
+def test_skips_invalid_lines():
+    stream = io.BytesIO(b'{"a": 1}\nnot json\n{"a": 2}\n')
+    invalid = []
+    df = read_ndjson_frame(stream, on_invalid=invalid.append)
+
+    assert df['a'].to_list() == [1, 2]
+    assert invalid == [b'not json']
+
+
+def test_flattens_fields_whose_type_differs_between_documents():
+    records = [
+        {'status': 'Nova', 'owner': {'_id': 'u1', 'name': 'Ana'}, 'value': 1},
+        {'status': 'Nova', 'owner': [{'_id': 'u2', 'name': 'Bia'}], 'value': {'value': 2}},
+        {'status': 'Ganha', 'value': 3},
+    ]
+    batches = list(iter_ndjson_batches(ndjson(records), columns={'owner', 'value'}))
+
+    assert len(batches) == 1
+    assert batches[0].to_dict(as_series=False) == {
+        'owner._id': ['u1', 'u2', None],
+        'owner.name': ['Ana', 'Bia', None],
+        'value': [1, None, 3],
+        'value.value': [None, 2, None],
+    }
+
+
+def test_pivot_table_reads_lookups_stored_as_object_or_list():
+    records = [
+        {'status': 'Nova', 'owner': {'_id': 'u1', 'name': 'Ana'}, 'value': 1},
+        {'status': 'Nova', 'owner': [{'_id': 'u2', 'name': 'Bia'}], 'value': 2},
+        {'status': 'Ganha', 'owner': [{'_id': 'u1', 'name': 'Ana'}], 'value': 4},
+    ]
+    config = {'rows': [{'field': 'owner', 'lookup': {'simpleFields': ['name']}}], 'values': [{'field': 'value', 'aggregator': 'sum'}]}
+    lines = run_script('pivot_table.py', {'jsonrpc': '2.0', 'method': 'pivot', 'params': {'config': config}}, ndjson(records).getvalue())
+
+    assert lines[0]['result']['status'] == 'success'
+    assert [(node['key'], node['label'], node['totals']) for node in lines[1]['data']] == [('u1', 'Ana', {'value': 5.0}), ('u2', 'Bia', {'value': 2.0})]
+
+
+def test_booleans_mixed_with_other_types_keep_their_text_in_every_reader():
+    # Strings and booleans are read natively (as 'true'), integers and booleans are rejected by it
+    readable = parse_ndjson_batch(b'{"flag": "a"}\n{"flag": true}\n{"owner": {"active": false}}\n{"owner": {"active": "no"}}\n')
+    rejected = parse_ndjson_batch(b'{"flag": 1}\n{"flag": true}\n')
+
+    assert readable['flag'].to_list() == ['a', 'True', None, None]
+    assert readable['owner.active'].to_list() == [None, None, 'False', 'no']
+    assert rejected['flag'].to_list() == ['1', 'True']
+
+
+def test_pivot_table_keys_keep_the_text_of_mixed_type_fields():
+    records = [
+        {'p': 1, 'flag': 'a', 'value': 1},
+        {'p': 2.5, 'flag': 1, 'value': 2},
+        {'p': 3, 'flag': True, 'value': 4},
+        {'p': 4, 'flag': True, 'value': 8},
+    ]
+    config = {'rows': [{'field': 'p'}], 'columns': [{'field': 'flag'}], 'values': [{'field': 'value', 'aggregator': 'sum'}]}
+    lines = run_script('pivot_table.py', {'jsonrpc': '2.0', 'method': 'pivot', 'params': {'config': config}}, ndjson(records).getvalue())
+
+    assert lines[0]['result']['status'] == 'success'
+    assert [(node['key'], node['label']) for node in lines[1]['data']] == [('1', '1'), ('2.5', '2.5'), ('3', '3'), ('4', '4')]
+    assert sorted(header['key'] for header in lines[1]['columnHeaders']) == ['1', 'True', 'a']
+
+
+def test_empty_stream_returns_empty_frame():
+    assert read_ndjson_frame(io.BytesIO(b'')).height == 0
+    assert list(iter_ndjson_batches(io.BytesIO(b'\n\n'))) == []
+
+
+def test_iterates_records_as_dicts():
+    records = list(iter_ndjson_records(ndjson(RECORDS), SMALL_CHUNK_BYTES))
+
+    assert records == RECORDS
+
+
+def test_nested_field_expr_walks_struct_columns():
+    df = read_ndjson_frame(ndjson(RECORDS))
+
+    expr = nested_field_expr(df.schema, 'value.amount')
+    assert df.select(expr.alias('amount'))['amount'].sum() == sum(range(50))
+    assert nested_field_expr(df.schema, 'value.missing') is None
+    assert nested_field_expr(df.schema, 'status.name') is None
+    assert nested_field_expr(pl.Schema({'status': pl.String}), 'status') is not None
+
+
+def test_arrow_stream_matches_ndjson():
+    arrow_df = read_input_frame(arrow_stream(RECORDS), ARROW_PARAMS)
+    ndjson_df = read_input_frame(ndjson(RECORDS), {})
+
+    assert arrow_df.equals(ndjson_df)
+    assert sum(batch.height for batch in iter_input_batches(arrow_stream(RECORDS), ARROW_PARAMS)) == len(RECORDS)
+
+
+def test_arrow_file_path(tmp_path):
+    data_path = tmp_path / 'data.arrow'
+    pl.DataFrame(RECORDS).write_ipc(data_path)
+
+    df = read_input_frame(io.BytesIO(b''), {**ARROW_PARAMS, 'dataPath': str(data_path)})
+    assert df['_id'].to_list() == [r['_id'] for r in RECORDS]
+
+
+def test_arrow_records_drop_null_fields():
+    records = [{'_id': '1', 'contact': {'_id': 'c1', 'name': None}}, {'_id': '2', 'contact': None}]
+
+    assert list(iter_input_records(arrow_stream(records), ARROW_PARAMS)) == [{'_id': '1', 'contact': {'_id': 'c1'}}, {'_id': '2'}]
+
+
+def test_empty_arrow_stream_returns_empty_frame():
+    assert read_input_frame(io.BytesIO(b''), ARROW_PARAMS).height == 0
+
+
+def test_kpi_aggregator_reads_arrow_stream():
+    request = {'jsonrpc': '2.0', 'method': 'aggregate', 'params': {'config': {'operation': 'sum', 'field': 'value.amount'}, **ARROW_PARAMS}}
+    lines = run_script('kpi_aggregator.py', request, arrow_stream(RECORDS).getvalue())
+
+    assert lines[1]['result'] == float(sum(range(50)))
+
+
+def test_pivot_table_arrow_matches_ndjson():
+    config = {'rows': [{'field': 'status'}], 'values': [{'field': 'value.amount', 'aggregator': 'sum'}]}
+    from_ndjson = run_script('pivot_table.py', {'jsonrpc': '2.0', 'method': 'pivot', 'params': {'config': config}}, ndjson(RECORDS).getvalue())
+    from_arrow = run_script('pivot_table.py', {'jsonrpc': '2.0', 'method': 'pivot', 'params': {'config': config, **ARROW_PARAMS}}, arrow_stream(RECORDS).getvalue())
+
+    assert from_arrow[0]['result'] == from_ndjson[0]['result']
+    assert from_arrow[1:] == from_ndjson[1:]
+
+
+def test_rejects_unknown_data_format():
+    request = {'jsonrpc': '2.0', 'method': 'aggregate', 'params': {'config': {'operation': 'sum', 'field': 'amount'}, 'dataFormat': 'csv'}}
+    lines = run_script('kpi_aggregator.py', request, b'')
+
+    assert lines[0]['error']['code'] == -32602
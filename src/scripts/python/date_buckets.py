@@ -0,0 +1,187 @@
+# date_buckets.py
+# Vectorized date parsing and date buckets for pivot columns. A date column is parsed once per field as
+# a polars Series and every bucket (ExtJS formats) is a datetime expression over it, instead of a regex,
+# fromisoformat/strptime and strftime call per record:
+#   - canonical ISO strings (what the backend sends: '2024-01-15T10:00:00.000Z', '2024-01-15') are
+#     parsed by polars; any other string falls back to parse_date_value, once per distinct value
+#   - month and day names come from strftime (process locale, as before) once per month/weekday
+#   - without a timezone dates keep their written wall time (offsets are dropped, as before); with an
+#     IANA timezone, date-times are read as instants (offset, 'Z' or UTC when absent) and bucketed in
+#     that timezone, while date-only values stay calendar dates
+# ADR-0010: no-magic-numbers, functional style.
+
+import re
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional
+
+import polars as pl
+
+NO_DATE_LABEL = '--'
+UTC = 'UTC'
+DATE_TIME_SEP = 'T'
+UTC_SUFFIX = 'Z'
+OFFSET_PATTERN = r'([+-])(\d{2}):(\d{2})$'
+# Shapes polars parses exactly like fromisoformat/strptime; anything else takes the per-value fallback
+ISO_DATETIME_PATTERN = r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:[0-5]\d(\.\d{1,6})?$'
+ISO_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S%.f'
+ISO_DATE_PATTERN = r'^\d{4}-\d{2}-\d{2}$'
+ISO_DATE_FORMAT = '%Y-%m-%d'
+SECONDS_PER_HOUR = 3600
+SECONDS_PER_MINUTE = 60
+MONTHS = range(1, 13)
+# polars weekday(): 1 = Monday ... 7 = Sunday
+WEEKDAYS = range(1, 8)
+REFERENCE_YEAR = 2000
+REFERENCE_MONDAY = datetime(2024, 1, 1)
+DATES = '__dates'
+PARSED_DATETIMES = '__datetimes'
+
+
+def parse_date_value(value: Any) -> Optional[datetime]:
+    """Parse a date value from various formats"""
+    if value is None:
+        return None
+
+    if isinstance(value, datetime):
+        return value
+
+    if isinstance(value, str):
+        # Try ISO format with timezone
+        try:
+            # Remove timezone suffix for parsing
+            clean_value = re.sub(r'[+-]\d{2}:\d{2}$', '', value)
+            clean_value = clean_value.replace('Z', '')
+
+            if 'T' in clean_value:
+                return datetime.fromisoformat(clean_value)
+            return datetime.strptime(clean_value, '%Y-%m-%d')
+        except Exception:
+            pass
+
+    return None
+
+
+def is_valid_timezone(timezone: str) -> bool:
+    """Whether polars knows the IANA timezone name."""
+    try:
+        pl.Series([None], dtype=pl.Datetime).dt.replace_time_zone(timezone)
+        return True
+    except Exception:
+        return False
+
+
+def to_timezone(expr: pl.Expr, timezone: str) -> pl.Expr:
+    """Wall time in timezone of naive UTC date-times."""
+    return expr.dt.replace_time_zone(UTC).dt.convert_time_zone(timezone).dt.replace_time_zone(None)
+
+
+def utc_offset_seconds(strings: pl.Expr) -> pl.Expr:
+    """Trailing '+HH:MM'/'-HH:MM' offset of a date string in seconds (0 without one, as with 'Z')."""
+    parts = strings.str.extract_groups(OFFSET_PATTERN)
+    sign = pl.when(parts.struct.field('1') == '-').then(-1).otherwise(1)
+    hours = parts.struct.field('2').cast(pl.Int64)
+    minutes = parts.struct.field('3').cast(pl.Int64)
+    return (sign * (hours * SECONDS_PER_HOUR + minutes * SECONDS_PER_MINUTE)).fill_null(0)
+
+
+def parse_fallback(strings: pl.Series) -> Dict[str, Optional[datetime]]:
+    """Wall times of strings outside the canonical shapes, parsed by parse_date_value once each; aware
+    results keep their written wall time, as format_date_bucket did."""
+    parsed = {value: parse_date_value(value) for value in strings.unique().to_list()}
+    return {value: date.replace(tzinfo=None) if date else None for value, date in parsed.items()}
+
+
+def parse_date_strings(strings: pl.Series, timezone: Optional[str]) -> pl.Series:
+    """Naive date-times of a string column: the written wall time, or with a timezone the wall time in
+    it (date-only values are not shifted)."""
+    frame = pl.DataFrame({DATES: strings})
+    clean = pl.col(DATES).str.replace(OFFSET_PATTERN, '').str.replace_all(UTC_SUFFIX, '', literal=True)
+    has_time = clean.str.contains(DATE_TIME_SEP, literal=True)
+    parsed = frame.select(
+        pl.when(has_time & clean.str.contains(ISO_DATETIME_PATTERN))
+        .then(clean.str.to_datetime(ISO_DATETIME_FORMAT, time_unit='us', strict=False))
+        .when(~has_time & clean.str.contains(ISO_DATE_PATTERN))
+        .then(clean.str.to_date(ISO_DATE_FORMAT, strict=False).cast(pl.Datetime('us')))
+        .alias(DATES)
+    ).to_series()
+
+    unparsed = strings.filter(parsed.is_null() & strings.is_not_null())
+    if unparsed.len():
+        fallback = strings.replace_strict(parse_fallback(unparsed), default=None, return_dtype=pl.Datetime('us'))
+        parsed = parsed.fill_null(fallback)
+
+    if not timezone:
+        return parsed
+    shifted = pl.col(PARSED_DATETIMES) - pl.duration(seconds=utc_offset_seconds(pl.col(DATES)))
+    return (
+        frame.with_columns(parsed.alias(PARSED_DATETIMES))
+        .select(pl.when(has_time).then(to_timezone(shifted, timezone)).otherwise(pl.col(PARSED_DATETIMES)).alias(DATES))
+        .to_series()
+    )
+
+
+def parse_dates(values: pl.Series, timezone: Optional[str] = None) -> pl.Series:
+    """Naive date-times (null when not a date) of a column, one row per value."""
+    dtype = values.dtype
+    if dtype == pl.String:
+        return parse_date_strings(values, timezone)
+    if isinstance(dtype, pl.Datetime):
+        dates = pl.col(DATES)
+        if dtype.time_zone:
+            dates = (dates.dt.convert_time_zone(timezone) if timezone else dates).dt.replace_time_zone(None)
+        elif timezone:
+            dates = to_timezone(dates, timezone)
+        return pl.DataFrame({DATES: values}).select(dates.cast(pl.Datetime('us'))).to_series()
+    if dtype == pl.Date:
+        return values.cast(pl.Datetime('us'))
+    return pl.Series(values.name, [None] * values.len(), dtype=pl.Datetime('us'))
+
+
+def name_lookup(part: pl.Expr, names: Dict[int, str]) -> pl.Expr:
+    return part.replace_strict(names, return_dtype=pl.String)
+
+
+def month_names(strftime_format: str) -> Callable[[pl.Expr], pl.Expr]:
+    names = {month: datetime(REFERENCE_YEAR, month, 1).strftime(strftime_format) for month in MONTHS}
+    return lambda dates: name_lookup(dates.dt.month(), names)
+
+
+def weekday_names(strftime_format: str) -> Callable[[pl.Expr], pl.Expr]:
+    names = {weekday: (REFERENCE_MONDAY + timedelta(days=weekday - 1)).strftime(strftime_format) for weekday in WEEKDAYS}
+    return lambda dates: name_lookup(dates.dt.weekday(), names)
+
+
+# Bucket formats (matching ExtJS date formats)
+BUCKET_EXPRESSIONS: Dict[str, Callable[[pl.Expr], pl.Expr]] = {
+    # Day of month with leading zero (01-31)
+    'd': lambda dates: dates.dt.strftime('%d'),
+    # Day of month without leading zero (1-31)
+    'j': lambda dates: dates.dt.day().cast(pl.String),
+    # ISO week number
+    'W': lambda dates: dates.dt.week().cast(pl.String),
+    # Month with leading zero (01-12)
+    'm': lambda dates: dates.dt.strftime('%m'),
+    # Month without leading zero (1-12)
+    'n': lambda dates: dates.dt.month().cast(pl.String),
+    # Full year (2026)
+    'Y': lambda dates: dates.dt.year().cast(pl.String),
+    # Short month name (Jan, Feb, etc.)
+    'M': month_names('%b'),
+    # Full month name (January, February, etc.)
+    'F': month_names('%B'),
+    # Short day name (Mon, Tue, etc.)
+    'D': weekday_names('%a'),
+    # Full day name (Monday, Tuesday, etc.)
+    'l': weekday_names('%A'),
+}
+
+
+def iso_date(dates: pl.Expr) -> pl.Expr:
+    """Default bucket: ISO date (year not zero-padded, like strftime)."""
+    return pl.concat_str([dates.dt.year().cast(pl.String), dates.dt.strftime('-%m-%d')])
+
+
+def bucket_labels(dates: pl.Series, bucket: str) -> pl.Series:
+    """Bucket value of every date, NO_DATE_LABEL for nulls."""
+    expression = BUCKET_EXPRESSIONS.get(bucket, iso_date)
+    return pl.DataFrame({DATES: dates}).select(expression(pl.col(DATES)).fill_null(NO_DATE_LABEL)).to_series()
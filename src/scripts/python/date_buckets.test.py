@@ -0,0 +1,80 @@
+# /// script
+# dependencies = [
+#   "polars",
+#   "pytest",
+# ]
+# ///
+
+"""
+Tests for date_buckets.py
+Run with: uv run --script pytest date_buckets.test.py
+"""
+
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import polars as pl
+
+sys.path.insert(0, str(Path(__file__).parent))
+from date_buckets import NO_DATE_LABEL, bucket_labels, is_valid_timezone, parse_date_value, parse_dates  # noqa: E402
+
+TIMEZONE = 'America/Sao_Paulo'
+
+
+def buckets(values: list, bucket: str, timezone: str = None) -> list:
+    return bucket_labels(parse_dates(pl.Series(values), timezone), bucket).to_list()
+
+
+def test_buckets_format_like_extjs():
+    values = ['2024-03-05T10:00:00.000Z', '2024-12-29', None]
+
+    assert buckets(values, 'd') == ['05', '29', NO_DATE_LABEL]
+    assert buckets(values, 'j') == ['5', '29', NO_DATE_LABEL]
+    assert buckets(values, 'W') == ['10', '52', NO_DATE_LABEL]
+    assert buckets(values, 'm') == ['03', '12', NO_DATE_LABEL]
+    assert buckets(values, 'n') == ['3', '12', NO_DATE_LABEL]
+    assert buckets(values, 'Y') == ['2024', '2024', NO_DATE_LABEL]
+    assert buckets(values, 'M') == ['Mar', 'Dec', NO_DATE_LABEL]
+    assert buckets(values, 'F') == ['March', 'December', NO_DATE_LABEL]
+    assert buckets(values, 'D') == ['Tue', 'Sun', NO_DATE_LABEL]
+    assert buckets(values, 'l') == ['Tuesday', 'Sunday', NO_DATE_LABEL]
+    assert buckets(values, 'Q') == ['2024-03-05', '2024-12-29', NO_DATE_LABEL]
+
+
+def test_strings_outside_iso_shapes_are_parsed_like_parse_date_value():
+    values = ['2024-1-5', '2024-01-15T10', '2024-01-15T23:59:60', '2024-02-30', '2024-01-15T10:00:00+0300', 'abc', '']
+
+    expected = [parse_date_value(value) for value in values]
+    assert parse_dates(pl.Series(values)).to_list() == [date.replace(tzinfo=None) if date else None for date in expected]
+    assert buckets(values, 'Y') == ['2024', '2024', NO_DATE_LABEL, NO_DATE_LABEL, '2024', NO_DATE_LABEL, NO_DATE_LABEL]
+
+
+def test_without_timezone_offsets_are_dropped():
+    assert buckets(['2024-01-01T01:00:00.000+02:00', '2023-12-31T23:30:00Z'], 'Y') == ['2024', '2023']
+
+
+def test_timezone_buckets_instants_and_keeps_calendar_dates():
+    values = ['2024-01-01T02:00:00.000Z', '2024-01-01T01:00:00+02:00', '2024-01-01T12:00:00', '2024-01-01']
+
+    # UTC-3: the first two instants are still 2023 in São Paulo, the date-only value is not shifted
+    assert buckets(values, 'Y', TIMEZONE) == ['2023', '2023', '2024', '2024']
+    assert parse_dates(pl.Series(values), TIMEZONE).to_list()[1] == datetime(2023, 12, 31, 20, 0)
+
+
+def test_datetime_columns_keep_wall_time_or_convert():
+    aware = pl.Series([datetime(2024, 1, 1, 1, 0)]).dt.replace_time_zone('Europe/Berlin')
+    naive = pl.Series([datetime(2024, 1, 1, 1, 0)])
+
+    assert buckets(aware, 'Y') == ['2024']
+    assert buckets(aware, 'Y', TIMEZONE) == ['2023']
+    assert buckets(naive, 'Y', TIMEZONE) == ['2023']
+
+
+def test_non_date_columns_have_no_date():
+    assert buckets([1, 2], 'Y') == [NO_DATE_LABEL, NO_DATE_LABEL]
+
+
+def test_is_valid_timezone():
+    assert is_valid_timezone(TIMEZONE)
+    assert not is_valid_timezone('Mars/Olympus')
@@ -0,0 +1,139 @@
+# field_projection.py
+# Config-driven field projection for pivot_table.py and graph_generator.py.
+# The scripts only read the fields their config references, so instead of flattening every key of
+# every document they:
+#   1. ask data_ingest for the referenced top-level columns only (projection pushed into the reader)
+#   2. pivot: project the exact dot paths it reads (row/column keys and lookup labels, values)
+#      graph: flatten the referenced subtrees whole, since resolve_field may pick any 'field.*' column
+# Flattening is done with polars expressions over the struct columns of each batch, with the dot-path
+# column names the scripts rely on ('field._id', 'field.name') and the semantics of the former Python
+# flatten_dict: structs are walked, a list of structs contributes its first element (an empty one is
+# kept as its own value), structs are never values and null keys are left out.
+# ADR-0010: no-magic-numbers, functional style.
+
+from typing import Any, Dict, Iterable, List, Set
+
+import polars as pl
+
+PATH_SEP = '.'
+DEFAULT_LOOKUP_SIMPLE_FIELDS = ('name',)
+LOOKUP_ID = '_id'
+
+
+def root_field(path: str) -> str:
+    return path.split(PATH_SEP, 1)[0]
+
+
+def root_fields(paths: Iterable[str]) -> Set[str]:
+    return {root_field(path) for path in paths}
+
+
+def axis_field_paths(meta: Dict[str, Any]) -> List[str]:
+    """Paths read for one pivot row/column: its key (_id for lookups) and its label."""
+    field = meta['field']
+    paths = [field, f'{field}{PATH_SEP}{LOOKUP_ID}']
+    lookup_config = meta.get('lookup')
+    if not lookup_config:
+        return paths
+
+    simple_fields = lookup_config.get('simpleFields', list(DEFAULT_LOOKUP_SIMPLE_FIELDS))
+    nested_fields = lookup_config.get('nestedFields', [])
+    return [
+        *paths,
+        *(f'{field}{PATH_SEP}{sf}' for sf in simple_fields),
+        *(f'{field}{PATH_SEP}{nf}' for nf in nested_fields),
+        *(f'{field}{PATH_SEP}{nf.replace(PATH_SEP, "_")}' for nf in nested_fields),
+    ]
+
+
+def pivot_field_paths(config: Dict[str, Any]) -> List[str]:
+    """Every flattened path pivot_table.py reads: rows, columns (with lookup simpleFields /
+    nestedFields) and values. Order is stable and duplicates are removed."""
+    axes = [*config.get('rows', []), *(config.get('columns') or [])]
+    paths = [path for meta in axes for path in axis_field_paths(meta)]
+    paths.extend(value_meta['field'] for value_meta in config.get('values', []))
+    return list(dict.fromkeys(paths))
+
+
+def graph_field_roots(config: Dict[str, Any]) -> Set[str]:
+    """Top-level fields graph_generator.py may resolve: categoryField, xAxis, yAxis and series fields.
+    categoryField is also tried without its leading underscores, like the script does."""
+    fields = [
+        config.get('categoryField'),
+        (config.get('xAxis') or {}).get('field'),
+        (config.get('yAxis') or {}).get('field'),
+        *((serie or {}).get('field') for serie in config.get('series') or []),
+    ]
+    category_field = config.get('categoryField')
+    if category_field:
+        fields.append(category_field.lstrip('_'))
+    return root_fields(field for field in fields if field)
+
+
+def is_struct_list(dtype: Any) -> bool:
+    return isinstance(dtype, pl.List) and isinstance(dtype.inner, pl.Struct)
+
+
+def empty_list_expr(expr: pl.Expr) -> pl.Expr:
+    """An empty list of objects is kept as the value of its own key; non-empty ones are flattened."""
+    return pl.when(expr.list.len() == 0).then(expr)
+
+
+def path_expr(schema: pl.Schema, path: str) -> pl.Expr:
+    """Expression for the value a dot path has in the flattened document (null when absent). Batches
+    data_ingest built leniently may hold the path as a column of its own."""
+    if PATH_SEP in path and path in schema:
+        return pl.col(path).alias(path)
+    root, *parts = path.split(PATH_SEP)
+    if root not in schema:
+        return pl.lit(None).alias(path)
+
+    expr, dtype = pl.col(root), schema[root]
+    for part in parts:
+        if is_struct_list(dtype):
+            expr, dtype = expr.list.first(), dtype.inner
+        fields = dtype.to_schema() if isinstance(dtype, pl.Struct) else {}
+        if part not in fields:
+            return pl.lit(None).alias(path)
+        expr, dtype = expr.struct.field(part), fields[part]
+
+    if is_struct_list(dtype):
+        return empty_list_expr(expr).alias(path)
+    if isinstance(dtype, pl.Struct):
+        return pl.lit(None).alias(path)
+    return expr.alias(path)
+
+
+def project_paths(frame: pl.DataFrame, paths: List[str]) -> pl.DataFrame:
+    """Frame with one column per dot path, in `paths` order. with_columns (not select) keeps the height
+    of batches that have none of the referenced fields."""
+    return frame.with_columns(path_expr(frame.schema, path) for path in paths).select(paths)
+
+
+def leaf_exprs(expr: pl.Expr, dtype: Any, name: str) -> List[pl.Expr]:
+    if isinstance(dtype, pl.Null):
+        return []
+    if is_struct_list(dtype):
+        return [empty_list_expr(expr).alias(name), *leaf_exprs(expr.list.first(), dtype.inner, name)]
+    if isinstance(dtype, pl.Struct):
+        return [leaf for f in dtype.fields for leaf in leaf_exprs(expr.struct.field(f.name), f.dtype, f'{name}{PATH_SEP}{f.name}')]
+    return [expr.alias(name)]
+
+
+def flatten_frame(frame: pl.DataFrame) -> pl.DataFrame:
+    """Every leaf of every column as a dot-path column (the whole-document flatten, vectorized)."""
+    leaves = [leaf for name, dtype in frame.schema.items() for leaf in leaf_exprs(pl.col(name), dtype, name)]
+    return frame.select(leaves) if leaves else pl.DataFrame(height=frame.height)
+
+
+def concat_flat_frames(frames: List[pl.DataFrame]) -> pl.DataFrame:
+    """Concatenate flattened batches, keeping the rows of batches without columns, and drop columns that
+    are null in every row (a flattened document never holds null keys)."""
+    template = pl.concat([frame.clear() for frame in frames if frame.width], how='diagonal_relaxed') if any(frame.width for frame in frames) else None
+    if template is None:
+        return pl.DataFrame(height=sum(frame.height for frame in frames))
+
+    combined = pl.concat([frame if frame.width else template.clear(frame.height) for frame in frames], how='diagonal_relaxed')
+    null_counts = combined.null_count().row(0)
+    kept = [name for name, nulls in zip(combined.columns, null_counts) if nulls < combined.height]
+    return combined.select(kept) if kept else pl.DataFrame(height=combined.height)
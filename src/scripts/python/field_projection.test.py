@@ -0,0 +1,203 @@
+# /// script
+# dependencies = [
+#   "polars",
+#   "pytest",
+# ]
+# ///
+
+"""
+Tests for field_projection.py
+Run with: uv run --script pytest field_projection.test.py
+"""
+
+import io
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import polars as pl
+
+sys.path.insert(0, str(Path(__file__).parent))
+from data_ingest import iter_ndjson_batches  # noqa: E402
+from field_projection import (  # noqa: E402
+    concat_flat_frames,
+    flatten_frame,
+    graph_field_roots,
+    pivot_field_paths,
+    project_paths,
+    root_fields,
+)
+
+SCRIPTS_DIR = Path(__file__).parent
+SUBPROCESS_TIMEOUT = 60
+
+DOCUMENT = {
+    '_id': 'o1',
+    'status': 'Nova',
+    'value': {'value': 10.5, 'currency': 'BRL'},
+    '_user': [{'_id': 'u1', 'name': 'Ana', 'group': {'_id': 'g1', 'name': 'Vendas'}}, {'_id': 'u2', 'name': 'Bia'}],
+    'tags': ['a', 'b'],
+    'product': [],
+    'unused': {'deep': {'deeper': 1}},
+}
+DOCUMENTS = [
+    DOCUMENT,
+    {'_id': 'o2', 'value': {'value': 3, 'currency': None}, '_user': [], 'product': [{'_id': 'p1', 'name': 'Casa'}], 'contact': None},
+    {'_id': 'o3', 'status': None, 'tags': []},
+]
+
+
+def reference_flatten(d: dict, parent_key: str = '') -> dict:
+    """Helper: the Python flatten_dict the scripts used before vectorized flattening."""
+    items = {}
+    for k, v in d.items():
+        key = f'{parent_key}.{k}' if parent_key else k
+        if v is None:
+            continue
+        if isinstance(v, dict):
+            items.update(reference_flatten(v, key))
+        elif isinstance(v, list) and v and isinstance(v[0], dict):
+            items.update(reference_flatten(v[0], key))
+        else:
+            items[key] = v
+    return items
+
+
+def ndjson(records: list) -> io.BytesIO:
+    """Helper: builds a binary NDJSON stream."""
+    return io.BytesIO(('\n'.join(json.dumps(r) for r in records) + '\n').encode('utf-8'))
+
+
+def run_script_raw(script: str, rpc_request: dict, records: list) -> str:
+    """Helper: runs an analytics script with the RPC line followed by NDJSON records; returns stdout."""
+    result = subprocess.run(
+        ['uv', 'run', '--script', str(SCRIPTS_DIR / script)],
+        input=json.dumps(rpc_request).encode('utf-8') + b'\n' + ndjson(records).getvalue(),
+        capture_output=True,
+        timeout=SUBPROCESS_TIMEOUT,
+    )
+    return result.stdout.decode('utf-8')
+
+
+def run_script(script: str, rpc_request: dict, records: list) -> list:
+    """Helper: runs an analytics script and parses every output line as JSON."""
+    return [json.loads(line) for line in run_script_raw(script, rpc_request, records).splitlines() if line.strip()]
+
+
+def read_batch(records: list):
+    """Helper: one batch as the native NDJSON reader types it."""
+    return next(iter_ndjson_batches(ndjson(records)))
+
+
+def test_flatten_frame_matches_flatten():
+    flat = concat_flat_frames([flatten_frame(read_batch(DOCUMENTS))])
+
+    rows = [{key: value for key, value in row.items() if value is not None} for row in flat.iter_rows(named=True)]
+    assert rows == [reference_flatten(document) for document in DOCUMENTS]
+    assert flat.columns[:2] == ['_id', 'status']
+    assert 'contact' not in flat.columns
+
+
+def test_project_paths_match_flatten():
+    paths = ['status', '_user._id', '_user.group.name', 'value.value', 'product', 'product.name', 'tags', 'value', '_user', 'missing', 'status.name']
+    projected = project_paths(read_batch(DOCUMENTS), paths)
+
+    assert projected.columns == paths
+    assert projected.to_dicts() == [{path: reference_flatten(document).get(path) for path in paths} for document in DOCUMENTS]
+
+
+def test_project_paths_keep_height_without_fields():
+    assert project_paths(read_batch([{'a': 1}] * 3), ['missing', 'other.field']).shape == (3, 2)
+
+
+def test_concat_flat_frames_keeps_rows_of_batches_without_columns():
+    frames = [flatten_frame(read_batch([{'a': 1}])), pl.DataFrame(height=2), flatten_frame(read_batch([{'b': {'c': 'x'}}]))]
+    combined = concat_flat_frames(frames)
+
+    assert combined.to_dicts() == [{'a': 1, 'b.c': None}, {'a': None, 'b.c': None}, {'a': None, 'b.c': None}, {'a': None, 'b.c': 'x'}]
+    assert concat_flat_frames([pl.DataFrame(height=2)]).shape == (2, 0)
+
+
+def test_pivot_field_paths_cover_rows_columns_values_and_lookups():
+    config = {
+        'rows': [{'field': 'status'}, {'field': '_user', 'lookup': {'simpleFields': ['name'], 'nestedFields': ['group.name']}}],
+        'columns': [{'field': 'type'}],
+        'values': [{'field': 'value.value', 'aggregator': 'sum'}, {'field': 'status', 'aggregator': 'count'}],
+    }
+
+    paths = pivot_field_paths(config)
+    assert paths == [
+        'status',
+        'status._id',
+        '_user',
+        '_user._id',
+        '_user.name',
+        '_user.group.name',
+        '_user.group_name',
+        'type',
+        'type._id',
+        'value.value',
+    ]
+    assert root_fields(paths) == {'status', '_user', 'type', 'value'}
+
+
+def test_pivot_lookup_defaults_to_name():
+    paths = pivot_field_paths({'rows': [{'field': 'contact', 'lookup': {}}], 'values': []})
+
+    assert paths == ['contact', 'contact._id']
+    assert pivot_field_paths({'rows': [{'field': 'contact', 'lookup': {'nestedFields': []}}], 'values': []})[-1] == 'contact.name'
+
+
+def test_graph_field_roots():
+    config = {
+        'categoryField': '_user',
+        'xAxis': {'field': '_createdAt', 'bucket': 'M'},
+        'yAxis': {'field': 'value.value'},
+        'series': [{'field': 'probability'}, {'aggregation': 'count'}],
+    }
+
+    assert graph_field_roots(config) == {'_user', 'user', '_createdAt', 'value', 'probability'}
+    assert graph_field_roots({}) == set()
+
+
+def test_batches_are_projected_to_requested_columns():
+    batches = list(iter_ndjson_batches(ndjson([DOCUMENT, {'_id': 'o2'}]), columns={'status', 'value', 'missing'}))
+    frame = batches[0]
+
+    assert sorted(frame.columns) == ['status', 'value']
+    assert frame.height == 2
+    assert frame['value'].struct.field('value').to_list() == [10.5, None]
+
+
+def test_batches_keep_height_without_matching_columns():
+    batches = list(iter_ndjson_batches(ndjson([DOCUMENT] * 3), columns={'missing'}))
+
+    assert [(batch.width, batch.height) for batch in batches] == [(0, 3)]
+
+
+def test_batches_projected_on_invalid_line_fallback():
+    stream = io.BytesIO(b'{"a": 1, "b": 2}\nnot json\n{"a": 3, "b": 4}\n')
+    batches = list(iter_ndjson_batches(stream, on_invalid=lambda line: None, columns={'a'}))
+
+    assert batches[0].columns == ['a']
+    assert batches[0]['a'].to_list() == [1, 3]
+
+
+def test_pivot_ignores_unreferenced_fields():
+    config = {'rows': [{'field': 'status'}], 'values': [{'field': 'value.value', 'aggregator': 'sum'}]}
+    request = {'jsonrpc': '2.0', 'method': 'pivot', 'params': {'config': config}}
+    lean = [{'status': 'Nova', 'value': {'value': 1}}, {'status': 'Ganha', 'value': {'value': 2}}]
+    wide = [{**DOCUMENT, **record} for record in lean]
+
+    assert run_script('pivot_table.py', request, wide)[1:] == run_script('pivot_table.py', request, lean)[1:]
+
+
+def test_graph_null_lookup_does_not_shadow_label_columns():
+    config = {'type': 'bar', 'categoryField': 'campaign', 'aggregation': 'count', 'yAxis': {'field': '_id'}}
+    request = {'jsonrpc': '2.0', 'method': 'graph', 'params': {'config': config}}
+    records = [{'_id': '1', 'campaign': {'_id': 'c1', 'name': 'Campanha A'}}, {'_id': '2'}]
+
+    header, svg = run_script_raw('graph_generator.py', request, records).split('\n', 1)
+    assert json.loads(header)['result']['status'] == 'success'
+    assert 'Campanha A' in svg
@@ -1,6 +1,7 @@
 # /// script
 # dependencies = [
 #   "polars",
+#   "orjson",
 #   "pandas",
 #   "matplotlib",
 #   "pyarrow",
@@ -9,8 +10,8 @@
 
 # graph_generator.py
 import sys
-import json
 import io
+import time
 import polars as pl
 import pandas as pd
 import matplotlib
@@ -18,37 +19,38 @@ matplotlib.use('Agg')  # Use non-interactive backend
 import matplotlib.pyplot as plt
 from typing import Dict, Any, Optional
 
+from data_ingest import DATA_FORMATS, data_format_of, iter_input_batches
+from json_codec import loads, send_rpc_error, send_rpc_result, write_payload
+from stage_metrics import StageMetrics
+from field_projection import concat_flat_frames, flatten_frame, graph_field_roots
+
 # Constants for data labels (ADR-0012: no-magic-numbers)
 SHOW_DATA_LABELS_PADDING = 3
 DATA_LABEL_FONT_SIZE = 8
 ZERO_VALUE = 0
 
+metrics = StageMetrics()
+
 # 1. Read RPC request from first line of stdin
-request_line = sys.stdin.readline()
+request_line = sys.stdin.buffer.readline()
 if not request_line:
     sys.exit(1)
 
-request = json.loads(request_line)
+request = loads(request_line)
 method = request.get('method')
 params = request.get('params', {})
 
 if method != 'graph':
-    error_response = json.dumps({
-        'jsonrpc': '2.0',
-        'error': {'code': -32601, 'message': 'Method not found'}
-    })
-    print(error_response, flush=True)
+    send_rpc_error(-32601, 'Method not found')
+    sys.exit(1)
+
+if data_format_of(params) not in DATA_FORMATS:
+    send_rpc_error(-32602, f'Unsupported data format: {data_format_of(params)}')
     sys.exit(1)
 
 graph_config = params.get('config', {})
 graph_lang = params.get('lang', 'pt_BR')
 
-# 2. Read NDJSON data from remaining stdin
-data = []
-for line in sys.stdin:
-    if line.strip():
-        data.append(json.loads(line))
-
 # 3. Helper function to resolve field names (handles lookup fields with _id suffix)
 def resolve_field(field_name, available_columns):
     """Resolve field name, trying description fields for lookups if needed"""
@@ -149,37 +151,32 @@ def apply_date_bucket(df: pl.DataFrame, field: str, bucket: str) -> tuple[pl.Dat
     
     return df, bucket_col
 
-# 4. Flatten nested objects to support dot notation fields
-def flatten_dict(d, parent_key='', sep='.'):
-    """Flatten nested dictionary with dot notation"""
-    items = []
-    for k, v in d.items():
-        new_key = f'{parent_key}{sep}{k}' if parent_key else k
-        if isinstance(v, dict):
-            items.extend(flatten_dict(v, new_key, sep=sep).items())
-        elif isinstance(v, list) and len(v) > 0 and isinstance(v[0], dict):
-            # Handle arrays of objects - take first element
-            if len(v) > 0:
-                items.extend(flatten_dict(v[0], new_key, sep=sep).items())
-            else:
-                items.append((new_key, None))
-        else:
-            items.append((new_key, v))
-    return dict(items)
-
-# Flatten all records
-flattened_data = [flatten_dict(record) for record in data]
+# 4. Read data (NDJSON or Arrow) from remaining stdin as columnar batches and flatten each batch's struct
+# columns into dot-path columns, so the raw documents are never held as a full list of dicts. Only the
+# top-level fields the config references (categoryField, xAxis, yAxis, series) are read; their subtrees
+# are flattened whole because resolve_field may pick any 'field.*' column of a lookup
+flat_frames = []
+try:
+    for batch in iter_input_batches(sys.stdin.buffer, params, metrics=metrics, columns=graph_field_roots(graph_config)):
+        with metrics.stage('flatten') as counts:
+            flat_frames.append(flatten_frame(batch))
+            counts['rows'] = batch.height
+except Exception as e:
+    send_rpc_error(-32603, f'Error reading graph data: {str(e)}')
+    sys.exit(1)
 
 # 5. Convert to Polars DataFrame
-if not flattened_data:
-    error_response = json.dumps({
-        'jsonrpc': '2.0',
-        'error': {'code': -32602, 'message': 'No data provided for graph'}
-    })
-    print(error_response, flush=True)
+if not flat_frames:
+    send_rpc_error(-32602, 'No data provided for graph')
     sys.exit(1)
 
-df_polars = pl.DataFrame(flattened_data, strict=False)
+try:
+    with metrics.stage('dataframe') as counts:
+        df_polars = concat_flat_frames(flat_frames)
+        counts['rows'] = df_polars.height
+except Exception as e:
+    send_rpc_error(-32603, f'Error reading graph data: {str(e)}')
+    sys.exit(1)
 
 # 6. Extract configuration
 graph_type = graph_config.get('type')
@@ -201,6 +198,7 @@ show_grid = graph_config.get('showGrid', True)
 show_data_labels = graph_config.get('showDataLabels', False)
 
 # 7. Apply aggregations in Polars (fast)
+aggregate_started = time.perf_counter()
 # Check if we're using series (new) or yAxis+aggregation (legacy)
 # For pie charts, always use category_field + aggregation (ignore series)
 # IMPORTANT: Pie charts should NEVER use series mode, even if series are configured
@@ -225,11 +223,7 @@ if category_field:
         else:
             # Field not found - this will be caught later, but log available columns for debugging
             available_cols_str = ', '.join(list(available_columns)[:10])
-            error_response = json.dumps({
-                'jsonrpc': '2.0',
-                'error': {'code': -32602, 'message': f'Category field not found: {category_field}. Available: [{available_cols_str}]'}
-            })
-            print(error_response, flush=True)
+            send_rpc_error(-32602, f'Category field not found: {category_field}. Available: [{available_cols_str}]')
             sys.exit(1)
     
     # Apply bucket to category_field if specified
@@ -247,11 +241,7 @@ if category_field:
                 # List all available columns for debugging
                 available_cols = list(df_polars.columns)
                 available_cols_str = ', '.join([f"'{c}'" for c in available_cols])
-                error_response = json.dumps({
-                    'jsonrpc': '2.0',
-                    'error': {'code': -32602, 'message': f'Category field not found for bucket: {category_field}. Available: [{available_cols_str}]'}
-                })
-                print(error_response, flush=True)
+                send_rpc_error(-32602, f'Category field not found for bucket: {category_field}. Available: [{available_cols_str}]')
                 sys.exit(1)
         
         # Now apply the bucket
@@ -260,11 +250,7 @@ if category_field:
             # category_field now points to the bucketed column name (e.g., _createdAt_bucket)
         else:
             available_cols_str = ', '.join([f"'{c}'" for c in list(df_polars.columns)])
-            error_response = json.dumps({
-                'jsonrpc': '2.0',
-                'error': {'code': -32602, 'message': f'Category field not in DataFrame for bucket: {category_field}. Available: [{available_cols_str}]'}
-            })
-            print(error_response, flush=True)
+            send_rpc_error(-32602, f'Category field not in DataFrame for bucket: {category_field}. Available: [{available_cols_str}]')
             sys.exit(1)
 
 if use_series:
@@ -272,31 +258,19 @@ if use_series:
     # IMPORTANT: Pie charts should NEVER use this block - they use category_field + aggregation instead
     # Double-check that we're not processing a pie chart
     if graph_type and graph_type.lower() == 'pie':
-        error_response = json.dumps({
-            'jsonrpc': '2.0',
-            'error': {'code': -32602, 'message': 'Pie charts should use categoryField + aggregation, not series'}
-        })
-        print(error_response, flush=True)
+        send_rpc_error(-32602, 'Pie charts should use categoryField + aggregation, not series')
         sys.exit(1)
     
     x_field = x_axis.get('field') or category_field
     if not x_field:
-        error_response = json.dumps({
-            'jsonrpc': '2.0',
-            'error': {'code': -32602, 'message': 'xAxis.field is required when using series'}
-        })
-        print(error_response, flush=True)
+        send_rpc_error(-32602, 'xAxis.field is required when using series')
         sys.exit(1)
     
     # Resolve x_field
     available_columns = df_polars.columns
     resolved_x_field = resolve_field(x_field, available_columns)
     if not resolved_x_field:
-        error_response = json.dumps({
-            'jsonrpc': '2.0',
-            'error': {'code': -32602, 'message': f'Field not found: {x_field}. Available: {list(available_columns)[:10]}'}
-        })
-        print(error_response, flush=True)
+        send_rpc_error(-32602, f'Field not found: {x_field}. Available: {list(available_columns)[:10]}')
         sys.exit(1)
     x_field = resolved_x_field
     
@@ -306,11 +280,7 @@ if use_series:
         original_x_field = x_field
         df_polars, x_field = apply_date_bucket(df_polars, x_field, x_axis_bucket)
         if x_field == original_x_field:
-            error_response = json.dumps({
-                'jsonrpc': '2.0',
-                'error': {'code': -32602, 'message': f'Failed to apply date bucket {x_axis_bucket} to xAxis.field: {original_x_field}'}
-            })
-            print(error_response, flush=True)
+            send_rpc_error(-32602, f'Failed to apply date bucket {x_axis_bucket} to xAxis.field: {original_x_field}')
             sys.exit(1)
         # Atualizar x_axis['field'] para usar o campo bucketed na renderização
         x_axis['field'] = x_field
@@ -323,21 +293,13 @@ if use_series:
         serie_label = serie.get('label', serie_field)
         
         if not serie_field:
-            error_response = json.dumps({
-                'jsonrpc': '2.0',
-                'error': {'code': -32602, 'message': f'Series {idx} is missing field'}
-            })
-            print(error_response, flush=True)
+            send_rpc_error(-32602, f'Series {idx} is missing field')
             sys.exit(1)
         
         # Resolve serie field
         resolved_serie_field = resolve_field(serie_field, available_columns)
         if not resolved_serie_field:
-            error_response = json.dumps({
-                'jsonrpc': '2.0',
-                'error': {'code': -32602, 'message': f'Field not found: {serie_field}'}
-            })
-            print(error_response, flush=True)
+            send_rpc_error(-32602, f'Field not found: {serie_field}')
             sys.exit(1)
         serie_field = resolved_serie_field
         
@@ -390,11 +352,7 @@ elif category_field and aggregation:
         x_label_for_agg = x_axis.get('label') or x_field
     
     if not y_field:
-        error_response = json.dumps({
-            'jsonrpc': '2.0',
-            'error': {'code': -32602, 'message': 'yAxis.field is required when using aggregation'}
-        })
-        print(error_response, flush=True)
+        send_rpc_error(-32602, 'yAxis.field is required when using aggregation')
         sys.exit(1)
     
     # Validate fields exist (check both direct field and _id variant for lookups)
@@ -423,11 +381,7 @@ elif category_field and aggregation:
     
     if missing_fields:
         available_cols_str = ', '.join([f"'{c}'" for c in list(available_columns)[:15]])
-        error_response = json.dumps({
-            'jsonrpc': '2.0',
-            'error': {'code': -32602, 'message': f'Fields not found in data: {", ".join(missing_fields)}. Available: [{available_cols_str}]'}
-        })
-        print(error_response, flush=True)
+        send_rpc_error(-32602, f'Fields not found in data: {", ".join(missing_fields)}. Available: [{available_cols_str}]')
         sys.exit(1)
     
     # Apply bucket to x_field if specified
@@ -436,11 +390,7 @@ elif category_field and aggregation:
         original_x_field = x_field
         df_polars, x_field = apply_date_bucket(df_polars, x_field, x_axis_bucket)
         if x_field == original_x_field:
-            error_response = json.dumps({
-                'jsonrpc': '2.0',
-                'error': {'code': -32602, 'message': f'Failed to apply date bucket {x_axis_bucket} to xAxis.field: {original_x_field}'}
-            })
-            print(error_response, flush=True)
+            send_rpc_error(-32602, f'Failed to apply date bucket {x_axis_bucket} to xAxis.field: {original_x_field}')
             sys.exit(1)
         # Atualizar x_axis['field'] para usar o campo bucketed na renderização
         x_axis['field'] = x_field
@@ -465,21 +415,13 @@ elif aggregation and not category_field:
     # Aggregation without grouping (single value result)
     y_field = y_axis.get('field')
     if not y_field:
-        error_response = json.dumps({
-            'jsonrpc': '2.0',
-            'error': {'code': -32602, 'message': 'yAxis.field is required when using aggregation'}
-        })
-        print(error_response, flush=True)
+        send_rpc_error(-32602, 'yAxis.field is required when using aggregation')
         sys.exit(1)
     
     # Resolve y_field (try _id variant for lookups)
     resolved_y = resolve_field(y_field, df_polars.columns)
     if not resolved_y:
-        error_response = json.dumps({
-            'jsonrpc': '2.0',
-            'error': {'code': -32602, 'message': f'Field not found: {y_field}'}
-        })
-        print(error_response, flush=True)
+        send_rpc_error(-32602, f'Field not found: {y_field}')
         sys.exit(1)
     
     y_field = resolved_y
@@ -562,7 +504,10 @@ if cat_col and cat_col in df_pandas.columns:
     df_pandas[cat_col] = df_pandas[cat_col].replace('', empty_label)
     df_pandas[cat_col] = df_pandas[cat_col].replace('null', empty_label)
 
+metrics.add('aggregate', time.perf_counter() - aggregate_started, rows=len(df_pandas))
+
 # 9. Generate chart with matplotlib
+render_started = time.perf_counter()
 plt.figure(figsize=(width / 100, height / 100), dpi=100)
 plt.rcParams['svg.fonttype'] = 'none'  # Use text instead of paths for better scalability
 
@@ -571,21 +516,13 @@ try:
         x_field = x_axis.get('field') or category_field
         
         if not x_field:
-            error_response = json.dumps({
-                'jsonrpc': '2.0',
-                'error': {'code': -32602, 'message': 'xAxis.field is required for bar chart'}
-            })
-            print(error_response, flush=True)
+            send_rpc_error(-32602, 'xAxis.field is required for bar chart')
             sys.exit(1)
         
         # Resolve x_field
         resolved_x = resolve_field(x_field, df_pandas.columns)
         if not resolved_x:
-            error_response = json.dumps({
-                'jsonrpc': '2.0',
-                'error': {'code': -32602, 'message': f'Field not found: {x_field}'}
-            })
-            print(error_response, flush=True)
+            send_rpc_error(-32602, f'Field not found: {x_field}')
             sys.exit(1)
         x_field = resolved_x
         
@@ -621,20 +558,12 @@ try:
             # Legacy single series
             y_field = y_axis.get('field')
             if not y_field:
-                error_response = json.dumps({
-                    'jsonrpc': '2.0',
-                    'error': {'code': -32602, 'message': 'yAxis.field is required for bar chart'}
-                })
-                print(error_response, flush=True)
+                send_rpc_error(-32602, 'yAxis.field is required for bar chart')
                 sys.exit(1)
             
             resolved_y = resolve_field(y_field, df_pandas.columns)
             if not resolved_y:
-                error_response = json.dumps({
-                    'jsonrpc': '2.0',
-                    'error': {'code': -32602, 'message': f'Field not found: {y_field}'}
-                })
-                print(error_response, flush=True)
+                send_rpc_error(-32602, f'Field not found: {y_field}')
                 sys.exit(1)
             y_field = resolved_y
             y_label = y_axis.get('label') or y_field
@@ -653,20 +582,12 @@ try:
         x_field = x_axis.get('field')
         
         if not x_field:
-            error_response = json.dumps({
-                'jsonrpc': '2.0',
-                'error': {'code': -32602, 'message': 'xAxis.field is required for line chart'}
-            })
-            print(error_response, flush=True)
+            send_rpc_error(-32602, 'xAxis.field is required for line chart')
             sys.exit(1)
         
         resolved_x = resolve_field(x_field, df_pandas.columns)
         if not resolved_x:
-            error_response = json.dumps({
-                'jsonrpc': '2.0',
-                'error': {'code': -32602, 'message': f'Field not found: {x_field}'}
-            })
-            print(error_response, flush=True)
+            send_rpc_error(-32602, f'Field not found: {x_field}')
             sys.exit(1)
         x_field = resolved_x
         
@@ -691,20 +612,12 @@ try:
             # Legacy single series
             y_field = y_axis.get('field')
             if not y_field:
-                error_response = json.dumps({
-                    'jsonrpc': '2.0',
-                    'error': {'code': -32602, 'message': 'yAxis.field is required for line chart'}
-                })
-                print(error_response, flush=True)
+                send_rpc_error(-32602, 'yAxis.field is required for line chart')
                 sys.exit(1)
             
             resolved_y = resolve_field(y_field, df_pandas.columns)
             if not resolved_y:
-                error_response = json.dumps({
-                    'jsonrpc': '2.0',
-                    'error': {'code': -32602, 'message': f'Field not found: {y_field}'}
-                })
-                print(error_response, flush=True)
+                send_rpc_error(-32602, f'Field not found: {y_field}')
                 sys.exit(1)
             y_field = resolved_y
             y_label = y_axis.get('label') or y_field
@@ -717,28 +630,16 @@ try:
         
     elif graph_type and graph_type.lower() == 'pie':
         if not category_field:
-            error_response = json.dumps({
-                'jsonrpc': '2.0',
-                'error': {'code': -32602, 'message': 'categoryField is required for pie chart'}
-            })
-            print(error_response, flush=True)
+            send_rpc_error(-32602, 'categoryField is required for pie chart')
             sys.exit(1)
         
         y_field = y_axis.get('field')
         if not y_field:
-            error_response = json.dumps({
-                'jsonrpc': '2.0',
-                'error': {'code': -32602, 'message': 'yAxis.field is required for pie chart (values field)'}
-            })
-            print(error_response, flush=True)
+            send_rpc_error(-32602, 'yAxis.field is required for pie chart (values field)')
             sys.exit(1)
         
         if not aggregation:
-            error_response = json.dumps({
-                'jsonrpc': '2.0',
-                'error': {'code': -32602, 'message': 'aggregation is required for pie chart'}
-            })
-            print(error_response, flush=True)
+            send_rpc_error(-32602, 'aggregation is required for pie chart')
             sys.exit(1)
         
         # category_field should already be resolved and bucketed in the pre-resolution step
@@ -750,22 +651,14 @@ try:
             if not resolved_category:
                 # List available columns for debugging
                 available_cols = list(df_pandas.columns)
-                error_response = json.dumps({
-                    'jsonrpc': '2.0',
-                    'error': {'code': -32602, 'message': f'Field not found: {category_field}. Available: {available_cols[:10]}'}
-                })
-                print(error_response, flush=True)
+                send_rpc_error(-32602, f'Field not found: {category_field}. Available: {available_cols[:10]}')
                 sys.exit(1)
             category_field = resolved_category
         
         # Resolve y_field
         resolved_y = resolve_field(y_field, df_pandas.columns)
         if not resolved_y:
-            error_response = json.dumps({
-                'jsonrpc': '2.0',
-                'error': {'code': -32602, 'message': f'Field not found: {y_field}'}
-            })
-            print(error_response, flush=True)
+            send_rpc_error(-32602, f'Field not found: {y_field}')
             sys.exit(1)
         y_field = resolved_y
         
@@ -793,20 +686,12 @@ try:
         x_field = x_axis.get('field')
         
         if not x_field:
-            error_response = json.dumps({
-                'jsonrpc': '2.0',
-                'error': {'code': -32602, 'message': 'xAxis.field is required for scatter chart'}
-            })
-            print(error_response, flush=True)
+            send_rpc_error(-32602, 'xAxis.field is required for scatter chart')
             sys.exit(1)
         
         resolved_x = resolve_field(x_field, df_pandas.columns)
         if not resolved_x:
-            error_response = json.dumps({
-                'jsonrpc': '2.0',
-                'error': {'code': -32602, 'message': f'Field not found: {x_field}'}
-            })
-            print(error_response, flush=True)
+            send_rpc_error(-32602, f'Field not found: {x_field}')
             sys.exit(1)
         x_field = resolved_x
         
@@ -830,20 +715,12 @@ try:
             # Legacy single series
             y_field = y_axis.get('field')
             if not y_field:
-                error_response = json.dumps({
-                    'jsonrpc': '2.0',
-                    'error': {'code': -32602, 'message': 'yAxis.field is required for scatter chart'}
-                })
-                print(error_response, flush=True)
+                send_rpc_error(-32602, 'yAxis.field is required for scatter chart')
                 sys.exit(1)
             
             resolved_y = resolve_field(y_field, df_pandas.columns)
             if not resolved_y:
-                error_response = json.dumps({
-                    'jsonrpc': '2.0',
-                    'error': {'code': -32602, 'message': f'Field not found: {y_field}'}
-                })
-                print(error_response, flush=True)
+                send_rpc_error(-32602, f'Field not found: {y_field}')
                 sys.exit(1)
             y_field = resolved_y
             y_label = y_axis.get('label') or y_field
@@ -857,21 +734,13 @@ try:
         y_field = y_axis.get('field')
         
         if not y_field:
-            error_response = json.dumps({
-                'jsonrpc': '2.0',
-                'error': {'code': -32602, 'message': 'yAxis.field is required for histogram'}
-            })
-            print(error_response, flush=True)
+            send_rpc_error(-32602, 'yAxis.field is required for histogram')
             sys.exit(1)
         
         # Resolve y_field (try _id variant for lookups)
         resolved_y = resolve_field(y_field, df_pandas.columns)
         if not resolved_y:
-            error_response = json.dumps({
-                'jsonrpc': '2.0',
-                'error': {'code': -32602, 'message': f'Field not found: {y_field}'}
-            })
-            print(error_response, flush=True)
+            send_rpc_error(-32602, f'Field not found: {y_field}')
             sys.exit(1)
         y_field = resolved_y
         
@@ -908,20 +777,12 @@ try:
         x_field = x_axis.get('field')
         
         if not x_field:
-            error_response = json.dumps({
-                'jsonrpc': '2.0',
-                'error': {'code': -32602, 'message': 'xAxis.field is required for time series chart'}
-            })
-            print(error_response, flush=True)
+            send_rpc_error(-32602, 'xAxis.field is required for time series chart')
             sys.exit(1)
         
         resolved_x = resolve_field(x_field, df_pandas.columns)
         if not resolved_x:
-            error_response = json.dumps({
-                'jsonrpc': '2.0',
-                'error': {'code': -32602, 'message': f'Field not found: {x_field}'}
-            })
-            print(error_response, flush=True)
+            send_rpc_error(-32602, f'Field not found: {x_field}')
             sys.exit(1)
         x_field = resolved_x
         
@@ -951,20 +812,12 @@ try:
             # Legacy single series
             y_field = y_axis.get('field')
             if not y_field:
-                error_response = json.dumps({
-                    'jsonrpc': '2.0',
-                    'error': {'code': -32602, 'message': 'yAxis.field is required for time series chart'}
-                })
-                print(error_response, flush=True)
+                send_rpc_error(-32602, 'yAxis.field is required for time series chart')
                 sys.exit(1)
             
             resolved_y = resolve_field(y_field, df_pandas.columns)
             if not resolved_y:
-                error_response = json.dumps({
-                    'jsonrpc': '2.0',
-                    'error': {'code': -32602, 'message': f'Field not found: {y_field}'}
-                })
-                print(error_response, flush=True)
+                send_rpc_error(-32602, f'Field not found: {y_field}')
                 sys.exit(1)
             y_field = resolved_y
             y_label = y_axis.get('label') or y_field
@@ -977,11 +830,7 @@ try:
             plt.gcf().autofmt_xdate()
         
     else:
-        error_response = json.dumps({
-            'jsonrpc': '2.0',
-            'error': {'code': -32602, 'message': f'Unsupported graph type: {graph_type}'}
-        })
-        print(error_response, flush=True)
+        send_rpc_error(-32602, f'Unsupported graph type: {graph_type}')
         sys.exit(1)
 
     if show_data_labels and graph_type and graph_type.lower() in ('line', 'scatter', 'timeseries'):
@@ -1013,22 +862,17 @@ try:
     svg_content = svg_buffer.getvalue()
     svg_buffer.close()
     plt.close()
+    metrics.add('render', time.perf_counter() - render_started)
     
-    # Print RPC response first
-    rpc_response = json.dumps({
-        'jsonrpc': '2.0',
-        'result': {'status': 'success'}
-    })
-    print(rpc_response, flush=True)
+    with metrics.stage('serialize') as counts:
+        payload = svg_content.encode('utf-8') + b'\n'
+        counts['bytes'] = len(payload)
     
-    # Then print SVG content
-    print(svg_content, flush=True)
+    # Print RPC response first (with per-stage metrics), then the SVG content
+    send_rpc_result({'status': 'success'}, metrics.summary())
+    write_payload(payload)
     
 except Exception as e:
-    error_response = json.dumps({
-        'jsonrpc': '2.0',
-        'error': {'code': -32603, 'message': f'Error generating graph: {str(e)}'}
-    })
-    print(error_response, flush=True)
+    send_rpc_error(-32603, f'Error generating graph: {str(e)}')
     sys.exit(1)
 
@@ -0,0 +1,152 @@
+# json_codec.py
+# Pluggable JSON codec shared by the analytics scripts: request decoding, RPC framing and result encoding.
+# Uses orjson, then msgspec, when installed, and falls back to the standard library json module.
+# ANALYTICS_JSON_CODEC=orjson|msgspec|json forces a backend (used by benchmarks/codec_benchmark.py).
+#
+# All backends produce compact UTF-8 JSON, serialize datetimes/dates as ISO 8601 (UTC as 'Z'), objects
+# with a to_json method (compact pivot tree nodes) as what it returns, and any other unknown value
+# (e.g. ObjectId) through str(). Output is written to the binary
+# stdout, so scripts must not mix print() and codec writes for the same response.
+# ADR-0010: no-magic-numbers, functional style.
+
+import datetime
+import json
+import os
+import sys
+from typing import Any, Callable, Dict, Iterable, NamedTuple, Optional, Union
+
+CODEC_ENV = 'ANALYTICS_JSON_CODEC'
+CODEC_ORJSON = 'orjson'
+CODEC_MSGSPEC = 'msgspec'
+CODEC_STDLIB = 'json'
+CODEC_PREFERENCE = (CODEC_ORJSON, CODEC_MSGSPEC, CODEC_STDLIB)
+RPC_VERSION = '2.0'
+LINE_END = b'\n'
+TEXT_ENCODING = 'utf-8'
+UTC_OFFSET_SUFFIX = '+00:00'
+UTC_SUFFIX = 'Z'
+
+
+class Codec(NamedTuple):
+    name: str
+    loads: Callable[[Union[bytes, str]], Any]
+    dumps: Callable[[Any], bytes]
+
+
+def encode_default(value: Any) -> Any:
+    """Fallback for values the JSON backends do not serialize natively."""
+    if isinstance(value, datetime.datetime):
+        iso = value.isoformat()
+        return iso[:-len(UTC_OFFSET_SUFFIX)] + UTC_SUFFIX if iso.endswith(UTC_OFFSET_SUFFIX) else iso
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if hasattr(value, 'to_json'):
+        return value.to_json()
+    return str(value)
+
+
+def build_orjson_codec() -> Codec:
+    import orjson
+
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_UTC_Z
+    return Codec(CODEC_ORJSON, orjson.loads, lambda obj: orjson.dumps(obj, default=encode_default, option=options))
+
+
+def build_msgspec_codec() -> Codec:
+    import msgspec
+
+    encoder = msgspec.json.Encoder(enc_hook=encode_default)
+    decoder = msgspec.json.Decoder()
+
+    def loads(data: Union[bytes, str]) -> Any:
+        try:
+            return decoder.decode(data)
+        except msgspec.DecodeError as e:
+            # Keep the stdlib exception type so callers catch one error for every backend
+            text = data.decode(TEXT_ENCODING, errors='replace') if isinstance(data, bytes) else data
+            raise json.JSONDecodeError(str(e), text, 0) from e
+
+    return Codec(CODEC_MSGSPEC, loads, encoder.encode)
+
+
+def build_stdlib_codec() -> Codec:
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, default=encode_default, ensure_ascii=False, separators=(',', ':')).encode(TEXT_ENCODING)
+
+    return Codec(CODEC_STDLIB, json.loads, dumps)
+
+
+CODEC_BUILDERS = {
+    CODEC_ORJSON: build_orjson_codec,
+    CODEC_MSGSPEC: build_msgspec_codec,
+    CODEC_STDLIB: build_stdlib_codec,
+}
+
+
+def load_codec(preferred: str = '') -> Codec:
+    """Build the preferred codec, or the first installed one in CODEC_PREFERENCE order."""
+    candidates = (preferred,) + CODEC_PREFERENCE if preferred in CODEC_BUILDERS else CODEC_PREFERENCE
+    for name in candidates:
+        try:
+            return CODEC_BUILDERS[name]()
+        except ImportError:
+            continue
+    return build_stdlib_codec()
+
+
+CODEC = load_codec(os.environ.get(CODEC_ENV, ''))
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """Decode one JSON document. Raises json.JSONDecodeError (or a subclass) on invalid input."""
+    return CODEC.loads(data)
+
+
+def dumps(obj: Any) -> bytes:
+    """Encode one JSON document as compact UTF-8 bytes."""
+    return CODEC.dumps(obj)
+
+
+def write_json_line(obj: Any, flush: bool = False) -> None:
+    """Write one JSON document followed by a newline to stdout."""
+    out = sys.stdout.buffer
+    out.write(dumps(obj))
+    out.write(LINE_END)
+    if flush:
+        out.flush()
+
+
+def write_json_lines(objs: Iterable[Any]) -> None:
+    """Write one JSON document per line to stdout and flush once at the end."""
+    out = sys.stdout.buffer
+    out.writelines(dumps(obj) + LINE_END for obj in objs)
+    out.flush()
+
+
+def encode_json_lines(objs: Iterable[Any]) -> bytes:
+    """Encode documents as an NDJSON payload, so it can be serialized before the RPC header is sent."""
+    return b''.join(dumps(obj) + LINE_END for obj in objs)
+
+
+def write_payload(payload: bytes) -> None:
+    """Write an already encoded payload to stdout and flush."""
+    out = sys.stdout.buffer
+    out.write(payload)
+    out.flush()
+
+
+def send_rpc_result(result: Any, metrics: Optional[Dict[str, Any]] = None) -> None:
+    """Write the JSON-RPC success line that precedes the result payload.
+    Per-stage metrics (see stage_metrics.py) travel beside the result, under 'metrics'."""
+    response = {'jsonrpc': RPC_VERSION, 'result': result}
+    if metrics is not None:
+        response['metrics'] = metrics
+    write_json_line(response, flush=True)
+
+
+def send_rpc_error(code: int, message: str, data: Any = None) -> None:
+    """Write a JSON-RPC error line, with structured error data when given. Callers still decide the exit status."""
+    error = {'code': code, 'message': message}
+    if data is not None:
+        error['data'] = data
+    write_json_line({'jsonrpc': RPC_VERSION, 'error': error}, flush=True)
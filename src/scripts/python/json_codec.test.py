@@ -0,0 +1,86 @@
+# /// script
+# dependencies = [
+#   "orjson",
+#   "pytest",
+# ]
+# ///
+
+"""
+Tests for json_codec.py
+Run with: uv run --script pytest json_codec.test.py
+"""
+
+import datetime
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+from json_codec import CODEC_BUILDERS, CODEC_STDLIB, load_codec  # noqa: E402
+
+
+class ObjectIdLike:
+    """Stand-in for bson.ObjectId: only serializable through str()."""
+
+    def __init__(self, value: str):
+        self.value = value
+
+    def __str__(self) -> str:
+        return self.value
+
+
+def available_codecs() -> list:
+    codecs = []
+    for name, build in CODEC_BUILDERS.items():
+        try:
+            codecs.append(build())
+        except ImportError:
+            continue
+    return codecs
+
+
+CODECS = available_codecs()
+DOCUMENT = {
+    '_id': ObjectIdLike('65a1b2c3d4e5f6a7b8c9d0e1'),
+    'name': 'Negociação São Paulo',
+    '_createdAt': datetime.datetime(2024, 1, 5, 10, 30, tzinfo=datetime.timezone.utc),
+    'dueDate': datetime.date(2024, 2, 1),
+    'amount': {'value': 1234.5, 'currency': 'BRL'},
+    'tags': ['a', 'b'],
+    'active': True,
+    'parent': None,
+}
+EXPECTED = {
+    '_id': '65a1b2c3d4e5f6a7b8c9d0e1',
+    'name': 'Negociação São Paulo',
+    '_createdAt': '2024-01-05T10:30:00Z',
+    'dueDate': '2024-02-01',
+    'amount': {'value': 1234.5, 'currency': 'BRL'},
+    'tags': ['a', 'b'],
+    'active': True,
+    'parent': None,
+}
+
+
+@pytest.mark.parametrize('codec', CODECS, ids=lambda codec: codec.name)
+def test_encodes_dates_and_object_ids(codec):
+    assert json.loads(codec.dumps(DOCUMENT)) == EXPECTED
+
+
+@pytest.mark.parametrize('codec', CODECS, ids=lambda codec: codec.name)
+def test_round_trips_bytes(codec):
+    assert codec.loads(codec.dumps(EXPECTED)) == EXPECTED
+    assert codec.loads(json.dumps(EXPECTED).encode('utf-8')) == EXPECTED
+
+
+@pytest.mark.parametrize('codec', CODECS, ids=lambda codec: codec.name)
+def test_invalid_json_raises_stdlib_error(codec):
+    with pytest.raises(json.JSONDecodeError):
+        codec.loads(b'{"a": ')
+
+
+def test_unknown_codec_falls_back_to_preference_order():
+    assert load_codec('unknown').name == CODECS[0].name
+    assert load_codec(CODEC_STDLIB).name == CODEC_STDLIB
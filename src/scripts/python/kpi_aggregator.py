@@ -1,6 +1,7 @@
 # /// script
 # dependencies = [
 #   "polars",
+#   "orjson",
 # ]
 # ///
 
@@ -13,76 +14,44 @@ import sys
 import json
 import polars as pl
 from typing import Any, Dict
-from datetime import datetime
-import os
+
+from data_ingest import DATA_FORMATS, data_format_of, read_input_frame, nested_field_expr
+from json_codec import dumps, loads, send_rpc_error, send_rpc_result, write_payload
+from analytics_logging import open_debug_log
+from stage_metrics import StageMetrics
 
 # --- Constants (ADR-0012: no-magic-numbers) ---
-RPC_VERSION = '2.0'
 RPC_ERROR_METHOD_NOT_FOUND = -32601
 RPC_ERROR_INVALID_PARAMS = -32602
 RPC_ERROR_INTERNAL = -32603
 VALID_OPERATIONS = ('sum', 'avg', 'min', 'max', 'count_distinct')
 
-# Debug log file
-DEBUG_LOG_FILE = os.path.join(os.path.dirname(__file__), 'kpi_debug.log')
-
-
-def debug_log(message: str) -> None:
-    """Write debug message to log file."""
-    try:
-        with open(DEBUG_LOG_FILE, 'a', encoding='utf-8') as f:
-            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
-            f.write(f'[{timestamp}] {message}\n')
-    except Exception:
-        pass
-
+metrics = StageMetrics()
 
 def send_error(code: int, message: str) -> None:
     """Send JSON-RPC error response and exit."""
-    response = json.dumps({
-        'jsonrpc': RPC_VERSION,
-        'error': {'code': code, 'message': message},
-    })
-    print(response, flush=True)
+    send_rpc_error(code, message)
     sys.exit(1)
 
 
 def send_result(result: Dict[str, Any]) -> None:
-    """Send JSON-RPC success response followed by result data."""
-    rpc_response = json.dumps({
-        'jsonrpc': RPC_VERSION,
-        'result': 'ok',
-    })
-    print(rpc_response, flush=True)
-    print(json.dumps(result), flush=True)
-
-
-def extract_nested_value(record: Dict[str, Any], field_path: str) -> Any:
-    """Extract value from a nested dict using dot notation (e.g., 'value.amount')."""
-    parts = field_path.split('.')
-    current = record
-    for part in parts:
-        if isinstance(current, dict) and part in current:
-            current = current[part]
-        else:
-            return None
-    return current
-
-
-def flatten_records(records: list, field: str) -> list:
-    """Flatten nested field paths into top-level keys for Polars ingestion."""
-    if '.' not in field:
-        return records
+    """Send JSON-RPC success response (with per-stage metrics) followed by result data."""
+    with metrics.stage('serialize') as counts:
+        payload = dumps(result) + b'\n'
+        counts['bytes'] = len(payload)
+    send_rpc_result('ok', metrics.summary())
+    write_payload(payload)
 
-    flattened = []
-    flat_field = field.replace('.', '_')
 
-    for record in records:
-        flat = dict(record)
-        flat[flat_field] = extract_nested_value(record, field)
-        flattened.append(flat)
+def with_flat_field(df: pl.DataFrame, field: str) -> pl.DataFrame:
+    """Expose a nested field path (struct columns) as a top-level column named with underscores."""
+    if '.' not in field:
+        return df
 
-    return flattened
+    expr = nested_field_expr(df.schema, field)
+    if expr is None:
+        return df
+    return df.with_columns(expr.alias(field.replace('.', '_')))
 
 
 def compute_aggregation(
@@ -134,25 +103,19 @@ def compute_aggregation(
 
 # --- Main execution ---
 
-# Clear log file at start
-try:
-    with open(DEBUG_LOG_FILE, 'w', encoding='utf-8') as f:
-        f.write(f'=== KPI Aggregator Debug Log - Started at {datetime.now().strftime("%Y-%m-%d %H:%M:%S")} ===\n')
-except Exception:
-    pass
-
 # 1. Read RPC request from first line of stdin
-request_line = sys.stdin.readline()
+request_line = sys.stdin.buffer.readline()
 if not request_line:
     sys.exit(1)
 
 try:
-    request = json.loads(request_line)
+    request = loads(request_line)
 except json.JSONDecodeError as e:
     send_error(RPC_ERROR_INTERNAL, f'Invalid JSON in RPC request: {str(e)}')
 
 method = request.get('method')
 params = request.get('params', {})
+debug_log = open_debug_log('kpi_aggregator', request)
 
 if method != 'aggregate':
     send_error(RPC_ERROR_METHOD_NOT_FOUND, f'Method not found: {method}')
@@ -171,31 +134,30 @@ if operation not in VALID_OPERATIONS:
 if not field:
     send_error(RPC_ERROR_INVALID_PARAMS, 'field is required for aggregation')
 
-# 2. Read NDJSON data from remaining stdin
-data = []
-for line in sys.stdin:
-    stripped = line.strip()
-    if stripped:
-        try:
-            data.append(json.loads(stripped))
-        except json.JSONDecodeError:
-            debug_log(f'Skipping invalid JSON line: {stripped[:100]}')
+if data_format_of(params) not in DATA_FORMATS:
+    send_error(RPC_ERROR_INVALID_PARAMS, f'Unsupported data format: {data_format_of(params)}')
+
+# 2. Read data (NDJSON or Arrow) from remaining stdin as columnar batches
+try:
+    df = read_input_frame(sys.stdin.buffer, params, on_invalid=lambda line: debug_log(f'Skipping invalid JSON line: {line[:100]!r}'), metrics=metrics)
+except Exception as e:
+    debug_log(f'Error reading NDJSON data: {str(e)}')
+    send_error(RPC_ERROR_INTERNAL, f'Error reading data: {str(e)}')
 
-debug_log(f'Read {len(data)} records from stdin')
+debug_log(f'Read {df.height} records from stdin')
 
-if len(data) == 0:
+if df.height == 0:
     send_result({'result': 0, 'count': 0, 'validCount': 0})
     sys.exit(0)
 
-# 3. Flatten nested fields if needed
-flattened_data = flatten_records(data, field)
-
-# 4. Create Polars DataFrame and compute aggregation
+# 3. Compute aggregation, exposing nested fields as flat columns if needed
 try:
-    df = pl.DataFrame(flattened_data)
-    debug_log(f'DataFrame created: {len(df)} rows, columns: {df.columns}')
+    with metrics.stage('aggregate') as counts:
+        df = with_flat_field(df, field)
+        debug_log(f'DataFrame created: {len(df)} rows, columns: {df.columns}')
 
-    result = compute_aggregation(df, operation, field)
+        result = compute_aggregation(df, operation, field)
+        counts['rows'] = df.height
     debug_log(f'Aggregation result: {result}')
 
     send_result(result)
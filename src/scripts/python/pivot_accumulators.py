@@ -0,0 +1,92 @@
+# pivot_accumulators.py
+# Mergeable accumulators for pivot value fields. Each aggregator keeps a partial state (one or more
+# columns) that is started from the records of a group, merged across groups (subtotals, grand totals,
+# partitions) and finalized into the output value once, at the end. All three steps are polars
+# expressions evaluated in group_by contexts:
+#   sum            state: sum                          final: sum (missing and non-numeric values add 0)
+#   count          state: record count                 final: count
+#   avg            state: sum, count of numeric values final: sum / count (null without numeric values)
+#   min, max       state: min, max                     final: as is
+#   countDistinct  state: distinct non-null values     final: number of values
+#   median         state: numeric values               final: median
+#   percentile     state: numeric values               final: linear percentile ('percentile', 0-100)
+# ADR-0010: no-magic-numbers, functional style.
+
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import polars as pl
+
+SUM = 'sum'
+COUNT = 'count'
+AVG = 'avg'
+MIN = 'min'
+MAX = 'max'
+COUNT_DISTINCT = 'countDistinct'
+MEDIAN = 'median'
+PERCENTILE = 'percentile'
+DEFAULT_PERCENTILE = 50
+MAX_PERCENTILE = 100
+QUANTILE_INTERPOLATION = 'linear'
+
+
+class Accumulator(NamedTuple):
+    """Partial state of one aggregator: its number of state columns, how a group of records starts it
+    (from the numeric value and the raw value), how partial states merge and how the value is read."""
+    parts: int
+    init: Callable[[pl.Expr, pl.Expr], List[pl.Expr]]
+    merge: Callable[[List[pl.Expr]], List[pl.Expr]]
+    finalize: Callable[[List[pl.Expr]], pl.Expr]
+
+
+def summed(parts: List[pl.Expr]) -> List[pl.Expr]:
+    return [part.sum() for part in parts]
+
+
+def merged_values(parts: List[pl.Expr]) -> List[pl.Expr]:
+    """Concatenated value lists of the merged states."""
+    return [parts[0].explode().drop_nulls()]
+
+
+def quantile(percentile: float) -> Callable[[List[pl.Expr]], pl.Expr]:
+    return lambda parts: parts[0].list.eval(pl.element().quantile(percentile / MAX_PERCENTILE, QUANTILE_INTERPOLATION)).list.first()
+
+
+ACCUMULATORS: Dict[str, Accumulator] = {
+    SUM: Accumulator(1, lambda numbers, raw: [numbers.sum()], summed, lambda parts: parts[0]),
+    COUNT: Accumulator(1, lambda numbers, raw: [pl.len()], summed, lambda parts: parts[0].cast(pl.Float64)),
+    AVG: Accumulator(
+        2,
+        lambda numbers, raw: [numbers.sum(), numbers.count()],
+        summed,
+        lambda parts: pl.when(parts[1] > 0).then(parts[0] / parts[1]),
+    ),
+    MIN: Accumulator(1, lambda numbers, raw: [numbers.min()], lambda parts: [parts[0].min()], lambda parts: parts[0]),
+    MAX: Accumulator(1, lambda numbers, raw: [numbers.max()], lambda parts: [parts[0].max()], lambda parts: parts[0]),
+    COUNT_DISTINCT: Accumulator(
+        1,
+        lambda numbers, raw: [raw.drop_nulls().unique()],
+        lambda parts: [parts[0].explode().drop_nulls().unique()],
+        lambda parts: parts[0].list.len(),
+    ),
+    MEDIAN: Accumulator(1, lambda numbers, raw: [numbers.drop_nulls()], merged_values, lambda parts: parts[0].list.median()),
+}
+
+
+def accumulator(aggregator: str, percentile: Optional[float] = None) -> Accumulator:
+    """Accumulator of an aggregator; percentile takes its 0-100 rank."""
+    if aggregator == PERCENTILE:
+        rank = DEFAULT_PERCENTILE if percentile is None else percentile
+        return Accumulator(1, lambda numbers, raw: [numbers.drop_nulls()], merged_values, quantile(rank))
+    return ACCUMULATORS[aggregator]
+
+
+def value_error(val_meta: Dict) -> Optional[str]:
+    """Why a value config can't be aggregated, if it can't."""
+    aggregator = val_meta.get('aggregator', SUM)
+    if aggregator != PERCENTILE and aggregator not in ACCUMULATORS:
+        return f'Unsupported aggregator for {val_meta.get("field")}: {aggregator}'
+    percentile = val_meta.get('percentile')
+    if aggregator == PERCENTILE and percentile is not None:
+        if isinstance(percentile, bool) or not isinstance(percentile, (int, float)) or not 0 <= percentile <= MAX_PERCENTILE:
+            return f'Percentile of {val_meta.get("field")} must be a number from 0 to {MAX_PERCENTILE}'
+    return None
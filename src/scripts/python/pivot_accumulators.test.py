@@ -0,0 +1,82 @@
+# /// script
+# dependencies = [
+#   "polars",
+#   "pytest",
+# ]
+# ///
+
+"""
+Tests for pivot_accumulators.py
+Run with: uv run --script pytest pivot_accumulators.test.py
+"""
+
+import sys
+from pathlib import Path
+
+import polars as pl
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+from pivot_accumulators import ACCUMULATORS, PERCENTILE, accumulator, value_error  # noqa: E402
+
+NUMBERS = [3.0, None, 1.0, 7.0, 2.0, None, 7.0, 4.0]
+RAW = ['a', None, 'b', 'a', 'c', 'd', 'a', 'b']
+PARTITIONS = [0, 0, 1, 1, 1, 2, 2, 2]
+EMPTY_PARTITION = 3
+AGGREGATORS = [*ACCUMULATORS, PERCENTILE]
+
+
+def states(frame: pl.DataFrame, aggregator: str, keys: list) -> pl.DataFrame:
+    exprs = accumulator(aggregator, 90).init(pl.col('number'), pl.col('raw'))
+    return frame.group_by(keys, maintain_order=True).agg(expr.alias(f'part_{i}') for i, expr in enumerate(exprs))
+
+
+def finalized(frame: pl.DataFrame, aggregator: str) -> list:
+    parts = [pl.col(f'part_{i}') for i in range(accumulator(aggregator).parts)]
+    return frame.select(accumulator(aggregator, 90).finalize(parts)).to_series().to_list()
+
+
+def records() -> pl.DataFrame:
+    return pl.DataFrame({'number': NUMBERS, 'raw': RAW, 'partition': PARTITIONS, 'all': [0] * len(NUMBERS)})
+
+
+@pytest.mark.parametrize('aggregator', AGGREGATORS)
+def test_merged_partitions_match_a_single_pass(aggregator):
+    single = finalized(states(records(), aggregator, ['all']), aggregator)
+
+    partial = states(records(), aggregator, ['partition', 'all'])
+    parts = [pl.col(f'part_{i}') for i in range(accumulator(aggregator).parts)]
+    merge = accumulator(aggregator, 90).merge(parts)
+    merged = partial.group_by('all').agg(expr.alias(f'part_{i}') for i, expr in enumerate(merge))
+
+    assert finalized(merged, aggregator) == single
+
+
+def test_final_values():
+    values = {aggregator: finalized(states(records(), aggregator, ['all']), aggregator)[0] for aggregator in AGGREGATORS}
+
+    assert values == {
+        'sum': 24.0,
+        'count': 8.0,
+        'avg': 4.0,
+        'min': 1.0,
+        'max': 7.0,
+        'countDistinct': 4,
+        'median': 3.5,
+        'percentile': 7.0,
+    }
+
+
+def test_groups_without_numbers_finalize_to_null_or_zero():
+    frame = pl.DataFrame({'number': [None], 'raw': [None], 'all': [EMPTY_PARTITION]}, schema={'number': pl.Float64, 'raw': pl.String, 'all': pl.Int64})
+    values = {aggregator: finalized(states(frame, aggregator, ['all']), aggregator)[0] for aggregator in AGGREGATORS}
+
+    assert values == {'sum': 0.0, 'count': 1.0, 'avg': None, 'min': None, 'max': None, 'countDistinct': 0, 'median': None, 'percentile': None}
+
+
+def test_value_error():
+    assert value_error({'field': 'value', 'aggregator': 'avg'}) is None
+    assert value_error({'field': 'value', 'aggregator': 'percentile', 'percentile': 95}) is None
+    assert value_error({'field': 'value', 'aggregator': 'mode'}) == 'Unsupported aggregator for value: mode'
+    assert value_error({'field': 'value', 'aggregator': 'percentile', 'percentile': 101})
+    assert value_error({'field': 'value', 'aggregator': 'percentile', 'percentile': '50'})
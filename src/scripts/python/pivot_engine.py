@@ -0,0 +1,918 @@
+# pivot_engine.py
+# Group-by engine behind pivot_table.py. The pivot used to be built by walking every record in Python
+# and updating nested defaultdict nodes at every row level for every value field. Now:
+#   1. one polars group-by over the fields the row and column keys come from (the axis field, its _id
+#      and its lookup label paths; for date bucket columns, the bucket value computed by date_buckets.py
+#      over the whole column) starts the partial state of every value field's accumulator
+#      (pivot_accumulators.py) and keeps the first input row
+#   2. row paths are derived once per distinct group, with the rules the record loop used (blank text
+#      fallbacks); lookup labels and case-folded row sort keys once per distinct lookup document or
+#      value; column paths once per distinct combination of column source values, dictionary-encoded
+#      to integer ordinals that key the cells until output (the header tree is built from the distinct
+#      paths only). Groups are ordered by a native sort on the precomputed sort keys, not a record sort.
+#      Levels with a limit (top-N) keep the keys with the largest (or smallest) aggregated value of a
+#      value field within their parent, picked by a partial sort (top_k_by); the other groups are
+#      relabelled to one Others key of that level, so the merges below aggregate them like any key
+#   3. subtotals are merged bottom-up, each grouping set from the one below it instead of from every
+#      record: row path x column ordinal (deepest cells) from the groups, row prefix x column ordinal
+#      (cells) and row prefix (totals) level by level, column ordinal (grand total cells) and () (grand
+#      totals) from the top level; each is finalized once into its aggregator's value
+#   4. the Python tree is assembled from those aggregated frames only. The groups and their states
+#      (PivotState) are all a tree needs: a depth-limited tree stops at max_depth levels and its last
+#      nodes are expanded later from the same state (expand_rows), filtered to the node's groups. Cells
+#      and totals are written in the requested cell format: dicts keyed by column key and value field, or
+#      compact arrays indexed by column ordinal and measure ordinal (cell_layout lists both once). Nodes
+#      stay compact (PivotNode: slots, and an index into per-measure value arrays of their level) until
+#      they are encoded, when each is converted to its output dict
+# Output shape (data / grandTotals / columnHeaders) and ordering are unchanged: a node appears where its
+# first record did after sorting records by their row sort keys, then siblings are sorted by label (both
+# applied to groups and aggregated nodes only).
+# ADR-0010: no-magic-numbers, functional style.
+
+from array import array
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import polars as pl
+
+from date_buckets import NO_DATE_LABEL, bucket_labels, parse_dates
+from field_projection import axis_field_paths
+from pivot_accumulators import SUM, Accumulator, accumulator
+
+DEFAULT_COLUMN_KEY = '__default__'
+COLUMN_KEY_SEP = '|'
+NON_NUMERIC_COLUMN_ORDER = 9999
+LOOKUP_LABEL_SEP = ' - '
+BOOLEAN_LABELS = {True: 'Sim', False: 'Não'}
+# Floats keep their integer text up to here: beyond it, a float may not be the integer it was written as
+MAX_EXACT_FLOAT_INTEGER = 2 ** 53
+
+ROW_INDEX = '__row'
+FIRST_ROW = '__first'
+ORDER = '__order'
+COLUMN_ORDINAL = '__column'
+GROUP_INDEX = '__group'
+DERIVED = '__derived'
+TOTAL_KEY = '__total'
+PARTITION = '__partition'
+# Cell formats (options.cellFormat). keyed: cells {column key: {field: value}}, totals {field: value};
+# dense: cells [value] with the value of column ordinal c and measure m at c * measures + m (null when the
+# row has no records in the column), totals [value]; sparse: cells [[column ordinal, *values]] of the
+# row's columns only, totals [value]
+KEYED_CELLS = 'keyed'
+DENSE_CELLS = 'dense'
+SPARSE_CELLS = 'sparse'
+CELL_FORMATS = (KEYED_CELLS, DENSE_CELLS, SPARSE_CELLS)
+LABEL_FOLD = '__label_fold'
+NODE_POSITION = '__node'
+# array typecodes of the finalized value dtypes stored unboxed in a tree (LevelValues)
+ARRAY_TYPECODES = {pl.Float64: 'd', pl.Int64: 'q', pl.UInt64: 'Q', pl.Int32: 'i', pl.UInt32: 'I'}
+# Top-N: key and default label (Node sends the translated one) of the key the keys outside the top of a
+# level collapse into; Others rows and columns come after their siblings
+OTHERS_KEY = '__others__'
+OTHERS_TEXT = 'Outros'
+ASCENDING = 'ASC'
+KEPT = '__kept'
+COLUMN_PREFIX = '__column_prefix'
+COLUMN_PARENT = '__column_parent'
+
+
+def row_key_column(level: int) -> str:
+    return f'__row_key_{level}'
+
+
+def row_label_column(level: int) -> str:
+    return f'__row_label_{level}'
+
+
+def number_column(slot: int) -> str:
+    return f'__number_{slot}'
+
+
+def state_column(slot: int, part: int) -> str:
+    return f'__state_{slot}_{part}'
+
+
+def value_column(slot: int) -> str:
+    return f'__value_{slot}'
+
+
+def nested_key_column(path: str) -> str:
+    return f'__hash_{path}'
+
+
+def bucket_column(level: int) -> str:
+    return f'__bucket_{level}'
+
+
+def row_sort_column(level: int) -> str:
+    return f'__row_sort_{level}'
+
+
+def row_lookup_column(level: int) -> str:
+    return f'__row_lookup_{level}'
+
+
+def column_lookup_column(level: int) -> str:
+    return f'__column_lookup_{level}'
+
+
+# 1. Record-level rules (applied once per distinct group)
+def value_text(value: Any) -> str:
+    """Text of a source value in keys and labels. Integral floats are written as integers: the backend
+    serializes them so (JSON.stringify), and they only arrive as floats when the columnar reader promoted
+    a field holding integers and decimals to Float64, where per-document parsing kept the integers."""
+    if isinstance(value, float) and value.is_integer() and abs(value) < MAX_EXACT_FLOAT_INTEGER:
+        return str(int(value))
+    return str(value)
+
+
+def format_lookup_value(row: Dict, field: str, lookup_config: Optional[Dict], blank_text: str) -> str:
+    """Format a lookup value following legacy ExtJS pattern"""
+    if not lookup_config:
+        value = row.get(field)
+        if value is None or value == '':
+            return blank_text
+        return value_text(value)
+
+    simple_fields = lookup_config.get('simpleFields', ['name'])
+    nested_fields = lookup_config.get('nestedFields', [])
+    values = []
+
+    # Process simple fields (e.g., 'code', 'name')
+    for sf in simple_fields:
+        field_value = row.get(f'{field}.{sf}')
+        if field_value is not None and field_value != '':
+            # Format boolean values in Portuguese
+            if isinstance(field_value, bool):
+                field_value = BOOLEAN_LABELS[field_value]
+            values.append(value_text(field_value))
+
+    # Process nested fields (e.g., 'name.full' -> 'name_full' in flattened data)
+    for nf in nested_fields:
+        # Try both dot notation and underscore notation
+        field_value = row.get(f'{field}.{nf}')
+        if field_value is None:
+            field_value = row.get(f'{field}.{nf.replace(".", "_")}')
+        if field_value is not None and field_value != '':
+            values.append(value_text(field_value))
+
+    if values:
+        return LOOKUP_LABEL_SEP.join(values)
+
+    # Check if lookup has any value at all
+    id_value = row.get(f'{field}._id')
+    if id_value:
+        return value_text(id_value)
+
+    return blank_text
+
+
+def row_path(record: Dict, rows_meta: List[Dict], blank_text: str) -> List[Tuple[str, str]]:
+    """(key, label) per row level: the key is the lookup _id (or the raw value), the label its display text."""
+    path = []
+    for level, row_meta in enumerate(rows_meta):
+        field = row_meta['field']
+        lookup_config = row_meta.get('lookup')
+
+        key = record.get(f'{field}._id')
+        if key is None:
+            key = record.get(field, '')
+        key = value_text(key) if key is not None else ''
+
+        if lookup_config:
+            label = record[row_lookup_column(level)]
+        else:
+            value = record.get(field)
+            label = blank_text if value is None or value == '' else value_text(value)
+
+        path.append((key or blank_text, label))
+    return path
+
+
+def column_path(record: Dict, columns_meta: List[Dict], blank_text: str) -> List[Tuple[str, str]]:
+    """(value, label) per column level: date buckets, lookup _id with its label, or the raw value."""
+    path = []
+    for level, col_meta in enumerate(columns_meta):
+        field = col_meta['field']
+        bucket = col_meta.get('bucket')
+        lookup_config = col_meta.get('lookup')
+
+        if bucket:
+            col_value = record.get(bucket_column(level), NO_DATE_LABEL)
+            col_label = col_value
+        elif lookup_config:
+            col_value = record.get(f'{field}._id') or record.get(field, '')
+            col_value = value_text(col_value) if col_value else blank_text
+            col_label = record[column_lookup_column(level)]
+        else:
+            col_value = value_text(record.get(field, '') or '') or blank_text
+            col_label = col_value
+
+        path.append((col_value, col_label))
+    return path
+
+
+def row_sort_key(record: Dict, level: int, row_meta: Dict) -> str:
+    """Case-folded sort key of a record at one row level (lookups sort by label)"""
+    if row_meta.get('lookup'):
+        label = record[row_lookup_column(level)]
+        return label.lower() if label else ''
+    value = record.get(row_meta['field'], '')
+    return value_text(value).lower() if value else ''
+
+
+# 2. Aggregation plan
+class ValueSlot(NamedTuple):
+    """Accumulator slot of one distinct value field."""
+    index: int
+    field: str
+    # From the field's first entry
+    aggregator: str
+    accumulator: Accumulator
+    # Partial state columns in the group and leaves frames
+    states: Tuple[str, ...]
+
+
+class AggregationPlan(NamedTuple):
+    """Value config compiled once: the slots, and the output name of each finalized slot value (cells,
+    totals and grand totals are keyed by field)."""
+    slots: Tuple[ValueSlot, ...]
+    outputs: Tuple[str, ...]
+
+
+def compile_plan(values_meta: List[Dict]) -> AggregationPlan:
+    """One slot per distinct value field, as values are keyed by field: a field listed more than once
+    keeps the aggregator (and percentile) of its first entry."""
+    first_entries: Dict[str, Dict] = {}
+    for val_meta in values_meta:
+        first_entries.setdefault(val_meta['field'], val_meta)
+    slots = []
+    for index, (field, val_meta) in enumerate(first_entries.items()):
+        slot_accumulator = accumulator(val_meta.get('aggregator', SUM), val_meta.get('percentile'))
+        states = tuple(state_column(index, part) for part in range(slot_accumulator.parts))
+        slots.append(ValueSlot(index, field, val_meta.get('aggregator', SUM), slot_accumulator, states))
+    return AggregationPlan(slots=tuple(slots), outputs=tuple(first_entries))
+
+
+def numeric_expr(name: str, dtype: pl.DataType) -> pl.Expr:
+    """Record value as float, like float(value); missing and non-numeric values are null."""
+    if dtype.is_numeric() or dtype == pl.Boolean:
+        return pl.col(name).cast(pl.Float64)
+    if dtype == pl.String:
+        return pl.col(name).str.strip_chars().cast(pl.Float64, strict=False)
+    return pl.lit(None, dtype=pl.Float64)
+
+
+def init_states(slot: ValueSlot) -> List[pl.Expr]:
+    """Partial state of a group of records."""
+    exprs = slot.accumulator.init(pl.col(number_column(slot.index)), pl.col(slot.field))
+    return [expr.alias(state) for expr, state in zip(exprs, slot.states)]
+
+
+def merge_states(slot: ValueSlot) -> List[pl.Expr]:
+    """Partial state of a group of partial states."""
+    exprs = slot.accumulator.merge([pl.col(state) for state in slot.states])
+    return [expr.alias(state) for expr, state in zip(exprs, slot.states)]
+
+
+def final_value(slot: ValueSlot) -> pl.Expr:
+    return slot.accumulator.finalize([pl.col(state) for state in slot.states]).alias(value_column(slot.index))
+
+
+def state_columns(plan: AggregationPlan) -> List[str]:
+    return [state for slot in plan.slots for state in slot.states]
+
+
+def column_source_paths(columns_meta: List[Dict]) -> List[str]:
+    """Columns a column path is derived from: the bucket column of date buckets, the axis paths otherwise."""
+    return list(dict.fromkeys(
+        path for level, meta in enumerate(columns_meta) for path in ([bucket_column(level)] if meta.get('bucket') else axis_field_paths(meta))
+    ))
+
+
+def with_date_buckets(records: pl.DataFrame, columns_meta: List[Dict], timezone: Optional[str]) -> pl.DataFrame:
+    """Bucket value column of every date bucket column level not computed yet (pivot_table.py buckets
+    dates before its pre-flight); each date field is parsed once."""
+    bucketed = [(level, meta) for level, meta in enumerate(columns_meta) if meta.get('bucket') and bucket_column(level) not in records.columns]
+    dates = {meta['field']: parse_dates(records[meta['field']], timezone) for _, meta in bucketed}
+    return records.with_columns(bucket_labels(dates[meta['field']], meta['bucket']).alias(bucket_column(level)) for level, meta in bucketed)
+
+
+def group_records(records: pl.DataFrame, key_paths: List[str], plan: AggregationPlan, partitions: int = 1) -> pl.DataFrame:
+    """One row per distinct combination of key source values, with the partial state of every slot and
+    the first input row. Nested values (lists) are grouped by hash and kept as is.
+    With more than one partition, records are split by a hash of their keys (every record of a group in
+    the same partition, in input order) and each partition is grouped by its own lazy query, all run
+    together by pl.collect_all on the polars thread pool. Partial groups never overlap, so they need no
+    merge here and are the groups of a single pass; partitions meet in the subtotal merges."""
+    schema = records.schema
+    nested = [path for path in key_paths if schema[path].is_nested()]
+    numbers = [numeric_expr(slot.field, schema[slot.field]).alias(number_column(slot.index)) for slot in plan.slots]
+    keys = [nested_key_column(path) if path in nested else path for path in key_paths]
+    keyed = records.with_columns(*numbers, *(pl.col(path).hash().alias(nested_key_column(path)) for path in nested))
+
+    def grouped(frame: pl.DataFrame) -> pl.LazyFrame:
+        return (
+            frame.lazy()
+            .group_by(keys)
+            .agg(
+                pl.col(ROW_INDEX).min().alias(FIRST_ROW),
+                *(state for slot in plan.slots for state in init_states(slot)),
+                *(pl.col(path).first() for path in nested),
+            )
+            .select(*key_paths, FIRST_ROW, *state_columns(plan))
+        )
+
+    if partitions <= 1 or not keys:
+        return grouped(keyed).collect()
+    partition = (pl.struct(keys).hash() % partitions).alias(PARTITION)
+    parts = keyed.with_columns(partition).partition_by(PARTITION, maintain_order=True, include_key=False)
+    return pl.concat(pl.collect_all([grouped(part) for part in parts]))
+
+
+def merge_groups(frame: pl.DataFrame, keys: List[str], plan: AggregationPlan) -> pl.DataFrame:
+    """Coarser grouping set merged from a finer one (or the leaves): per key, the merged slot states and
+    the first appearance (ORDER, the leaves row). Without keys, the single total row."""
+    group_keys = keys or [pl.lit(0).alias(TOTAL_KEY)]
+    return (
+        frame.group_by(group_keys)
+        .agg(pl.col(ORDER).min(), *(state for slot in plan.slots for state in merge_states(slot)))
+        .select(*keys, ORDER, *state_columns(plan))
+    )
+
+
+def finalized(groups: pl.DataFrame, keys: List[str], plan: AggregationPlan, labels: Optional[pl.Series] = None) -> pl.DataFrame:
+    """Merged groups ordered by first appearance, with the keys, then the values vector (one finalized
+    value per slot), then, given the leaves label column, the label of the first appearance."""
+    ordered = groups.sort(ORDER)
+    values = ordered.select(*keys, *(final_value(slot) for slot in plan.slots))
+    return values if labels is None else values.with_columns(labels.gather(ordered[ORDER]))
+
+
+# 3. Output assembly
+def outputs(values: Sequence[Any], plan: AggregationPlan) -> Dict[str, Any]:
+    """Output dict of a node from its values vector (finalized slot values)."""
+    return dict(zip(plan.outputs, values))
+
+
+def measure_values(series: pl.Series) -> Sequence[Any]:
+    """Finalized values of one measure: an array of machine values when its dtype has a typecode and no
+    value is null (8 bytes a value instead of a pointer to a Python number), a list otherwise. Both read
+    back the same Python values."""
+    typecode = ARRAY_TYPECODES.get(series.dtype)
+    return series.to_list() if typecode is None or series.null_count() else array(typecode, series.to_list())
+
+
+class CellWriter(NamedTuple):
+    """How a cell format writes the cells of a node, given the column ordinals and the values (one
+    sequence per measure) its cell positions index, and a totals values vector."""
+    cells: Callable[[Sequence[int], Sequence[Sequence[Any]], range], Any]
+    totals: Callable[[Sequence[Any]], Any]
+
+
+def cell_writer(state: 'PivotState', cell_format: str) -> CellWriter:
+    plan, column_keys = state.plan, state.column_keys
+    measures = len(plan.outputs)
+    if cell_format == DENSE_CELLS:
+        def dense_cells(ordinals: Sequence[int], values: Sequence[Sequence[Any]], positions: range) -> List[Any]:
+            cells: List[Any] = [None] * (len(column_keys) * measures)
+            for position in positions:
+                start = ordinals[position] * measures
+                cells[start : start + measures] = [measure[position] for measure in values]
+            return cells
+
+        return CellWriter(dense_cells, list)
+    if cell_format == SPARSE_CELLS:
+        return CellWriter(lambda ordinals, values, positions: [[ordinals[position], *(measure[position] for measure in values)] for position in positions], list)
+    return CellWriter(
+        lambda ordinals, values, positions: {
+            column_keys[ordinals[position]]: {output: measure[position] for output, measure in zip(plan.outputs, values)} for position in positions
+        },
+        lambda values: outputs(values, plan),
+    )
+
+
+class LevelValues(NamedTuple):
+    """Finalized values of one row level, shared by its nodes: per measure, the totals of every node
+    (by node position) and the value of every cell, the cells of a node being contiguous; the column
+    ordinal of every cell; and the writer of the requested cell format."""
+    totals: List[Sequence[Any]]
+    ordinals: Sequence[int]
+    cells: List[Sequence[Any]]
+    writer: CellWriter
+
+
+class PivotNode:
+    """Row node of a pivot tree, kept compact until it is written: no dicts of cells and totals, only its
+    position in the values of its level (LevelValues) and the range of its cells there. to_json converts
+    it to the output dict (key, label, level, cells, totals, then expansionKey or children when set) as
+    it is encoded (json_codec calls it), one node at a time; each call builds the dict anew, so callers
+    convert a node once."""
+    __slots__ = ('key', 'label', 'level', 'values', 'position', 'cells_start', 'cells_end', 'expansion_key', 'children')
+
+    def __init__(self, key: str, label: str, level: int, values: LevelValues, position: int, cells: range, expansion_key: Optional[str]) -> None:
+        self.key, self.label, self.level = key, label, level
+        self.values, self.position, self.cells_start, self.cells_end = values, position, cells.start, cells.stop
+        self.expansion_key = expansion_key
+        self.children: Optional[List['PivotNode']] = None
+
+    def to_json(self) -> Dict[str, Any]:
+        values = self.values
+        node = {
+            'key': self.key,
+            'label': self.label,
+            'level': self.level,
+            'cells': values.writer.cells(values.ordinals, values.cells, range(self.cells_start, self.cells_end)),
+            'totals': values.writer.totals([measure[self.position] for measure in values.totals]),
+        }
+        if self.expansion_key is not None:
+            node['expansionKey'] = self.expansion_key
+        if self.children:
+            node['children'] = self.children
+        return node
+
+
+def cell_layout(state: 'PivotState', cell_format: str) -> Dict[str, Any]:
+    """Header of the compact cell formats: the column key of every column ordinal and the value field of
+    every measure ordinal."""
+    return {'format': cell_format, 'columns': state.column_keys, 'measures': list(state.plan.outputs)}
+
+
+def by_label(nodes: pl.DataFrame, key: str, label: str) -> pl.DataFrame:
+    """Row nodes (in first-appearance order) sorted alphabetically by case-folded label, ties keeping
+    first-appearance order, and the Others node last; children are appended to their parent in this order."""
+    folded = pl.Series(LABEL_FOLD, [text.lower() for text in nodes[label]], dtype=pl.String)
+    return nodes.with_columns(folded).sort(pl.col(key) == OTHERS_KEY, LABEL_FOLD, maintain_order=True).drop(LABEL_FOLD)
+
+
+def column_tree_to_list(tree: Dict, sort_numeric: bool = False) -> List[Dict]:
+    """Convert column tree dict to sorted list format"""
+    result = []
+
+    for node in tree.values():
+        node_data = {
+            'key': node['key'],
+            'value': node['value'],
+            'label': node['label'],
+            'level': node['level'],
+            'expanded': node.get('expanded', False),
+        }
+
+        if node['children']:
+            node_data['children'] = column_tree_to_list(node['children'], sort_numeric)
+
+        result.append(node_data)
+
+    # Sort: try numeric sort first, then alphabetic; the Others column goes last
+    try:
+        if sort_numeric and all(n['value'].isdigit() or n['value'] in (NO_DATE_LABEL, OTHERS_KEY) for n in result):
+            result.sort(key=lambda n: (n['value'] == OTHERS_KEY, int(n['value']) if n['value'].isdigit() else NON_NUMERIC_COLUMN_ORDER))
+        else:
+            result.sort(key=lambda n: (n['value'] == OTHERS_KEY, n['label'].lower()))
+    except Exception:
+        result.sort(key=lambda n: n.get('label', '').lower())
+
+    return result
+
+
+def build_column_tree(column_paths: List[List[Tuple[str, str]]]) -> Dict:
+    """Column tree (similar to ExtJS axisTop) from the distinct column paths in first-appearance order:
+    one level per column field, node keys are the '|'-joined value path."""
+    column_tree: Dict = {}
+    for path in column_paths:
+        current_level = column_tree
+        parent_key = ''
+        for col_idx, (col_value, col_label) in enumerate(path):
+            node_key = f'{parent_key}{COLUMN_KEY_SEP}{col_value}' if parent_key else col_value
+            if col_value not in current_level:
+                current_level[col_value] = {
+                    'key': node_key,
+                    'value': col_value,
+                    'label': col_label,
+                    'level': col_idx,
+                    'children': {},
+                    'expanded': False,
+                }
+            parent_key = node_key
+            current_level = current_level[col_value]['children']
+    return column_tree
+
+
+def memo_key(value: Any) -> Any:
+    """Hashable, type-exact key for a source value (True, 1 and 1.0 format differently)."""
+    return (type(value), repr(value) if isinstance(value, (list, dict)) else value)
+
+
+def encode_column_paths(
+    groups: List[Dict[str, Any]],
+    columns_meta: List[Dict],
+    blank_text: str,
+) -> Tuple[List[int], List[List[Tuple[str, str]]]]:
+    """Dictionary-encode the column path of every group in one pass, groups in first-appearance order:
+    each distinct combination of column source values is formatted once, and each distinct value path
+    gets the next ordinal. Returns the ordinal of every group and the (value, label) path of every
+    ordinal, labelled as it first appeared."""
+    sources = column_source_paths(columns_meta)
+    ordinal_by_sources: Dict[tuple, int] = {}
+    ordinal_by_values: Dict[Tuple[str, ...], int] = {}
+    paths: List[List[Tuple[str, str]]] = []
+    ordinals = []
+    for group in groups:
+        sources_key = tuple(memo_key(group.get(source)) for source in sources)
+        ordinal = ordinal_by_sources.get(sources_key)
+        if ordinal is None:
+            path = column_path(group, columns_meta, blank_text)
+            ordinal = ordinal_by_values.setdefault(tuple(value for value, _ in path), len(paths))
+            if ordinal == len(paths):
+                paths.append(path)
+            ordinal_by_sources[sources_key] = ordinal
+        ordinals.append(ordinal)
+    return ordinals, paths
+
+
+def column_key(path: List[Tuple[str, str]]) -> str:
+    """Cell key of a column path: its values joined by '|' ('__default__' without column fields)."""
+    return COLUMN_KEY_SEP.join(value for value, _ in path) if path else DEFAULT_COLUMN_KEY
+
+
+def per_distinct(frame: pl.DataFrame, sources: List[str], derive: Callable[[Dict[str, Any]], Any]) -> pl.Series:
+    """derive applied once per distinct combination of the sources values, one result per frame row."""
+    distinct = frame.select(sources).with_row_index(GROUP_INDEX).group_by(sources, maintain_order=True).agg(pl.col(GROUP_INDEX))
+    derived = [derive(values) for values in distinct.select(sources).iter_rows(named=True)]
+    return (
+        distinct.select(GROUP_INDEX, pl.Series(DERIVED, derived, dtype=pl.String))
+        .explode(GROUP_INDEX)
+        .sort(GROUP_INDEX)
+        .get_column(DERIVED)
+    )
+
+
+def lookup_labels(groups: pl.DataFrame, meta: Dict, blank_text: str) -> pl.Series:
+    """Label of every group for a lookup axis, formatted once per distinct lookup (its _id and label
+    fields): labels are a pure function of those values, so repeated users or accounts reuse theirs."""
+    sources = [path for path in dict.fromkeys(axis_field_paths(meta)) if path != meta['field']]
+    return per_distinct(groups, sources, lambda lookup: format_lookup_value(lookup, meta['field'], meta['lookup'], blank_text))
+
+
+def with_row_sort_keys(groups: pl.DataFrame, rows_meta: List[Dict]) -> pl.DataFrame:
+    """Case-folded sort key column of every row level, computed once per distinct value (lookup label)."""
+    return groups.with_columns(
+        per_distinct(
+            groups,
+            [row_lookup_column(level) if meta.get('lookup') else meta['field']],
+            lambda record, level=level, meta=meta: row_sort_key(record, level, meta),
+        ).alias(row_sort_column(level))
+        for level, meta in enumerate(rows_meta)
+    )
+
+
+def with_lookup_labels(groups: pl.DataFrame, rows_meta: List[Dict], columns_meta: List[Dict], blank_text: str) -> pl.DataFrame:
+    """Label column of every lookup row and column level; levels with the same lookup share one."""
+    lookups = [
+        *((row_lookup_column(level), meta) for level, meta in enumerate(rows_meta) if meta.get('lookup')),
+        *((column_lookup_column(level), meta) for level, meta in enumerate(columns_meta) if meta.get('lookup') and not meta.get('bucket')),
+    ]
+    labels: Dict[str, pl.Series] = {}
+    for _, meta in lookups:
+        lookup_key = repr((meta['field'], meta['lookup']))
+        if lookup_key not in labels:
+            labels[lookup_key] = lookup_labels(groups, meta, blank_text)
+    return groups.with_columns(labels[repr((meta['field'], meta['lookup']))].alias(name) for name, meta in lookups)
+
+
+def build_leaves(
+    groups: pl.DataFrame,
+    rows_meta: List[Dict],
+    columns_meta: List[Dict],
+    plan: AggregationPlan,
+    blank_text: str,
+) -> Tuple[pl.DataFrame, List[List[Tuple[str, str]]]]:
+    """Row path, column ordinal and order of every group. Groups are ordered natively by their precomputed
+    row sort keys, then their first input row: the position their first record had once the records were
+    sorted by row sort keys. Returns the leaves frame and the column path of every ordinal."""
+    ordered = with_row_sort_keys(with_lookup_labels(groups, rows_meta, columns_meta, blank_text), rows_meta).sort(
+        [*(row_sort_column(level) for level in range(len(rows_meta))), FIRST_ROW]
+    )
+    ordered_groups = list(ordered.iter_rows(named=True))
+    row_paths = [row_path(group, rows_meta, blank_text) for group in ordered_groups]
+    column_ordinals, column_paths = encode_column_paths(ordered_groups, columns_meta, blank_text)
+
+    leaves = ordered.select(
+        *(pl.Series(row_key_column(level), [path[level][0] for path in row_paths], dtype=pl.String) for level in range(len(rows_meta))),
+        *(pl.Series(row_label_column(level), [path[level][1] for path in row_paths], dtype=pl.String) for level in range(len(rows_meta))),
+        pl.Series(COLUMN_ORDINAL, column_ordinals, dtype=pl.UInt32),
+        pl.int_range(pl.len(), dtype=pl.UInt32).alias(ORDER),
+        *state_columns(plan),
+    )
+    return leaves, column_paths
+
+
+# Top-N per level
+class TopN(NamedTuple):
+    """Keys kept at one axis level: the limit ones with the largest (smallest when not descending)
+    finalized value of a slot within their parent; the rest collapse into OTHERS_KEY."""
+    limit: int
+    slot: int
+    descending: bool
+
+
+def top_n(axis_meta: Dict, plan: AggregationPlan) -> Optional[TopN]:
+    """Top-N of a row or column level (its limit and orderBy, ordered by the first value field and
+    descending by default), None without a limit."""
+    if axis_meta.get('limit') is None:
+        return None
+    order_by = axis_meta.get('orderBy') or {}
+    field = order_by.get('field', plan.outputs[0])
+    return TopN(axis_meta['limit'], plan.outputs.index(field), order_by.get('order') != ASCENDING)
+
+
+def top_n_error(axis_meta: Dict, values_meta: List[Dict]) -> Optional[str]:
+    """Why the limit or orderBy of a row or column level can't be applied, if they can't."""
+    limit, order_by = axis_meta.get('limit'), axis_meta.get('orderBy')
+    if limit is not None and (isinstance(limit, bool) or not isinstance(limit, int) or limit < 1):
+        return f'Limit of {axis_meta.get("field")} must be a positive integer: {limit}'
+    if order_by is None:
+        return None
+    if not isinstance(order_by, dict) or order_by.get('field', values_meta[0]['field'] if values_meta else None) not in {meta['field'] for meta in values_meta}:
+        return f'orderBy of {axis_meta.get("field")} must name a value field: {order_by}'
+    if order_by.get('order', ASCENDING) not in (ASCENDING, 'DESC'):
+        return f'orderBy order of {axis_meta.get("field")} must be ASC or DESC: {order_by.get("order")}'
+    return None
+
+
+def top_keys(groups: pl.DataFrame, parents: List[str], key: str, top: TopN, plan: AggregationPlan) -> pl.DataFrame:
+    """The parents and key of the groups (merged states of one level) within the top of their parents,
+    picked by a partial sort on the finalized value (missing values last), ties by first appearance."""
+    value = final_value(plan.slots[top.slot]).cast(pl.Float64)
+    score = (value if top.descending else -value).fill_nan(None).fill_null(float('-inf'))
+    kept = pl.col(key).top_k_by([score, pl.col(ORDER)], top.limit, reverse=[False, True])
+    if not parents:
+        return groups.select(kept)
+    return groups.group_by(parents).agg(kept).explode(key)
+
+
+def collapse_rows(leaves: pl.DataFrame, level: int, top: TopN, plan: AggregationPlan, others_text: str) -> pl.DataFrame:
+    """Leaves whose row key at level is outside the top of its parent moved to the Others key (and
+    label) of that level, keeping their deeper keys; leaves keep their order."""
+    keys = [row_key_column(i) for i in range(level + 1)]
+    groups = merge_groups(leaves, keys, plan)
+    kept = top_keys(groups, keys[:-1], keys[-1], top, plan)
+    if kept.height == groups.height:
+        return leaves
+    marked = leaves.join(kept.with_columns(pl.lit(True).alias(KEPT)), on=keys, how='left', maintain_order='left')
+    return marked.with_columns(
+        pl.when(pl.col(KEPT)).then(pl.col(keys[-1])).otherwise(pl.lit(OTHERS_KEY)).alias(keys[-1]),
+        pl.when(pl.col(KEPT)).then(pl.col(row_label_column(level))).otherwise(pl.lit(others_text)).alias(row_label_column(level)),
+    ).drop(KEPT)
+
+
+def collapse_columns(
+    leaves: pl.DataFrame,
+    column_paths: List[List[Tuple[str, str]]],
+    level: int,
+    top: TopN,
+    plan: AggregationPlan,
+    others_text: str,
+) -> Tuple[pl.DataFrame, List[List[Tuple[str, str]]]]:
+    """Column paths whose value at level is outside the top of their parent path moved to the Others
+    value of that level; paths that become equal share one ordinal (first-appearance order is kept)."""
+    ids: Dict[tuple, int] = {}
+    prefixes = [ids.setdefault(tuple(value for value, _ in path[: level + 1]), len(ids)) for path in column_paths]
+    parents = [ids.setdefault(tuple(value for value, _ in path[:level]), len(ids)) for path in column_paths]
+    ordinals = leaves[COLUMN_ORDINAL]
+    frame = leaves.select(ORDER, *state_columns(plan)).with_columns(
+        pl.Series(COLUMN_PREFIX, prefixes, dtype=pl.UInt32).gather(ordinals),
+        pl.Series(COLUMN_PARENT, parents, dtype=pl.UInt32).gather(ordinals),
+    )
+    groups = merge_groups(frame, [COLUMN_PARENT, COLUMN_PREFIX], plan)
+    kept = set(top_keys(groups, [COLUMN_PARENT], COLUMN_PREFIX, top, plan)[COLUMN_PREFIX])
+    if len(kept) == groups.height:
+        return leaves, column_paths
+
+    others = (OTHERS_KEY, others_text)
+    ordinal_by_values: Dict[Tuple[str, ...], int] = {}
+    collapsed_paths: List[List[Tuple[str, str]]] = []
+    mapping = []
+    for path, prefix in zip(column_paths, prefixes):
+        path = path if prefix in kept else [*path[:level], others, *path[level + 1 :]]
+        ordinal = ordinal_by_values.setdefault(tuple(value for value, _ in path), len(collapsed_paths))
+        if ordinal == len(collapsed_paths):
+            collapsed_paths.append(path)
+        mapping.append(ordinal)
+    return leaves.with_columns(pl.Series(COLUMN_ORDINAL, mapping, dtype=pl.UInt32).gather(ordinals)), collapsed_paths
+
+
+def compact_leaves(leaves: pl.DataFrame, depth: int, plan: AggregationPlan) -> pl.DataFrame:
+    """Leaves merged by row path and column ordinal once collapsed groups share them, renumbered in
+    first-appearance order, each with the labels of its first leaf."""
+    keys = [row_key_column(level) for level in range(depth)]
+    merged = merge_groups(leaves, [*keys, COLUMN_ORDINAL], plan).sort(ORDER)
+    return merged.select(
+        *keys,
+        *(leaves[row_label_column(level)].gather(merged[ORDER]) for level in range(depth)),
+        COLUMN_ORDINAL,
+        pl.int_range(pl.len(), dtype=pl.UInt32).alias(ORDER),
+        *state_columns(plan),
+    )
+
+
+def with_top_n(
+    leaves: pl.DataFrame,
+    column_paths: List[List[Tuple[str, str]]],
+    rows_meta: List[Dict],
+    columns_meta: List[Dict],
+    plan: AggregationPlan,
+    others_text: str,
+) -> Tuple[pl.DataFrame, List[List[Tuple[str, str]]]]:
+    """Leaves and column paths with every limited row and column level collapsed, top-down, so a level
+    is ranked within its parents as they are shown (Others included); the collapsed leaves are then
+    merged, so the state holds no more groups than the tree shows."""
+    collapsed = leaves
+    for level, meta in enumerate(rows_meta):
+        top = top_n(meta, plan)
+        if top is not None:
+            collapsed = collapse_rows(collapsed, level, top, plan, others_text)
+    for level, meta in enumerate(columns_meta):
+        top = top_n(meta, plan)
+        if top is not None:
+            collapsed, column_paths = collapse_columns(collapsed, column_paths, level, top, plan, others_text)
+    return (leaves if collapsed is leaves else compact_leaves(collapsed, len(rows_meta), plan)), column_paths
+
+
+class PivotState(NamedTuple):
+    """Aggregated pivot every row tree is built from: the leaves frame (row keys and labels, column
+    ordinal, first appearance and slot states of every group), the key of every column ordinal, the plan
+    and the number of row levels. Depth-limited trees and later expansions read it, never the records."""
+    leaves: pl.DataFrame
+    column_keys: List[str]
+    plan: AggregationPlan
+    depth: int
+
+
+def aggregate_pivot(
+    records: pl.DataFrame,
+    rows_meta: List[Dict],
+    columns_meta: Optional[List[Dict]],
+    values_meta: List[Dict],
+    blank_text: str,
+    timezone: Optional[str] = None,
+    partitions: int = 1,
+    others_text: str = OTHERS_TEXT,
+) -> Tuple[PivotState, List[Dict]]:
+    """
+    Group the records into the pivot state and build the column headers.
+    records holds one column per flattened field path plus the ROW_INDEX input position; date bucket
+    columns are computed in timezone when given; with partitions > 1 records are grouped in parallel
+    partitions (group_records); row and column levels with a limit keep their top keys and collapse the
+    rest into others_text (with_top_n).
+    """
+    columns_meta = columns_meta or []
+    plan = compile_plan(values_meta)
+    key_paths = list(dict.fromkeys([*(path for meta in rows_meta for path in axis_field_paths(meta)), *column_source_paths(columns_meta)]))
+    records = with_date_buckets(records, columns_meta, timezone)
+    leaves, column_paths = build_leaves(group_records(records, key_paths, plan, partitions), rows_meta, columns_meta, plan, blank_text)
+    leaves, column_paths = with_top_n(leaves, column_paths, rows_meta, columns_meta, plan, others_text)
+
+    # Convert column tree to list - sort numeric for date buckets
+    has_date_bucket = any(c.get('bucket') for c in columns_meta)
+    column_headers = column_tree_to_list(build_column_tree(column_paths), sort_numeric=has_date_bucket)
+    return PivotState(leaves, [column_key(path) for path in column_paths], plan, len(rows_meta)), column_headers
+
+
+def subtotals(leaves: pl.DataFrame, plan: AggregationPlan, levels: range) -> Tuple[Dict[int, pl.DataFrame], Dict[int, pl.DataFrame]]:
+    """Merged cells and totals of the row levels, bottom-up: the cells of the lowest level are merged from
+    the leaves, the cells of every other level from the cells one level below and row totals from the
+    totals (or cells) one level below, so each merge reads an already aggregated, smaller frame."""
+    row_keys = [row_key_column(level) for level in range(levels.stop)]
+    level_cells: Dict[int, pl.DataFrame] = {}
+    level_totals: Dict[int, pl.DataFrame] = {}
+    below_cells, below_totals = leaves, None
+    for level in reversed(levels):
+        keys = row_keys[: level + 1]
+        below_cells = level_cells[level] = merge_groups(below_cells, [*keys, COLUMN_ORDINAL], plan)
+        below_totals = level_totals[level] = merge_groups(below_cells if below_totals is None else below_totals, keys, plan)
+    return level_cells, level_totals
+
+
+def row_nodes(
+    state: PivotState,
+    level_cells: Dict[int, pl.DataFrame],
+    level_totals: Dict[int, pl.DataFrame],
+    levels: range,
+    writer: CellWriter,
+    expansion_key: Optional[Callable[[tuple], str]] = None,
+) -> List[PivotNode]:
+    """Row nodes of the levels, top-down, from their merged subtotals. Nodes of the last level that have
+    children of their own get expansion_key(path) instead of them.
+    The finalized values of a level stay in per-measure arrays (LevelValues): its cells are ordered by
+    node (by first appearance within a node), so each node only keeps the range of its cells."""
+    plan = state.plan
+    value_columns = [value_column(slot.index) for slot in plan.slots]
+    expandable = expansion_key is not None and levels.stop < state.depth
+    roots: List[PivotNode] = []
+    parents: Dict[tuple, PivotNode] = {}
+    for level in levels:
+        keys = [row_key_column(i) for i in range(level + 1)]
+        label_column = row_label_column(level)
+        nodes = by_label(finalized(level_totals[level], keys, plan, state.leaves[label_column]), keys[-1], label_column).with_row_index(NODE_POSITION)
+        cells = (
+            finalized(level_cells[level], [*keys, COLUMN_ORDINAL], plan)
+            .join(nodes.select(*keys, NODE_POSITION), on=keys, how='left', maintain_order='left')
+            .sort(NODE_POSITION, maintain_order=True)
+        )
+        bounds = cells[NODE_POSITION].search_sorted(pl.int_range(nodes.height + 1, dtype=pl.UInt32, eager=True)).to_list()
+        values = LevelValues(
+            [measure_values(nodes[name]) for name in value_columns],
+            array(ARRAY_TYPECODES[pl.UInt32], cells[COLUMN_ORDINAL].to_list()),
+            [measure_values(cells[name]) for name in value_columns],
+            writer,
+        )
+        del cells
+
+        level_nodes: Dict[tuple, PivotNode] = {}
+        for position, row in enumerate(nodes.select(*keys, label_column).iter_rows()):
+            path = row[:-1]
+            node = PivotNode(
+                path[-1], row[-1], level, values, position, range(bounds[position], bounds[position + 1]),
+                expansion_key(path) if expandable and level == levels.stop - 1 else None,
+            )
+            if level > levels.start:
+                parent = parents[path[:-1]]
+                parent.children = parent.children or []
+                parent.children.append(node)
+            else:
+                roots.append(node)
+            level_nodes[path] = node
+        parents = level_nodes
+    return roots
+
+
+def last_level(state: PivotState, top: int, max_depth: Optional[int]) -> int:
+    return state.depth if max_depth is None else min(state.depth, top + max_depth)
+
+
+def pivot_tree(
+    state: PivotState,
+    max_depth: Optional[int] = None,
+    expansion_key: Optional[Callable[[tuple], str]] = None,
+    cell_format: str = KEYED_CELLS,
+) -> Tuple[List[PivotNode], Dict]:
+    """Row hierarchy (the first max_depth levels, all without it) and grand totals of the state, with
+    cells and totals in cell_format."""
+    plan, writer = state.plan, cell_writer(state, cell_format)
+    levels = range(last_level(state, 0, max_depth))
+    level_cells, level_totals = subtotals(state.leaves, plan, levels)
+    hierarchy = row_nodes(state, level_cells, level_totals, levels, writer, expansion_key)
+    # Grand totals from the top level cells
+    grand_cells = merge_groups(level_cells.get(0, state.leaves), [COLUMN_ORDINAL], plan)
+    cells = finalized(grand_cells, [COLUMN_ORDINAL], plan)
+    grand_totals = {
+        'cells': writer.cells(cells[COLUMN_ORDINAL].to_list(), [cells[value_column(slot.index)].to_list() for slot in plan.slots], range(cells.height)),
+        'totals': writer.totals(finalized(merge_groups(grand_cells, [], plan), [], plan).row(0)),
+    }
+    return hierarchy, grand_totals
+
+
+def expand_rows(
+    state: PivotState,
+    path: Tuple[str, ...],
+    max_depth: Optional[int] = None,
+    expansion_key: Optional[Callable[[tuple], str]] = None,
+    cell_format: str = KEYED_CELLS,
+) -> List[PivotNode]:
+    """Children of the row node at path (its row keys, top-down), max_depth levels deep, merged from that
+    node's leaves only: the same nodes, values and order the full tree has under it."""
+    leaves = state.leaves.filter(*(pl.col(row_key_column(level)) == key for level, key in enumerate(path)))
+    levels = range(len(path), last_level(state, len(path), max_depth))
+    return row_nodes(state, *subtotals(leaves, state.plan, levels), levels, cell_writer(state, cell_format), expansion_key)
+
+
+def depth_first_rows(hierarchy: List[PivotNode]) -> Iterator[Dict]:
+    """Output dicts of the row nodes in depth-first order, each without its children (they follow it; a
+    node's level places it under the last node of the level above). Nodes leave the hierarchy as they are
+    yielded, so a streamed tree is released while it is written."""
+    pending = hierarchy[::-1]
+    hierarchy.clear()
+    while pending:
+        node = pending.pop()
+        pending.extend(reversed(node.children or []))
+        node.children = None
+        yield node.to_json()
+
+
+def build_pivot(
+    records: pl.DataFrame,
+    rows_meta: List[Dict],
+    columns_meta: Optional[List[Dict]],
+    values_meta: List[Dict],
+    blank_text: str,
+    timezone: Optional[str] = None,
+    partitions: int = 1,
+) -> Tuple[List[PivotNode], Dict, List[Dict]]:
+    """
+    Build hierarchical pivot structure with subtotals at each level (aggregate_pivot, then pivot_tree).
+    Returns: (row_hierarchy, grand_totals, column_headers)
+    """
+    state, column_headers = aggregate_pivot(records, rows_meta, columns_meta, values_meta, blank_text, timezone, partitions)
+    hierarchy, grand_totals = pivot_tree(state)
+    return hierarchy, grand_totals, column_headers
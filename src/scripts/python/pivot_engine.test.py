@@ -0,0 +1,520 @@
+# /// script
+# dependencies = [
+#   "polars",
+#   "pytest",
+# ]
+# ///
+
+"""
+Tests for pivot_engine.py
+Run with: uv run --script pytest pivot_engine.test.py
+"""
+
+import io
+import json
+import random
+import sys
+from array import array
+from pathlib import Path
+
+import polars as pl
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+from data_ingest import iter_ndjson_batches  # noqa: E402
+from field_projection import pivot_field_paths, project_paths  # noqa: E402
+from json_codec import dumps, loads  # noqa: E402
+import pivot_engine  # noqa: E402
+from pivot_engine import OTHERS_KEY, ROW_INDEX, aggregate_pivot, cell_layout, compile_plan, depth_first_rows, top_n_error, expand_rows, pivot_tree, format_lookup_value, bucket_column, build_pivot, encode_column_paths, with_lookup_labels  # noqa: E402
+
+BLANK_TEXT = '(vazio)'
+
+RECORDS = [
+    {'status': 'Nova', 'type': 'Compra', 'owner': {'_id': 'u1', 'name': 'Ana'}, 'value': 10, 'closeDate': '2024-01-15'},
+    {'status': 'Nova', 'type': 'Locação', 'owner': {'_id': 'u2', 'name': 'Bia'}, 'value': 20, 'closeDate': '2024-02-01'},
+    {'status': 'Ganha', 'type': 'Compra', 'owner': {'_id': 'u1', 'name': 'Ana'}, 'value': 30, 'closeDate': '2023-12-31'},
+    {'status': 'Nova', 'type': 'Compra', 'owner': {'_id': 'u1', 'name': 'Ana'}, 'value': 5},
+    {'type': 'Compra', 'value': None},
+]
+
+
+def tree(nodes: list) -> list:
+    """Helper: the output dicts of PivotNode trees, as they are encoded."""
+    return loads(dumps(nodes))
+
+
+def pivot_nodes(records: list, config: dict, timezone: str = None) -> tuple:
+    """Helper: runs the engine on records the way pivot_table.py ingests them."""
+    stream = io.BytesIO(('\n'.join(json.dumps(r) for r in records) + '\n').encode('utf-8'))
+    paths = pivot_field_paths(config)
+    frame = pl.concat([project_paths(batch, paths) for batch in iter_ndjson_batches(stream)], how='vertical_relaxed')
+    return build_pivot(frame.with_row_index(ROW_INDEX), config['rows'], config.get('columns'), config['values'], BLANK_TEXT, timezone)
+
+
+def pivot(records: list, config: dict, timezone: str = None) -> tuple:
+    """Helper: pivot_nodes with the row tree as output dicts."""
+    hierarchy, grand_totals, column_headers = pivot_nodes(records, config, timezone)
+    return tree(hierarchy), grand_totals, column_headers
+
+
+def test_rows_subtotals_and_grand_totals():
+    config = {'rows': [{'field': 'status'}, {'field': 'type'}], 'values': [{'field': 'value', 'aggregator': 'sum'}]}
+    hierarchy, grand_totals, column_headers = pivot(RECORDS, config)
+
+    assert [(n['key'], n['label'], n['totals']) for n in hierarchy] == [
+        (BLANK_TEXT, BLANK_TEXT, {'value': 0.0}),
+        ('Ganha', 'Ganha', {'value': 30.0}),
+        ('Nova', 'Nova', {'value': 35.0}),
+    ]
+    nova = hierarchy[2]
+    assert [(n['key'], n['level'], n['cells']) for n in nova['children']] == [
+        ('Compra', 1, {'__default__': {'value': 15.0}}),
+        ('Locação', 1, {'__default__': {'value': 20.0}}),
+    ]
+    assert nova['cells'] == {'__default__': {'value': 35.0}}
+    assert 'children' not in nova['children'][0]
+    assert grand_totals == {'cells': {'__default__': {'value': 65.0}}, 'totals': {'value': 65.0}}
+    assert column_headers == []
+
+
+def test_lookup_rows_use_id_as_key_and_label_fields():
+    config = {'rows': [{'field': 'owner', 'lookup': {'simpleFields': ['name']}}], 'values': [{'field': 'value', 'aggregator': 'count'}]}
+    hierarchy, _, _ = pivot(RECORDS, config)
+
+    assert [(n['key'], n['label'], n['totals']) for n in hierarchy] == [
+        (BLANK_TEXT, BLANK_TEXT, {'value': 1.0}),
+        ('u1', 'Ana', {'value': 3.0}),
+        ('u2', 'Bia', {'value': 1.0}),
+    ]
+
+
+def test_columns_split_cells_and_build_headers():
+    config = {
+        'rows': [{'field': 'type'}],
+        'columns': [{'field': 'closeDate', 'bucket': 'Y'}, {'field': 'status'}],
+        'values': [{'field': 'value', 'aggregator': 'sum'}],
+    }
+    hierarchy, grand_totals, column_headers = pivot(RECORDS, config)
+
+    compra = hierarchy[0]
+    assert compra['cells'] == {'2024|Nova': {'value': 10.0}, '2023|Ganha': {'value': 30.0}, '--|Nova': {'value': 5.0}, f'--|{BLANK_TEXT}': {'value': 0.0}}
+    assert list(grand_totals['cells']) == ['2024|Nova', '2023|Ganha', '--|Nova', f'--|{BLANK_TEXT}']
+    assert [(h['key'], [c['key'] for c in h['children']]) for h in column_headers] == [
+        ('2023', ['2023|Ganha']),
+        ('2024', ['2024|Nova']),
+        ('--', [f'--|{BLANK_TEXT}', '--|Nova']),
+    ]
+    assert column_headers[0]['children'][0] == {'key': '2023|Ganha', 'value': 'Ganha', 'label': 'Ganha', 'level': 1, 'expanded': False}
+
+
+def test_date_bucket_columns_use_the_timezone():
+    records = [{'type': 'Compra', 'value': 1, 'closeDate': '2024-01-01T02:00:00.000Z'}, {'type': 'Compra', 'value': 2, 'closeDate': '2024-01-01T12:00:00.000Z'}]
+    config = {'rows': [{'field': 'type'}], 'columns': [{'field': 'closeDate', 'bucket': 'Y'}], 'values': [{'field': 'value', 'aggregator': 'sum'}]}
+
+    assert pivot(records, config)[0][0]['cells'] == {'2024': {'value': 3.0}}
+    assert pivot(records, config, 'America/Sao_Paulo')[0][0]['cells'] == {'2023': {'value': 1.0}, '2024': {'value': 2.0}}
+
+
+def test_compile_plan_slots_and_outputs():
+    plan = compile_plan([
+        {'field': 'value', 'aggregator': 'avg'},
+        {'field': 'code', 'aggregator': 'max'},
+        {'field': 'value', 'aggregator': 'count'},
+        {'field': 'probability'},
+    ])
+
+    # One slot per field, with the aggregator of its first entry and one state column per accumulator part
+    assert [(slot.index, slot.field, slot.aggregator, slot.states) for slot in plan.slots] == [
+        (0, 'value', 'avg', ('__state_0_0', '__state_0_1')),
+        (1, 'code', 'max', ('__state_1_0',)),
+        (2, 'probability', 'sum', ('__state_2_0',)),
+    ]
+    assert plan.outputs == ('value', 'code', 'probability')
+
+
+def test_every_level_finalizes_its_aggregator():
+    config = {'rows': [{'field': 'status'}], 'values': [{'field': 'value', 'aggregator': 'avg'}]}
+    hierarchy, grand_totals, _ = pivot(RECORDS, config)
+
+    # Averages of the numeric values, not of the subtotals; no numeric value gives null
+    assert [n['totals'] for n in hierarchy] == [{'value': None}, {'value': 30.0}, {'value': 35.0 / 3}]
+    assert hierarchy[2]['cells'] == {'__default__': {'value': 35.0 / 3}}
+    assert grand_totals == {'cells': {'__default__': {'value': 65.0 / 4}}, 'totals': {'value': 65.0 / 4}}
+
+
+def test_full_aggregator_set():
+    config = {
+        'rows': [{'field': 'type'}],
+        'values': [
+            {'field': 'value', 'aggregator': 'max'},
+            {'field': 'status', 'aggregator': 'countDistinct'},
+            {'field': 'owner._id', 'aggregator': 'count'},
+            {'field': 'closeDate', 'aggregator': 'min'},
+        ],
+    }
+    hierarchy, grand_totals, _ = pivot(RECORDS, config)
+
+    compra = hierarchy[0]
+    assert compra['totals'] == {'value': 30.0, 'status': 2, 'owner._id': 4.0, 'closeDate': None}
+    assert grand_totals['totals'] == {'value': 30.0, 'status': 2, 'owner._id': 5.0, 'closeDate': None}
+
+
+def test_median_and_percentile():
+    records = [{'type': 'a', 'value': value} for value in (1, 2, 3, 10)] + [{'type': 'b', 'value': 4}]
+    median = {'rows': [{'field': 'type'}], 'values': [{'field': 'value', 'aggregator': 'median'}]}
+    percentile = {'rows': [{'field': 'type'}], 'values': [{'field': 'value', 'aggregator': 'percentile', 'percentile': 25}]}
+
+    hierarchy, grand_totals, _ = pivot(records, median)
+    assert [n['totals'] for n in hierarchy] == [{'value': 2.5}, {'value': 4.0}]
+    assert grand_totals['totals'] == {'value': 3.0}
+
+    hierarchy, grand_totals, _ = pivot(records, percentile)
+    assert [n['totals'] for n in hierarchy] == [{'value': 1.75}, {'value': 4.0}]
+    assert grand_totals['totals'] == {'value': 2.0}
+
+
+def test_siblings_with_same_label_keep_first_appearance_order():
+    records = [
+        {'owner': {'_id': 'u2', 'name': 'Ana'}, 'team': 'b', 'value': 1},
+        {'owner': {'_id': 'u1', 'name': 'ana'}, 'team': 'a', 'value': 1},
+        {'owner': {'_id': 'u3', 'name': 'Caio'}, 'team': 'a', 'value': 1},
+    ]
+    config = {
+        'rows': [{'field': 'owner', 'lookup': {'simpleFields': ['name']}}, {'field': 'team'}],
+        'values': [{'field': 'value', 'aggregator': 'sum'}],
+    }
+    hierarchy, _, _ = pivot(records, config)
+
+    # Records were sorted by (owner label, team) before nodes were created: u1/'a' comes before u2/'b'
+    assert [n['key'] for n in hierarchy] == ['u1', 'u2', 'u3']
+
+
+def test_column_paths_are_encoded_once_per_distinct_value_path():
+    columns_meta = [{'field': 'owner', 'lookup': {'simpleFields': ['name']}}, {'field': 'closeDate', 'bucket': 'Y'}]
+    groups = [
+        {'owner._id': 'u1', 'owner.name': 'Ana', bucket_column(1): '2024'},
+        {'owner._id': 'u1', 'owner.name': 'Ana', bucket_column(1): '2023'},
+        {'owner._id': 'u1', 'owner.name': 'Ana Maria', bucket_column(1): '2024'},
+        {'owner._id': 'u1', 'owner.name': 'Ana', bucket_column(1): '2024'},
+        {'owner._id': None, 'owner.name': None, bucket_column(1): '--'},
+    ]
+
+    labelled = with_lookup_labels(pl.DataFrame(groups), [], columns_meta, BLANK_TEXT)
+    ordinals, paths = encode_column_paths(list(labelled.iter_rows(named=True)), columns_meta, BLANK_TEXT)
+
+    # A renamed lookup keeps the ordinal (and label) of its first appearance
+    assert ordinals == [0, 1, 0, 0, 2]
+    assert paths == [[('u1', 'Ana'), ('2024', '2024')], [('u1', 'Ana'), ('2023', '2023')], [(BLANK_TEXT, BLANK_TEXT), ('--', '--')]]
+
+
+def test_column_source_values_are_memoized_by_type():
+    ordinals, paths = encode_column_paths([{'flag': True}, {'flag': 1}, {'flag': True}], [{'field': 'flag'}], BLANK_TEXT)
+
+    assert ordinals == [0, 1, 0]
+    assert [path[0][0] for path in paths] == ['True', '1']
+
+
+def test_lookup_labels_are_formatted_once_per_distinct_lookup(monkeypatch):
+    calls = []
+    format_lookup_value = pivot_engine.format_lookup_value
+    monkeypatch.setattr(pivot_engine, 'format_lookup_value', lambda *args: calls.append(args[0]) or format_lookup_value(*args))
+    config = {
+        'rows': [{'field': 'owner', 'lookup': {'simpleFields': ['name', '_id']}}, {'field': 'status'}],
+        'columns': [{'field': 'owner', 'lookup': {'simpleFields': ['name', '_id']}}],
+        'values': [{'field': 'value', 'aggregator': 'sum'}],
+    }
+    hierarchy, _, column_headers = pivot(RECORDS, config)
+
+    # Three distinct owners (u1, u2 and none) across five records, shared by the row and column levels
+    assert len(calls) == 3
+    assert [n['label'] for n in hierarchy] == [BLANK_TEXT, 'Ana - u1', 'Bia - u2']
+    assert [h['label'] for h in column_headers] == [BLANK_TEXT, 'Ana - u1', 'Bia - u2']
+
+
+def legacy_row_order(records: list, rows_meta: list) -> list:
+    """Reference for node order as pivot_table.py had it: records sorted by their sort key tuple, nodes
+    created in that order, then siblings stably sorted by case-folded label. Returns key paths depth-first."""
+
+    def flat(record: dict) -> dict:
+        return {f'{k}.{sk}': sv for k, v in record.items() if isinstance(v, dict) for sk, sv in v.items()} | record
+
+    def label(record: dict, meta: dict) -> str:
+        if meta.get('lookup'):
+            return format_lookup_value(record, meta['field'], meta['lookup'], BLANK_TEXT)
+        value = record.get(meta['field'])
+        return BLANK_TEXT if value is None or value == '' else str(value)
+
+    def sort_key(record: dict) -> tuple:
+        return tuple(
+            label(record, meta).lower() if meta.get('lookup') else (str(record.get(meta['field'])).lower() if record.get(meta['field']) else '')
+            for meta in rows_meta
+        )
+
+    def key(record: dict, meta: dict) -> str:
+        value = record.get(f'{meta["field"]}._id')
+        value = record.get(meta['field'], '') if value is None else value
+        return (str(value) if value is not None else '') or BLANK_TEXT
+
+    tree: dict = {}
+    for record in sorted(map(flat, records), key=sort_key):
+        children = tree
+        for meta in rows_meta:
+            node = children.setdefault(key(record, meta), {'label': label(record, meta), 'children': {}})
+            children = node['children']
+
+    def walk(children: dict, path: tuple) -> list:
+        ordered = sorted(children.items(), key=lambda item: item[1]['label'].lower())
+        return [p for node_key, node in ordered for p in [(*path, node_key), *walk(node['children'], (*path, node_key))]]
+
+    return walk(tree, ())
+
+
+def test_node_order_matches_record_presort():
+    rng = random.Random(7)
+    owners = [{'_id': 'u1', 'name': 'Ana'}, {'_id': 'u2', 'name': 'ana'}, {'_id': 'u3', 'name': 'ANA'}, {'_id': 'u4', 'name': 'Bia'}, {'_id': 'u5'}, None]
+    statuses = ['Nova', 'nova', 'NOVA', 'Ganha', 'ganha', '', None, 'Élan', 'élan', 'zeta', 'Zeta']
+    records = [
+        {'owner': rng.choice(owners), 'status': rng.choice(statuses), 'team': rng.choice(['b', 'B', 'a', 'A', None]), 'value': 1}
+        for _ in range(400)
+    ]
+    rows_meta = [{'field': 'status'}, {'field': 'owner', 'lookup': {'simpleFields': ['name']}}, {'field': 'team'}]
+    hierarchy, _, _ = pivot(records, {'rows': rows_meta, 'values': [{'field': 'value', 'aggregator': 'sum'}]})
+
+    def walk(nodes: list, path: tuple) -> list:
+        return [p for node in nodes for p in [(*path, node['key']), *walk(node.get('children', []), (*path, node['key']))]]
+
+    assert walk(hierarchy, ()) == legacy_row_order(records, rows_meta)
+
+
+def test_deep_subtotals_match_records_of_each_node():
+    rng = random.Random(11)
+    fields = ['a', 'b', 'c', 'd']
+    records = [{**{field: rng.choice('xyz') for field in fields}, 'month': rng.choice('12'), 'value': rng.choice([1, 2, 5, None])} for _ in range(300)]
+    values = [{'field': 'value', 'aggregator': 'avg'}, {'field': 'month', 'aggregator': 'countDistinct'}]
+    config = {'rows': [{'field': field} for field in fields], 'columns': [{'field': 'month'}], 'values': values}
+    hierarchy, grand_totals, _ = pivot(records, config)
+
+    def expected(group: list) -> dict:
+        numbers = [r['value'] for r in group if r['value'] is not None]
+        return {'value': sum(numbers) / len(numbers) if numbers else None, 'month': len({r['month'] for r in group})}
+
+    def check(nodes: list, group: list, level: int):
+        for node in nodes:
+            node_group = [r for r in group if r[fields[level]] == node['key']]
+            assert node['totals'] == pytest.approx(expected(node_group))
+            assert node['cells'] == {month: pytest.approx(expected([r for r in node_group if r['month'] == month])) for month in sorted({r['month'] for r in node_group})}
+            check(node.get('children', []), node_group, level + 1)
+
+    check(hierarchy, records, 0)
+    assert grand_totals['totals'] == pytest.approx(expected(records))
+
+
+def test_partitioned_pivot_matches_serial():
+    rng = random.Random(5)
+    owners = [{'_id': f'u{i}', 'name': f'User {i % 3}'} for i in range(6)] + [None]
+    records = [
+        {'owner': rng.choice(owners), 'status': rng.choice(['Nova', 'Ganha', None]), 'tags': rng.choice([['a'], ['a', 'b'], None]), 'value': rng.randint(0, 9)}
+        for _ in range(200)
+    ]
+    config = {
+        'rows': [{'field': 'status'}, {'field': 'owner', 'lookup': {'simpleFields': ['name']}}],
+        'columns': [{'field': 'tags'}],
+        'values': [{'field': 'value', 'aggregator': 'sum'}, {'field': 'value', 'aggregator': 'median'}, {'field': 'owner._id', 'aggregator': 'countDistinct'}],
+    }
+    paths = pivot_field_paths(config)
+    frame = project_paths(pl.DataFrame(records), paths).with_row_index(ROW_INDEX)
+    serial = build_pivot(frame, config['rows'], config['columns'], config['values'], BLANK_TEXT)
+
+    for partitions in (2, 3, 8):
+        assert dumps(build_pivot(frame, config['rows'], config['columns'], config['values'], BLANK_TEXT, None, partitions)) == dumps(serial)
+
+
+def test_depth_limited_tree_expands_to_the_full_tree():
+    config = {
+        'rows': [{'field': 'status'}, {'field': 'owner', 'lookup': {'simpleFields': ['name']}}, {'field': 'type'}],
+        'columns': [{'field': 'type'}],
+        'values': [{'field': 'value', 'aggregator': 'sum'}],
+    }
+    full, full_totals, _ = pivot(RECORDS, config)
+    paths = pivot_field_paths(config)
+    frame = project_paths(pl.DataFrame(RECORDS), paths).with_row_index(ROW_INDEX)
+    state, _ = aggregate_pivot(frame, config['rows'], config['columns'], config['values'], BLANK_TEXT)
+
+    def key(path: tuple) -> str:
+        return '/'.join(path)
+
+    nodes, grand_totals = pivot_tree(state, 1, key)
+    hierarchy = tree(nodes)
+    assert grand_totals == full_totals
+    assert [(n['key'], n['expansionKey'], n['totals'], 'children' in n) for n in hierarchy] == [(n['key'], n['key'], n['totals'], False) for n in full]
+
+    nova = ('Nova',)
+    assert tree(expand_rows(state, nova)) == full[2]['children']
+    children = tree(expand_rows(state, nova, 1, key))
+    assert [n['expansionKey'] for n in children] == ['Nova/u1', 'Nova/u2']
+    assert tree(expand_rows(state, ('Nova', 'u1'), 1, key)) == full[2]['children'][0]['children']
+
+
+def test_compact_cells_decode_to_keyed_cells():
+    config = {
+        'rows': [{'field': 'status'}, {'field': 'type'}],
+        'columns': [{'field': 'owner', 'lookup': {'simpleFields': ['name']}}],
+        'values': [{'field': 'value', 'aggregator': 'sum'}, {'field': 'value', 'aggregator': 'count'}, {'field': 'closeDate', 'aggregator': 'countDistinct'}],
+    }
+    paths = pivot_field_paths(config)
+    frame = project_paths(pl.DataFrame(RECORDS), paths).with_row_index(ROW_INDEX)
+    state, _ = aggregate_pivot(frame, config['rows'], config['columns'], config['values'], BLANK_TEXT)
+    keyed_nodes, keyed_totals = pivot_tree(state)
+    keyed = tree(keyed_nodes)
+
+    layout = cell_layout(state, 'dense')
+    columns, measures = layout['columns'], layout['measures']
+    assert measures == ['value', 'closeDate']
+
+    def decode_dense(cells: list) -> dict:
+        return {
+            column: dict(zip(measures, cells[ordinal * len(measures) : (ordinal + 1) * len(measures)]))
+            for ordinal, column in enumerate(columns)
+            if any(value is not None for value in cells[ordinal * len(measures) : (ordinal + 1) * len(measures)])
+        }
+
+    def decode_sparse(cells: list) -> dict:
+        return {columns[ordinal]: dict(zip(measures, values)) for ordinal, *values in cells}
+
+    for cell_format, decode in (('dense', decode_dense), ('sparse', decode_sparse)):
+        nodes, grand_totals = pivot_tree(state, cell_format=cell_format)
+        hierarchy = tree(nodes)
+        assert decode(grand_totals['cells']) == keyed_totals['cells']
+        assert dict(zip(measures, grand_totals['totals'])) == keyed_totals['totals']
+
+        def check(nodes: list, keyed_nodes: list) -> None:
+            assert len(nodes) == len(keyed_nodes)
+            for node, keyed_node in zip(nodes, keyed_nodes):
+                assert decode(node['cells']) == keyed_node['cells']
+                assert dict(zip(measures, node['totals'])) == keyed_node['totals']
+                check(node.get('children', []), keyed_node.get('children', []))
+
+        check(hierarchy, keyed)
+        assert len(hierarchy[0]['cells']) == (len(columns) * len(measures) if cell_format == 'dense' else len(keyed[0]['cells']))
+        check(tree(expand_rows(state, ('Nova',), cell_format=cell_format)), keyed[2]['children'])
+
+
+def test_depth_first_rows_rebuild_the_tree_from_levels():
+    config = {
+        'rows': [{'field': 'status'}, {'field': 'owner', 'lookup': {'simpleFields': ['name']}}, {'field': 'type'}],
+        'values': [{'field': 'value', 'aggregator': 'sum'}],
+    }
+    hierarchy, _, _ = pivot_nodes(RECORDS, config)
+    expected = tree(hierarchy)
+
+    rows = list(depth_first_rows(hierarchy))
+    assert hierarchy == []
+    assert all('children' not in row for row in rows)
+    assert [(row['level'], row['key']) for row in rows][6:] == [(0, 'Nova'), (1, 'u1'), (2, 'Compra'), (1, 'u2'), (2, 'Locação')]
+
+    # A row goes under the last row of the level above
+    roots, last = [], {}
+    for row in rows:
+        (last[row['level'] - 1].setdefault('children', []) if row['level'] else roots).append(row)
+        last[row['level']] = row
+    assert roots == expected
+
+
+def test_nodes_stay_compact_until_encoded():
+    config = {
+        'rows': [{'field': 'status'}, {'field': 'type'}],
+        'columns': [{'field': 'owner', 'lookup': {'simpleFields': ['name']}}],
+        'values': [{'field': 'value', 'aggregator': 'sum'}, {'field': 'closeDate', 'aggregator': 'countDistinct'}],
+    }
+    hierarchy, _, _ = pivot_nodes(RECORDS, config)
+    nova = hierarchy[2]
+
+    assert not hasattr(nova, '__dict__')
+    assert all(node.values is nova.values for node in hierarchy)
+    assert nova.children[0].values is nova.children[1].values
+    assert all(isinstance(measure, array) for measure in [*nova.values.totals, *nova.values.cells])
+
+    output = nova.to_json()
+    assert output['cells'] == {'u1': {'value': 15.0, 'closeDate': 1}, 'u2': {'value': 20.0, 'closeDate': 1}}
+    assert output['totals'] == {'value': 35.0, 'closeDate': 2}
+    assert [child.key for child in output['children']] == ['Compra', 'Locação']
+    assert loads(dumps(nova)) == {**output, 'children': [child.to_json() for child in nova.children]}
+
+
+def test_depth_first_rows_converts_each_node_once(monkeypatch):
+    config = {
+        'rows': [{'field': 'status'}, {'field': 'owner', 'lookup': {'simpleFields': ['name']}}, {'field': 'type'}],
+        'columns': [{'field': 'type'}],
+        'values': [{'field': 'value', 'aggregator': 'sum'}],
+    }
+    hierarchy, _, _ = pivot_nodes(RECORDS, config)
+    expected = tree(hierarchy)
+    converted = []
+    to_json = pivot_engine.PivotNode.to_json
+    monkeypatch.setattr(pivot_engine.PivotNode, 'to_json', lambda node: converted.append(node) or to_json(node))
+
+    rows = list(depth_first_rows(hierarchy))
+
+    def count(nodes: list) -> int:
+        return sum(1 + count(node.get('children', [])) for node in nodes)
+
+    assert len(rows) == count(expected)
+    assert len(converted) == len(rows)
+    assert len({id(node) for node in converted}) == len(rows)
+
+
+def test_top_n_levels_collapse_the_rest_into_others():
+    rng = random.Random(3)
+    records = [{'customer': f'c{rng.randint(0, 19)}', 'product': rng.choice('abcde'), 'month': f'm{rng.randint(1, 12)}', 'value': rng.randint(1, 100)} for _ in range(400)]
+    config = {
+        'rows': [{'field': 'customer', 'limit': 3}, {'field': 'product', 'limit': 2, 'orderBy': {'field': 'value', 'order': 'ASC'}}],
+        'columns': [{'field': 'month', 'limit': 4}],
+        'values': [{'field': 'value', 'aggregator': 'sum'}],
+    }
+    hierarchy, grand_totals, column_headers = pivot(records, config)
+
+    def total(rows: list) -> float:
+        return float(sum(record['value'] for record in rows))
+
+    by_customer = {}
+    for record in records:
+        by_customer.setdefault(record['customer'], []).append(record)
+    top = sorted(by_customer, key=lambda customer: -total(by_customer[customer]))[:3]
+
+    assert [node['key'] for node in hierarchy] == [*sorted(top), OTHERS_KEY]
+    assert hierarchy[-1]['label'] == 'Outros'
+    others = [record for record in records if record['customer'] not in top]
+    assert hierarchy[-1]['totals'] == {'value': total(others)}
+    assert grand_totals['totals'] == {'value': total(records)}
+
+    # The smallest two products of each customer (Others included), then Others
+    for node, rows in zip(hierarchy, [*(by_customer[customer] for customer in sorted(top)), others]):
+        by_product = {}
+        for record in rows:
+            by_product.setdefault(record['product'], []).append(record)
+        bottom = sorted(by_product, key=lambda product: total(by_product[product]))[:2]
+        assert [child['key'] for child in node['children']] == [*sorted(bottom), OTHERS_KEY]
+        assert node['children'][-1]['totals'] == {'value': total([record for record in rows if record['product'] not in bottom])}
+
+    by_month = {}
+    for record in records:
+        by_month.setdefault(record['month'], []).append(record)
+    top_months = sorted(by_month, key=lambda month: -total(by_month[month]))[:4]
+    assert [header['value'] for header in column_headers][-1] == OTHERS_KEY
+    assert set(grand_totals['cells']) == {*top_months, OTHERS_KEY}
+    assert grand_totals['cells'][OTHERS_KEY] == {'value': total([record for record in records if record['month'] not in top_months])}
+
+
+def test_top_n_errors():
+    values = [{'field': 'value', 'aggregator': 'sum'}]
+    assert top_n_error({'field': 'status', 'limit': 10, 'orderBy': {'field': 'value', 'order': 'DESC'}}, values) is None
+    assert top_n_error({'field': 'status', 'limit': 0}, values) == 'Limit of status must be a positive integer: 0'
+    assert top_n_error({'field': 'status', 'limit': 5, 'orderBy': {'field': 'other'}}, values).startswith('orderBy of status must name a value field')
+    assert top_n_error({'field': 'status', 'limit': 5, 'orderBy': {'order': 'UP'}}, values) == 'orderBy order of status must be ASC or DESC: UP'
+
+
+def test_values_are_coerced_like_float():
+    records = [{'status': 'a', 'value': '12'}, {'status': 'a', 'value': 'abc'}, {'status': 'a', 'value': None}, {'status': 'a'}]
+    config = {'rows': [{'field': 'status'}], 'values': [{'field': 'value', 'aggregator': 'sum'}]}
+
+    assert pivot(records, config)[1]['totals'] == {'value': 12.0}
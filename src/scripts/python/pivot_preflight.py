@@ -0,0 +1,220 @@
+# pivot_preflight.py
+# Size pre-flight of a pivot, run by pivot_table.py on the records before they are grouped (date bucket
+# columns already computed), so a config that would build a huge result (columns on a raw timestamp,
+# rows on a near-unique field) is caught before the group-by and the tree are built:
+#   1. distinct counts are estimated with HyperLogLog sketches (polars approx_n_unique) in one select
+#      over the key sources: every row and column level alone, every row and column level prefix (the
+#      keys of the levels above included) and every row x column combination (the leaves)
+#   2. the result is projected from them: nodes per row level (a limited level keeps at most limit + 1
+#      keys per parent), cells per shown row level (at most one per column, never more than the leaves
+#      below) and values per cell and total. Memory is the larger of the two Python peaks, measured with
+#      tracemalloc: the rows of every group while the leaves are built, and the tree (cells, values, nodes)
+#   3. over a threshold (params.preflight: maxCells, maxMemoryMb), the pivot fails fast with the
+#      estimate (onExceed 'error', the default), or levels whose distinct count exceeds topN get a limit
+#      of topN and collapse the rest into Others (onExceed 'topN', pivot_engine.with_top_n), widest
+#      first, until the projection is within the thresholds; levels with a limit keep theirs. It still
+#      fails when limiting every such level is not enough.
+# Estimates are approximate (sketches are within a few percent) and projections are upper bounds.
+# ADR-0010: no-magic-numbers, functional style.
+
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import polars as pl
+
+from field_projection import LOOKUP_ID, PATH_SEP
+from pivot_engine import bucket_column
+
+ON_EXCEED_ERROR = 'error'
+ON_EXCEED_TOP_N = 'topN'
+ON_EXCEED = (ON_EXCEED_ERROR, ON_EXCEED_TOP_N)
+DEFAULT_TOP_N = 50
+# JSON-RPC server error code of a pivot over its thresholds; the error data is the estimate
+PREFLIGHT_ERROR_CODE = -32001
+ROWS_AXIS = 'rows'
+COLUMNS_AXIS = 'columns'
+LEAVES = '__leaves'
+# Python memory (tracemalloc, 300k records) of one cell (its column ordinal), one value in a cell or
+# totals (unboxed in its level's array, boxed while it is read), one row or column header node, and one
+# group while the leaves are built
+CELL_BYTES = 24
+VALUE_BYTES = 16
+NODE_BYTES = 350
+LEAF_BYTES = 1200
+BYTES_PER_MB = 1024 * 1024
+MB_DECIMALS = 1
+
+
+class Thresholds(NamedTuple):
+    """params.preflight: projected cells and memory a pivot may reach, and what happens over them."""
+    max_cells: Optional[int]
+    max_memory_mb: Optional[float]
+    on_exceed: str
+    top_n: int
+
+
+class Sketch(NamedTuple):
+    """Estimated distinct keys of every row and column level alone and of every level prefix, and of
+    the row x column leaves."""
+    rows: List[int]
+    row_prefixes: List[int]
+    columns: List[int]
+    column_prefixes: List[int]
+    leaves: int
+
+
+class Projection(NamedTuple):
+    """Projected result: nodes of every row level and column header level, leaves, cells and memory."""
+    rows: List[int]
+    columns: List[int]
+    leaves: int
+    cells: int
+    memory_mb: float
+
+
+def is_positive_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0
+
+
+def thresholds_error(preflight: Any) -> Optional[str]:
+    """Why params.preflight can't be applied, if it can't."""
+    if not isinstance(preflight, dict):
+        return f'preflight must be an object: {preflight}'
+    for name in ('maxCells', 'topN'):
+        value = preflight.get(name)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value < 1):
+            return f'preflight {name} must be a positive integer: {value}'
+    if preflight.get('maxMemoryMb') is not None and not is_positive_number(preflight['maxMemoryMb']):
+        return f'preflight maxMemoryMb must be a positive number: {preflight["maxMemoryMb"]}'
+    if (preflight.get('onExceed') or ON_EXCEED_ERROR) not in ON_EXCEED:
+        return f'preflight onExceed must be one of {", ".join(ON_EXCEED)}: {preflight.get("onExceed")}'
+    return None
+
+
+def thresholds(preflight: Dict) -> Thresholds:
+    """Thresholds of params.preflight; null (unset) ones are not checked or take their default."""
+    return Thresholds(preflight.get('maxCells'), preflight.get('maxMemoryMb'), preflight.get('onExceed') or ON_EXCEED_ERROR, preflight.get('topN') or DEFAULT_TOP_N)
+
+
+def key_sources(meta: Dict) -> List[str]:
+    """Columns the key of a row or column level is derived from: the field and its lookup _id."""
+    return [meta['field'], f'{meta["field"]}{PATH_SEP}{LOOKUP_ID}']
+
+
+def column_key_sources(level: int, meta: Dict) -> List[str]:
+    """Date bucket columns are keyed by their bucket value column (pivot_engine.with_date_buckets)."""
+    return [bucket_column(level)] if meta.get('bucket') else key_sources(meta)
+
+
+def distinct(sources: List[str], name: str) -> pl.Expr:
+    return pl.struct(sources).hash().approx_n_unique().alias(name) if sources else pl.lit(1, dtype=pl.UInt32).alias(name)
+
+
+def sketch(records: pl.DataFrame, row_sources: List[List[str]], column_sources: List[List[str]]) -> Sketch:
+    """Distinct count estimates of the levels given the key sources of every row and column level."""
+    def prefixes(levels: List[List[str]]) -> List[List[str]]:
+        return [list(dict.fromkeys(source for level in levels[: depth + 1] for source in level)) for depth in range(len(levels))]
+
+    axes = {ROWS_AXIS: row_sources, COLUMNS_AXIS: column_sources}
+    counts = records.select(
+        *(distinct(sources, f'{axis}{level}') for axis, levels in axes.items() for level, sources in enumerate(levels)),
+        *(distinct(sources, f'{axis}{level}{PATH_SEP}') for axis, levels in axes.items() for level, sources in enumerate(prefixes(levels))),
+        distinct([*(prefixes(row_sources) or [[]])[-1], *(prefixes(column_sources) or [[]])[-1]], LEAVES),
+    ).row(0, named=True)
+    return Sketch(
+        [counts[f'{ROWS_AXIS}{level}'] for level in range(len(row_sources))],
+        [counts[f'{ROWS_AXIS}{level}{PATH_SEP}'] for level in range(len(row_sources))],
+        [counts[f'{COLUMNS_AXIS}{level}'] for level in range(len(column_sources))],
+        [counts[f'{COLUMNS_AXIS}{level}{PATH_SEP}'] for level in range(len(column_sources))],
+        counts[LEAVES],
+    )
+
+
+def level_nodes(distincts: List[int], prefixes: List[int], limits: List[Optional[int]]) -> List[int]:
+    """Keys of every level once limited: a prefix has at most the keys of its parent times the keys of
+    its level, and a limited level at most limit + 1 (Others) keys per parent."""
+    nodes: List[int] = []
+    for count, prefix, limit in zip(distincts, prefixes, limits):
+        per_parent = count if limit is None else min(count, limit + 1)
+        nodes.append(min(prefix, (nodes[-1] if nodes else 1) * per_parent))
+    return nodes
+
+
+def project(sketch: Sketch, rows_meta: List[Dict], columns_meta: List[Dict], measures: int, shown_levels: int, dense: bool) -> Projection:
+    """Result size of the levels as limited in their metas. Dense cells take every column of a node;
+    keyed and sparse ones only the columns it has records in."""
+    rows = level_nodes(sketch.rows, sketch.row_prefixes, [meta.get('limit') for meta in rows_meta])
+    columns = level_nodes(sketch.columns, sketch.column_prefixes, [meta.get('limit') for meta in columns_meta])
+    column_leaves = columns[-1] if columns else 1
+    leaves = min(sketch.leaves, rows[-1] * column_leaves)
+    shown = rows[:shown_levels]
+    cells = sum(nodes * column_leaves if dense else min(nodes * column_leaves, leaves) for nodes in shown) + column_leaves
+    values = (cells + sum(shown) + 1) * measures
+    tree = cells * CELL_BYTES + values * VALUE_BYTES + (sum(shown) + sum(columns)) * NODE_BYTES
+    memory = max(tree, leaves * LEAF_BYTES)
+    return Projection(rows, columns, leaves, cells, round(memory / BYTES_PER_MB, MB_DECIMALS))
+
+
+def exceeded(projection: Projection, limits: Thresholds) -> List[str]:
+    """The thresholds the projection is over, as messages."""
+    return [
+        *([f'{projection.cells} cells (max {limits.max_cells})'] if limits.max_cells is not None and projection.cells > limits.max_cells else []),
+        *([f'{projection.memory_mb} MB (max {limits.max_memory_mb})'] if limits.max_memory_mb is not None and projection.memory_mb > limits.max_memory_mb else []),
+    ]
+
+
+def with_limit(metas: List[Dict], level: int, limit: int) -> List[Dict]:
+    return [{**meta, 'limit': limit} if index == level else meta for index, meta in enumerate(metas)]
+
+
+def report(projection: Projection, records: int, limits: Thresholds, limited: List[Dict]) -> Dict[str, Any]:
+    """Estimate sent to clients: with the error of a pivot over its thresholds, or with the result of one
+    whose levels were limited (limited lists them)."""
+    return {
+        'records': records,
+        'rows': projection.rows,
+        'columns': projection.columns,
+        'leaves': projection.leaves,
+        'cells': projection.cells,
+        'memoryMb': projection.memory_mb,
+        'maxCells': limits.max_cells,
+        'maxMemoryMb': limits.max_memory_mb,
+        'limited': limited,
+    }
+
+
+def preflight(
+    records: pl.DataFrame,
+    rows_meta: List[Dict],
+    columns_meta: List[Dict],
+    measures: int,
+    shown_levels: int,
+    dense: bool,
+    limits: Thresholds,
+) -> Tuple[List[Dict], List[Dict], Optional[Dict[str, Any]], List[str]]:
+    """Row and column levels to aggregate, the report (None when within the thresholds as configured)
+    and the thresholds still exceeded (the pivot must fail with the report when there are any)."""
+    estimate = sketch(records, [key_sources(meta) for meta in rows_meta], [column_key_sources(level, meta) for level, meta in enumerate(columns_meta)])
+    projection = project(estimate, rows_meta, columns_meta, measures, shown_levels, dense)
+    over = exceeded(projection, limits)
+    if not over:
+        return rows_meta, columns_meta, None, []
+    if limits.on_exceed == ON_EXCEED_ERROR:
+        return rows_meta, columns_meta, report(projection, records.height, limits, []), over
+
+    # Widest levels first, until the projection is within the thresholds or no level exceeds topN
+    axes = {ROWS_AXIS: rows_meta, COLUMNS_AXIS: columns_meta}
+    candidates = sorted(
+        ((count, axis, level) for axis, counts in ((ROWS_AXIS, estimate.rows), (COLUMNS_AXIS, estimate.columns)) for level, count in enumerate(counts)),
+        key=lambda candidate: -candidate[0],
+    )
+    limited: List[Dict] = []
+    for count, axis, level in candidates:
+        if not over or count <= limits.top_n:
+            break
+        if axes[axis][level].get('limit') is not None:
+            continue
+        axes[axis] = with_limit(axes[axis], level, limits.top_n)
+        limited.append({'axis': axis, 'field': axes[axis][level]['field'], 'limit': limits.top_n})
+        projection = project(estimate, axes[ROWS_AXIS], axes[COLUMNS_AXIS], measures, shown_levels, dense)
+        over = exceeded(projection, limits)
+    return axes[ROWS_AXIS], axes[COLUMNS_AXIS], report(projection, records.height, limits, limited), over
@@ -0,0 +1,95 @@
+# /// script
+# dependencies = [
+#   "polars",
+#   "pytest",
+# ]
+# ///
+
+"""
+Tests for pivot_preflight.py
+Run with: uv run --script pytest pivot_preflight.test.py
+"""
+
+import sys
+from pathlib import Path
+
+import polars as pl
+
+sys.path.insert(0, str(Path(__file__).parent))
+from field_projection import pivot_field_paths, project_paths  # noqa: E402
+from pivot_engine import OTHERS_KEY, ROW_INDEX, aggregate_pivot, pivot_tree  # noqa: E402
+from pivot_preflight import Thresholds, preflight, project, sketch, thresholds, thresholds_error  # noqa: E402
+
+CUSTOMERS = 40
+STATUSES = ('Nova', 'Ganha', 'Perdida')
+RECORDS = [{'customer': f'c{index % CUSTOMERS:02d}', 'status': STATUSES[index % len(STATUSES)], 'value': index} for index in range(CUSTOMERS * len(STATUSES))]
+ROWS = [{'field': 'status'}, {'field': 'customer'}]
+VALUES = [{'field': 'value', 'aggregator': 'sum'}]
+SOURCES = [['status', 'status._id'], ['customer', 'customer._id']]
+
+
+def records(rows=ROWS, columns=()):
+    frame = project_paths(pl.DataFrame(RECORDS), pivot_field_paths({'rows': rows, 'columns': list(columns), 'values': VALUES}))
+    return frame.with_row_index(ROW_INDEX)
+
+
+def count_nodes(nodes):
+    return sum(1 + count_nodes(node.children or []) for node in nodes)
+
+
+def test_sketch_estimates_distinct_keys_of_levels_prefixes_and_leaves():
+    estimate = sketch(records(), SOURCES, [])
+
+    assert (estimate.rows, estimate.row_prefixes, estimate.columns, estimate.leaves) == ([3, 40], [3, 120], [], 120)
+
+
+def test_projection_matches_the_tree_and_caps_limited_levels():
+    estimate = sketch(records(), SOURCES, [])
+    state, _ = aggregate_pivot(records(), ROWS, None, VALUES, '(vazio)')
+    hierarchy, _ = pivot_tree(state)
+
+    full = project(estimate, ROWS, [], len(VALUES), len(ROWS), False)
+    assert (sum(full.rows), full.leaves) == (count_nodes(hierarchy), state.leaves.height)
+
+    limited = project(estimate, [ROWS[0], {**ROWS[1], 'limit': 5}], [], len(VALUES), len(ROWS), False)
+    assert limited.rows == [3, 18]
+    assert limited.cells < full.cells and limited.memory_mb <= full.memory_mb
+
+
+def test_preflight_is_silent_within_thresholds_and_fails_fast_over_them():
+    within = preflight(records(), ROWS, [], len(VALUES), len(ROWS), False, thresholds({'maxCells': 1000}))
+    assert within == (ROWS, [], None, [])
+
+    rows, columns, report, exceeded = preflight(records(), ROWS, [], len(VALUES), len(ROWS), False, thresholds({'maxCells': 50}))
+    assert (rows, columns, report['limited']) == (ROWS, [], [])
+    assert report['cells'] > 50 and exceeded == [f'{report["cells"]} cells (max 50)']
+
+
+def test_preflight_limits_the_widest_levels_until_the_pivot_fits():
+    limits = Thresholds(50, None, 'topN', 10)
+    rows, _, report, exceeded = preflight(records(), ROWS, [], len(VALUES), len(ROWS), False, limits)
+
+    assert exceeded == [] and report['cells'] <= 50
+    assert rows == [ROWS[0], {**ROWS[1], 'limit': 10}]
+    assert report['limited'] == [{'axis': 'rows', 'field': 'customer', 'limit': 10}]
+
+    state, _ = aggregate_pivot(records(), rows, None, VALUES, '(vazio)')
+    hierarchy, grand_totals = pivot_tree(state)
+    assert [len(node.children) for node in hierarchy] == [11, 11, 11]
+    assert all(node.children[-1].key == OTHERS_KEY for node in hierarchy)
+    assert grand_totals['totals']['value'] == sum(record['value'] for record in RECORDS)
+
+
+def test_preflight_fails_when_limits_are_not_enough():
+    _, _, report, exceeded = preflight(records(), ROWS, [], len(VALUES), len(ROWS), False, Thresholds(5, None, 'topN', 10))
+
+    assert exceeded and report['limited'] == [{'axis': 'rows', 'field': 'customer', 'limit': 10}]
+
+
+def test_thresholds_errors():
+    assert thresholds_error({'maxCells': 100, 'maxMemoryMb': 0.5, 'onExceed': 'topN', 'topN': 5}) is None
+    assert thresholds_error([]) == 'preflight must be an object: []'
+    assert thresholds_error({'maxCells': 0}) == 'preflight maxCells must be a positive integer: 0'
+    assert thresholds_error({'topN': True}) == 'preflight topN must be a positive integer: True'
+    assert thresholds_error({'maxMemoryMb': -1}) == 'preflight maxMemoryMb must be a positive number: -1'
+    assert thresholds_error({'onExceed': 'truncate'}) == 'preflight onExceed must be one of error, topN: truncate'
@@ -0,0 +1,111 @@
+# pivot_state_cache.py
+# Aggregated pivot state kept between requests, so a depth-limited pivot can be expanded later
+# (pivot.expand) without the records. A state is two files in PIVOT_STATE_DIR (a temp directory when
+# unset) named by a random token:
+#   <token>.arrow  the leaves frame (row keys and labels, column ordinal, order, slot states), Arrow IPC file
+#   <token>.json   column keys, value config (the plan is recompiled from it), depth and owner
+# Expansion keys are opaque to clients: the token, then the node's row key path as base64url JSON.
+# States expire CACHE_TTL_SECONDS after they were written; expired ones are removed on every save and load.
+# The temp directory is local to the instance (container) that ran the pivot, so expansion keys only work
+# there; deployments with several instances must point PIVOT_STATE_DIR at storage they all share.
+# ADR-0010: no-magic-numbers, functional style.
+
+import base64
+import os
+import re
+import secrets
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import polars as pl
+
+from json_codec import dumps, loads
+from pivot_engine import PivotState, compile_plan
+
+CACHE_DIR_NAME = 'konecty-pivot-state'
+STATE_DIR_ENV = 'PIVOT_STATE_DIR'
+# dataApi caps the response cache of depth-limited pivots below it (PIVOT_STATE_TTL_SECONDS), so cached
+# responses can always expand
+CACHE_TTL_SECONDS = 3600
+TOKEN_BYTES = 16
+TOKEN_PATTERN = re.compile(r'^[A-Za-z0-9_-]{22}$')
+KEY_SEP = '.'
+BASE64_BLOCK = 4
+LEAVES_SUFFIX = '.arrow'
+META_SUFFIX = '.json'
+
+
+def cache_dir() -> Path:
+    return Path(os.environ.get(STATE_DIR_ENV) or tempfile.gettempdir()) / CACHE_DIR_NAME
+
+
+def state_paths(token: str) -> Tuple[Path, Path]:
+    directory = cache_dir()
+    return directory / f'{token}{LEAVES_SUFFIX}', directory / f'{token}{META_SUFFIX}'
+
+
+def prune_expired(now: float) -> None:
+    """Remove the files of states older than CACHE_TTL_SECONDS."""
+    directory = cache_dir()
+    if not directory.is_dir():
+        return
+    for path in directory.iterdir():
+        try:
+            if now - path.stat().st_mtime > CACHE_TTL_SECONDS:
+                path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def save_state(state: PivotState, values_meta: List[Dict], owner: Optional[str]) -> str:
+    """Write the state; returns its token. The metadata file is written last, so a state is only found
+    once both files are complete."""
+    cache_dir().mkdir(parents=True, exist_ok=True)
+    prune_expired(time.time())
+    token = secrets.token_urlsafe(TOKEN_BYTES)
+    leaves_path, meta_path = state_paths(token)
+    state.leaves.write_ipc(leaves_path)
+    meta = {'columnKeys': state.column_keys, 'values': values_meta, 'depth': state.depth, 'owner': owner}
+    partial_path = meta_path.with_suffix(f'{META_SUFFIX}.tmp')
+    partial_path.write_bytes(dumps(meta))
+    os.replace(partial_path, meta_path)
+    return token
+
+
+def load_state(token: str, owner: Optional[str]) -> Optional[PivotState]:
+    """State of a token, or None when it is unknown, expired or owned by someone else."""
+    if not TOKEN_PATTERN.match(token):
+        return None
+    prune_expired(time.time())
+    leaves_path, meta_path = state_paths(token)
+    try:
+        if time.time() - meta_path.stat().st_mtime > CACHE_TTL_SECONDS:
+            return None
+        meta = loads(meta_path.read_bytes())
+        if meta.get('owner') != owner:
+            return None
+        leaves = pl.read_ipc(leaves_path)
+    except FileNotFoundError:
+        return None
+    return PivotState(leaves, meta['columnKeys'], compile_plan(meta['values']), meta['depth'])
+
+
+def expansion_key(token: str, path: Tuple[str, ...]) -> str:
+    encoded = base64.urlsafe_b64encode(dumps(list(path))).decode('ascii').rstrip('=')
+    return f'{token}{KEY_SEP}{encoded}'
+
+
+def parse_expansion_key(key: Any) -> Optional[Tuple[str, Tuple[str, ...]]]:
+    """(token, row key path) of an expansion key, or None when it is not one."""
+    if not isinstance(key, str):
+        return None
+    token, _, encoded = key.partition(KEY_SEP)
+    try:
+        path = loads(base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % BASE64_BLOCK)))
+    except ValueError:
+        return None
+    if not TOKEN_PATTERN.match(token) or not isinstance(path, list) or not path or not all(isinstance(row_key, str) for row_key in path):
+        return None
+    return token, tuple(path)
@@ -0,0 +1,97 @@
+# /// script
+# dependencies = [
+#   "polars",
+#   "pytest",
+# ]
+# ///
+
+"""
+Tests for pivot_state_cache.py
+Run with: uv run --script pytest pivot_state_cache.test.py
+"""
+
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import polars as pl
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+from field_projection import pivot_field_paths, project_paths  # noqa: E402
+from json_codec import dumps  # noqa: E402
+import pivot_state_cache  # noqa: E402
+from pivot_engine import ROW_INDEX, aggregate_pivot, expand_rows  # noqa: E402
+from pivot_state_cache import CACHE_TTL_SECONDS, expansion_key, load_state, parse_expansion_key, save_state, state_paths  # noqa: E402
+
+RECORDS = [
+    {'status': 'Nova', 'type': 'Compra', 'value': 10},
+    {'status': 'Nova', 'type': 'Locação', 'value': 20},
+    {'status': 'Ganha', 'type': 'Compra', 'value': 30},
+]
+ROWS = [{'field': 'status'}, {'field': 'type'}]
+VALUES = [{'field': 'value', 'aggregator': 'median'}]
+
+
+@pytest.fixture(autouse=True)
+def temp_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    monkeypatch.delenv('PIVOT_STATE_DIR', raising=False)
+
+
+def state():
+    records = project_paths(pl.DataFrame(RECORDS), pivot_field_paths({'rows': ROWS, 'values': VALUES}))
+    return aggregate_pivot(records.with_row_index(ROW_INDEX), ROWS, None, VALUES, '(vazio)')[0]
+
+
+def test_saved_state_expands_like_the_original():
+    original = state()
+    token = save_state(original, VALUES, 'user-1')
+
+    loaded = load_state(token, 'user-1')
+    assert loaded.leaves.equals(original.leaves)
+    assert (loaded.column_keys, loaded.plan, loaded.depth) == (original.column_keys, original.plan, original.depth)
+    assert dumps(expand_rows(loaded, ('Nova',))) == dumps(expand_rows(original, ('Nova',)))
+
+
+def test_state_is_only_found_by_its_owner_before_it_expires():
+    token = save_state(state(), VALUES, 'user-1')
+
+    assert load_state(token, 'user-2') is None
+    assert load_state('x' * len(token), 'user-1') is None
+    assert load_state('../' + token, 'user-1') is None
+
+    expired = time.time() - CACHE_TTL_SECONDS - 1
+    for path in state_paths(token):
+        os.utime(path, (expired, expired))
+    assert load_state(token, 'user-1') is None
+
+    # Expired states are removed on the next save or load
+    assert not any(path.exists() for path in state_paths(token))
+    stale = save_state(state(), VALUES, 'user-1')
+    for path in state_paths(stale):
+        os.utime(path, (expired, expired))
+    save_state(state(), VALUES, 'user-1')
+    assert not any(path.exists() for path in state_paths(stale))
+
+
+def test_states_are_kept_in_the_configured_directory(monkeypatch, tmp_path):
+    monkeypatch.setenv('PIVOT_STATE_DIR', str(tmp_path / 'shared'))
+    token = save_state(state(), VALUES, 'user-1')
+
+    assert all(path.parent == tmp_path / 'shared' / 'konecty-pivot-state' for path in state_paths(token))
+    assert load_state(token, 'user-1') is not None
+
+
+def test_expansion_keys():
+    token = save_state(state(), VALUES, None)
+    key = expansion_key(token, ('Nova', 'Compra|ção'))
+
+    assert parse_expansion_key(key) == (token, ('Nova', 'Compra|ção'))
+    assert parse_expansion_key(f'{token}.not base64') is None
+    assert parse_expansion_key(token) is None
+    assert parse_expansion_key(expansion_key('short', ('Nova',))) is None
+    assert parse_expansion_key(None) is None
+    assert pivot_state_cache.cache_dir().is_dir()
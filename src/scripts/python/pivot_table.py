@@ -1,568 +1,258 @@
 # /// script
 # dependencies = [
 #   "polars",
+#   "orjson",
 # ]
 # ///
 
 # pivot_table.py
 import sys
-import json
 import polars as pl
-from collections import defaultdict
-from typing import Dict, List, Any, Optional, Tuple
-from datetime import datetime
-import os
-import re
+import time
 
-# Debug log file
-DEBUG_LOG_FILE = os.path.join(os.path.dirname(__file__), 'pivot_debug.log')
+from data_ingest import DATA_FORMATS, data_format_of, iter_input_batches
+from json_codec import dumps, loads, send_rpc_error, send_rpc_result, write_json_lines, write_payload
+from analytics_logging import open_debug_log
+from date_buckets import is_valid_timezone
+from field_projection import pivot_field_paths, project_paths, root_fields
+from pivot_accumulators import value_error
+from pivot_engine import CELL_FORMATS, DENSE_CELLS, KEYED_CELLS, OTHERS_TEXT, ROW_INDEX, aggregate_pivot, cell_layout, depth_first_rows, expand_rows, pivot_tree, top_n_error, with_date_buckets
+from pivot_preflight import PREFLIGHT_ERROR_CODE, preflight, thresholds, thresholds_error
+from pivot_state_cache import expansion_key, load_state, parse_expansion_key, save_state
+from stage_metrics import StageMetrics
 
-def debug_log(message: str):
-    """Write debug message to log file"""
-    try:
-        with open(DEBUG_LOG_FILE, 'a', encoding='utf-8') as f:
-            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
-            f.write(f'[{timestamp}] {message}\n')
-    except Exception:
-        pass
+metrics = StageMetrics()
+
+PIVOT_METHOD = 'pivot'
+# Children of a node of a depth-limited pivot, from its cached state (pivot_state_cache.py)
+EXPAND_METHOD = 'pivot.expand'
+# Result payload (params.outputFormat): one JSON line, or NDJSON frames written as the rows are encoded
+OUTPUT_JSON = 'json'
+OUTPUT_NDJSON = 'ndjson'
+OUTPUT_FORMATS = (OUTPUT_JSON, OUTPUT_NDJSON)
+# Result keys streamed in frames of their own; the rest go in the header frame
+STREAMED_KEYS = ('data', 'grandTotals')
+
+
+def is_positive_integer(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 1
+
+
+def result_frames(result: dict):
+    """NDJSON frames of a result: the header frame (columnHeaders, cellLayout), one row frame per node in
+    depth-first order (depth_first_rows) and the grandTotals frame last, when the result has one."""
+    yield {'type': 'header', **{key: value for key, value in result.items() if key not in STREAMED_KEYS}}
+    for node in depth_first_rows(result['data']):
+        yield {'type': 'row', 'node': node}
+    if 'grandTotals' in result:
+        yield {'type': 'grandTotals', 'grandTotals': result['grandTotals']}
+
+
+def send_result(result: dict, output_format: str) -> None:
+    """Send the RPC response header (with per-stage metrics), then the result. As JSON, the result is
+    serialized first so the header carries the serialize stage too; as NDJSON, frames are encoded and
+    written one by one after the header, so no full payload is ever held."""
+    header = {'status': 'success', 'rowCount': len(result['data']), 'columnCount': len(result.get('columnHeaders', []))}
+    if output_format == OUTPUT_NDJSON:
+        send_rpc_result(header, metrics.summary())
+        write_json_lines(result_frames(result))
+        return
+    with metrics.stage('serialize') as counts:
+        payload = dumps(result) + b'\n'
+        counts['bytes'] = len(payload)
+    send_rpc_result(header, metrics.summary())
+    write_payload(payload)
 
-# Clear log file at start
-try:
-    with open(DEBUG_LOG_FILE, 'w', encoding='utf-8') as f:
-        f.write(f'=== Pivot Debug Log - Started at {datetime.now().strftime("%Y-%m-%d %H:%M:%S")} ===\n')
-except Exception:
-    pass
 
 # 1. Read RPC request from first line of stdin
-request_line = sys.stdin.readline()
+request_line = sys.stdin.buffer.readline()
 if not request_line:
     sys.exit(1)
 
-request = json.loads(request_line)
+request = loads(request_line)
 method = request.get('method')
 params = request.get('params', {})
+debug_log = open_debug_log('pivot_table', request)
+
+if method not in (PIVOT_METHOD, EXPAND_METHOD):
+    send_rpc_error(-32601, 'Method not found')
+    sys.exit(1)
+
+# Levels of row nodes returned (params.maxDepth for pivot.expand, options.maxDepth for pivot); the last
+# ones get an expansionKey instead of their children. Without it, every level.
+max_depth = params.get('maxDepth') if method == EXPAND_METHOD else params.get('config', {}).get('options', {}).get('maxDepth')
+if max_depth is not None and not is_positive_integer(max_depth):
+    send_rpc_error(-32602, f'maxDepth must be a positive integer: {max_depth}')
+    sys.exit(1)
+# Cells and totals format (params.cellFormat for pivot.expand, options.cellFormat for pivot): keyed by
+# column key and value field, or compact dense/sparse arrays indexed by the ordinals of the cellLayout
+cell_format = params.get('cellFormat', KEYED_CELLS) if method == EXPAND_METHOD else params.get('config', {}).get('options', {}).get('cellFormat', KEYED_CELLS)
+if cell_format not in CELL_FORMATS:
+    send_rpc_error(-32602, f'Unsupported cell format: {cell_format}')
+    sys.exit(1)
+output_format = params.get('outputFormat', OUTPUT_JSON)
+if output_format not in OUTPUT_FORMATS:
+    send_rpc_error(-32602, f'Unsupported output format: {output_format}')
+    sys.exit(1)
+# Caller the cached state belongs to (the Node side passes the user id); only they can expand it
+owner = params.get('owner')
 
-if method != 'pivot':
-    error_response = json.dumps({
-        'jsonrpc': '2.0',
-        'error': {'code': -32601, 'message': 'Method not found'}
-    })
-    print(error_response, flush=True)
+if method == EXPAND_METHOD:
+    expansion = parse_expansion_key(params.get('expansionKey'))
+    state = load_state(expansion[0], owner) if expansion else None
+    if state is None or len(expansion[1]) >= state.depth:
+        send_rpc_error(-32602, 'Unknown or expired expansion key')
+        sys.exit(1)
+    token, path = expansion
+    try:
+        with metrics.stage('aggregate') as counts:
+            children = expand_rows(state, path, max_depth, lambda node_path: expansion_key(token, node_path), cell_format)
+            counts['rows'] = state.leaves.height
+    except Exception as e:
+        import traceback
+        debug_log(f'Error expanding pivot node: {str(e)}\n{traceback.format_exc()}')
+        send_rpc_error(-32603, f'Error expanding pivot node: {str(e)}')
+        sys.exit(1)
+    debug_log(f'Expanded {len(path)}-level node with {len(children)} children')
+    send_result({'data': children}, output_format)
+    sys.exit(0)
+
+if data_format_of(params) not in DATA_FORMATS:
+    send_rpc_error(-32602, f'Unsupported data format: {data_format_of(params)}')
     sys.exit(1)
 
 enriched_config = params.get('config', {})
 # Blank text for empty values (translated from backend)
 BLANK_TEXT = params.get('blankText', '(vazio)')
+# Label of the key the keys outside the top of a limited level collapse into (translated from backend)
+others_text = params.get('othersText', OTHERS_TEXT)
+# IANA timezone date buckets are computed in (options.timezone); without it dates keep their written time
+timezone = enriched_config.get('options', {}).get('timezone')
+if timezone and not is_valid_timezone(timezone):
+    send_rpc_error(-32602, f'Unknown timezone: {timezone}')
+    sys.exit(1)
+# Hash partitions the record group-by runs in, in parallel on the polars thread pool (options.partitions)
+partitions = enriched_config.get('options', {}).get('partitions', 1)
+if not is_positive_integer(partitions):
+    send_rpc_error(-32602, f'Partitions must be a positive integer: {partitions}')
+    sys.exit(1)
+# Aggregators (and percentile ranks) the accumulators support and top-N (limit, orderBy) of the row and
+# column levels, checked before any data is read
+values_config = enriched_config.get('values', [])
+axes_config = [*enriched_config.get('rows', []), *(enriched_config.get('columns') or [])]
+config_errors = [error for error in (*map(value_error, values_config), *(top_n_error(meta, values_config) for meta in axes_config)) if error]
+if config_errors:
+    send_rpc_error(-32602, config_errors[0])
+    sys.exit(1)
+# Projected cells and memory the pivot may reach (params.preflight, set by the backend); over them it
+# fails fast or limits its widest levels to their top keys. Without it, no pre-flight runs.
+preflight_params = params.get('preflight')
+if preflight_params is not None and thresholds_error(preflight_params):
+    send_rpc_error(-32602, thresholds_error(preflight_params))
+    sys.exit(1)
 
-# 2. Read NDJSON data from remaining stdin
-data = []
-for line in sys.stdin:
-    if line.strip():
-        data.append(json.loads(line))
-
-# 3. Flatten nested objects to support dot notation fields
-def flatten_dict(d, parent_key='', sep='.'):
-    """Flatten nested dictionary with dot notation"""
-    items = []
-    for k, v in d.items():
-        new_key = f'{parent_key}{sep}{k}' if parent_key else k
-        if isinstance(v, dict):
-            items.extend(flatten_dict(v, new_key, sep=sep).items())
-        elif isinstance(v, list) and len(v) > 0 and isinstance(v[0], dict):
-            if len(v) > 0:
-                items.extend(flatten_dict(v[0], new_key, sep=sep).items())
-            else:
-                items.append((new_key, None))
-        else:
-            items.append((new_key, v))
-    return dict(items)
+# 2. Only the paths the config reads are extracted from each document (rows, columns and their lookup
+# label fields, values), instead of flattening every field
+field_paths = pivot_field_paths(enriched_config)
 
-# Flatten all records
-flattened_data = [flatten_dict(record) for record in data]
+# 3. Read data (NDJSON or Arrow) from remaining stdin as columnar batches restricted to the referenced
+# top-level fields, and project each batch to its dot paths with struct expressions, so the raw
+# documents are never held as a full list of dicts
+projected_batches = []
+ingested_columns = set()
+try:
+    for batch in iter_input_batches(
+        sys.stdin.buffer,
+        params,
+        on_invalid=lambda line: debug_log(f'Skipping invalid JSON line: {line[:100]!r}'),
+        metrics=metrics,
+        columns=root_fields(field_paths),
+    ):
+        with metrics.stage('flatten') as counts:
+            ingested_columns.update(batch.columns)
+            projected_batches.append(project_paths(batch, field_paths))
+            counts['rows'] = batch.height
+    records = pl.concat(projected_batches, how='vertical_relaxed').with_row_index(ROW_INDEX) if projected_batches else None
+except Exception as e:
+    import traceback
+    debug_log(f'Error reading pivot data: {str(e)}\n{traceback.format_exc()}')
+    send_rpc_error(-32603, f'Error reading pivot data: {str(e)}')
+    sys.exit(1)
 
-# 4. Convert to Polars DataFrame
-if not flattened_data:
-    error_response = json.dumps({
-        'jsonrpc': '2.0',
-        'error': {'code': -32602, 'message': 'No data provided for pivot table'}
-    })
-    print(error_response, flush=True)
+# 4. Validate input
+if records is None:
+    send_rpc_error(-32602, 'No data provided for pivot table')
     sys.exit(1)
 
-df = pl.DataFrame(flattened_data)
-debug_log(f'DataFrame columns ({len(df.columns)}): {df.columns}')
+del projected_batches
+debug_log(f'Ingested {records.height} records, top-level columns ({len(ingested_columns)}): {sorted(ingested_columns)}')
 
 # 5. Extract configuration
 rows_meta = enriched_config.get('rows', [])
 columns_meta = enriched_config.get('columns', [])
 values_meta = enriched_config.get('values', [])
-options = enriched_config.get('options', {})
 
 if not rows_meta or not values_meta:
-    error_response = json.dumps({
-        'jsonrpc': '2.0',
-        'error': {'code': -32602, 'message': 'Rows and values are required for pivot table'}
-    })
-    print(error_response, flush=True)
+    send_rpc_error(-32602, 'Rows and values are required for pivot table')
     sys.exit(1)
 
-rows_fields = [r['field'] for r in rows_meta]
-columns_fields = [c['field'] for c in columns_meta] if columns_meta else None
-values_fields = [v['field'] for v in values_meta]
-
-# 6. Format lookup values based on formatPattern
-def format_lookup_value(row: Dict, field: str, lookup_config: Optional[Dict]) -> str:
-    """Format a lookup value following legacy ExtJS pattern"""
-    if not lookup_config:
-        value = row.get(field)
-        if value is None or value == '':
-            return BLANK_TEXT
-        return str(value)
-    
-    simple_fields = lookup_config.get('simpleFields', ['name'])
-    nested_fields = lookup_config.get('nestedFields', [])
-    values = []
-    
-    # Process simple fields (e.g., 'code', 'name')
-    for sf in simple_fields:
-        flattened_field = f'{field}.{sf}'
-        field_value = row.get(flattened_field)
-        if field_value is not None and field_value != '':
-            # Format boolean values in Portuguese
-            if isinstance(field_value, bool):
-                field_value = 'Sim' if field_value else 'Não'
-            values.append(str(field_value))
-    
-    # Process nested fields (e.g., 'name.full' -> 'name_full' in flattened data)
-    for nf in nested_fields:
-        # Try both dot notation and underscore notation
-        flattened_field = f'{field}.{nf}'
-        field_value = row.get(flattened_field)
-        if field_value is None:
-            # Try with underscore
-            flattened_field = f'{field}.{nf.replace(".", "_")}'
-            field_value = row.get(flattened_field)
-        if field_value is not None and field_value != '':
-            values.append(str(field_value))
-    
-    if values:
-        return ' - '.join(values)
-    
-    # Check if lookup has any value at all
-    id_value = row.get(f'{field}._id')
-    if id_value:
-        return str(id_value)
-    
-    return BLANK_TEXT
-
-# 7. Parse date and apply bucket formatting
-def parse_date_value(value: Any) -> Optional[datetime]:
-    """Parse a date value from various formats"""
-    if value is None:
-        return None
-    
-    if isinstance(value, datetime):
-        return value
-    
-    if isinstance(value, str):
-        # Try ISO format with timezone
-        try:
-            # Remove timezone suffix for parsing
-            clean_value = re.sub(r'[+-]\d{2}:\d{2}$', '', value)
-            clean_value = clean_value.replace('Z', '')
-            
-            if 'T' in clean_value:
-                return datetime.fromisoformat(clean_value)
-            else:
-                return datetime.strptime(clean_value, '%Y-%m-%d')
-        except Exception:
-            pass
-    
-    return None
-
-def format_date_bucket(date_val: Optional[datetime], bucket: str) -> str:
-    """Format a date according to bucket type (matching ExtJS date formats)"""
-    if date_val is None:
-        return '--'
-    
-    if bucket == 'd':
-        # Day of month with leading zero (01-31)
-        return date_val.strftime('%d')
-    elif bucket == 'j':
-        # Day of month without leading zero (1-31)
-        return str(date_val.day)
-    elif bucket == 'W':
-        # ISO week number
-        return str(date_val.isocalendar()[1])
-    elif bucket == 'm':
-        # Month with leading zero (01-12)
-        return date_val.strftime('%m')
-    elif bucket == 'n':
-        # Month without leading zero (1-12)
-        return str(date_val.month)
-    elif bucket == 'Y':
-        # Full year (2026)
-        return str(date_val.year)
-    elif bucket == 'M':
-        # Short month name (Jan, Feb, etc.)
-        return date_val.strftime('%b')
-    elif bucket == 'F':
-        # Full month name (January, February, etc.)
-        return date_val.strftime('%B')
-    elif bucket == 'D':
-        # Short day name (Mon, Tue, etc.)
-        return date_val.strftime('%a')
-    elif bucket == 'l':
-        # Full day name (Monday, Tuesday, etc.)
-        return date_val.strftime('%A')
-    else:
-        # Default to ISO date
-        return date_val.strftime('%Y-%m-%d')
-    
-# 8. Build column hierarchy tree (similar to ExtJS axisTop)
-def build_column_tree(
-    records: List[Dict],
-    columns_meta: List[Dict]
-) -> Tuple[Dict, Dict]:
-    """
-    Build hierarchical column tree structure.
-    Returns: (column_tree, column_key_to_path_map)
-    
-    For multiple columns, creates nested structure:
-    - Level 0: First column values (e.g., dates: 27, 28, 29)
-    - Level 1: Second column values (e.g., status: Cancelada, Em Andamento, Nova)
-    
-    The column_key is the full path joined by '|' for backward compatibility with cells.
-    """
-    column_tree = {}
-    column_key_to_path = {}
-    
-    if not columns_meta:
-        return column_tree, column_key_to_path
-    
-    for record in records:
-        col_path = []
-        col_values = []
-        
-        for col_idx, col_meta in enumerate(columns_meta):
-            field = col_meta['field']
-            bucket = col_meta.get('bucket')
-            lookup_config = col_meta.get('lookup')
-            
-            if bucket:
-                # Date bucket - parse and format
-                raw_value = record.get(field)
-                date_val = parse_date_value(raw_value)
-                col_value = format_date_bucket(date_val, bucket)
-                col_label = col_value
-            elif lookup_config:
-                # Lookup field
-                col_value = record.get(f'{field}._id') or record.get(field, '')
-                col_value = str(col_value) if col_value else BLANK_TEXT
-                col_label = format_lookup_value(record, field, lookup_config)
-            else:
-                col_value = str(record.get(field, '') or '')
-                if not col_value:
-                    col_value = BLANK_TEXT
-                col_label = col_value
-            
-            col_values.append(col_value)
-            col_path.append((col_value, col_label, col_idx))
-        
-        # Build column tree
-        current_level = column_tree
-        parent_key = ''
-        
-        for col_value, col_label, col_idx in col_path:
-            node_key = f'{parent_key}|{col_value}' if parent_key else col_value
-            
-            if col_value not in current_level:
-                current_level[col_value] = {
-                    'key': node_key,
-                    'value': col_value,
-                    'label': col_label,
-                    'level': col_idx,
-                    'children': {},
-                    'expanded': False
-                }
-            
-            parent_key = node_key
-            current_level = current_level[col_value]['children']
-        
-        # Map full key to path for cell lookup
-        full_key = '|'.join(col_values)
-        column_key_to_path[full_key] = col_values
-    
-    return column_tree, column_key_to_path
-
-def column_tree_to_list(tree: Dict, sort_numeric: bool = False) -> List[Dict]:
-    """Convert column tree dict to sorted list format"""
-    result = []
-    
-    for key, node in tree.items():
-        node_data = {
-            'key': node['key'],
-            'value': node['value'],
-            'label': node['label'],
-            'level': node['level'],
-            'expanded': node.get('expanded', False)
-        }
-        
-        if node['children']:
-            node_data['children'] = column_tree_to_list(node['children'], sort_numeric)
-        
-        result.append(node_data)
-    
-    # Sort: try numeric sort first, then alphabetic
-    try:
-        if sort_numeric and all(n['value'].isdigit() or n['value'] == '--' for n in result):
-            result.sort(key=lambda n: int(n['value']) if n['value'].isdigit() else 9999)
-        else:
-            result.sort(key=lambda n: n['label'].lower())
-    except Exception:
-        result.sort(key=lambda n: n.get('label', '').lower())
-    
-    return result
-
-# 9. Build pivot structure with subtotals
-def build_pivot_hierarchy(
-    records: List[Dict],
-    rows_meta: List[Dict],
-    columns_meta: Optional[List[Dict]],
-    values_meta: List[Dict]
-) -> Tuple[List[Dict], Dict, List[Dict]]:
-    """
-    Build hierarchical pivot structure with subtotals at each level.
-    Returns: (row_hierarchy, grand_totals, column_headers)
-    """
-    
-    # Data structure: nested dict by row levels
-    # Each node: {key, label, level, children, cells, totals}
-    
-    root_children = {}
-    grand_totals_cells = defaultdict(lambda: defaultdict(float))
-    grand_totals_totals = defaultdict(float)
-    
-    # Build column tree first
-    column_tree, column_key_map = build_column_tree(records, columns_meta or [])
-    
-    for record in records:
-        # Extract row path (list of (key, label) tuples)
-        row_path = []
-        for row_meta in rows_meta:
-            field = row_meta['field']
-            lookup_config = row_meta.get('lookup')
-            
-            # Get key (stable identifier)
-            id_field = f'{field}._id'
-            key = record.get(id_field)
-            if key is None:
-                key = record.get(field, '')
-            key = str(key) if key is not None else ''
-            
-            # Get label (formatted display value)
-            if lookup_config:
-                label = format_lookup_value(record, field, lookup_config)
-            else:
-                value = record.get(field)
-                if value is None or value == '':
-                    label = BLANK_TEXT
-                else:
-                    label = str(value)
-            
-            # Use BLANK_TEXT as key if key is empty
-            if not key:
-                key = BLANK_TEXT
-            
-            row_path.append((key, label))
-        
-        # Extract column key (for dynamic columns) - still using '|' joined for cells
-        column_key = '__default__'
-        if columns_meta:
-            col_values = []
-            for col_meta in columns_meta:
-                field = col_meta['field']
-                bucket = col_meta.get('bucket')
-                lookup_config = col_meta.get('lookup')
-                
-                if bucket:
-                    # Date bucket - parse and format
-                    raw_value = record.get(field)
-                    date_val = parse_date_value(raw_value)
-                    col_value = format_date_bucket(date_val, bucket)
-                elif lookup_config:
-                    col_value = record.get(f'{field}._id') or record.get(field, '')
-                    col_value = str(col_value) if col_value else BLANK_TEXT
-                else:
-                    col_value = str(record.get(field, '') or '')
-                    if not col_value:
-                        col_value = BLANK_TEXT
-                
-                col_values.append(col_value)
-            column_key = '|'.join(col_values)
-        
-        # Extract values (aggregations)
-        row_values = {}
-        for val_meta in values_meta:
-            field = val_meta['field']
-            agg = val_meta.get('aggregator', 'sum')
-            
-            if agg == 'count':
-                row_values[field] = 1
-            else:
-                val = record.get(field, 0)
-                if val is None:
-                    val = 0
-                try:
-                    row_values[field] = float(val)
-                except (ValueError, TypeError):
-                    row_values[field] = 0
-        
-        # Build/update tree structure
-        current_level = root_children
-        for level_idx, (key, label) in enumerate(row_path):
-            if key not in current_level:
-                current_level[key] = {
-                    'key': key,
-                    'label': label,
-                    'level': level_idx,
-                    'cells': defaultdict(lambda: defaultdict(float)),
-                    'totals': defaultdict(float),
-                    'count': 0,
-                    'children': {}
-                }
-            
-            node = current_level[key]
-            
-            # Update cells and totals at EVERY level (for subtotals)
-            for field, value in row_values.items():
-                val_meta = next((v for v in values_meta if v['field'] == field), {})
-                agg = val_meta.get('aggregator', 'sum')
-                
-                if agg in ['sum', 'count']:
-                    node['cells'][column_key][field] += value
-                    node['totals'][field] += value
-                elif agg == 'avg':
-                    # For avg, we accumulate sum and count, then compute at the end
-                    node['cells'][column_key][f'{field}_sum'] = node['cells'][column_key].get(f'{field}_sum', 0) + value
-                    node['cells'][column_key][f'{field}_count'] = node['cells'][column_key].get(f'{field}_count', 0) + 1
-            
-            node['count'] += 1
-            
-            # Move to next level
-            current_level = node['children']
-        
-        # Update grand totals
-        for field, value in row_values.items():
-            grand_totals_cells[column_key][field] += value
-            grand_totals_totals[field] += value
-    
-    # Convert tree to list format
-    def tree_to_list(node_dict: Dict) -> List[Dict]:
-        result = []
-        for key, node in node_dict.items():
-            # Convert defaultdicts to regular dicts
-            cells = {}
-            for col_key, col_vals in node['cells'].items():
-                cells[col_key] = dict(col_vals)
-            
-            node_data = {
-                'key': node['key'],
-                'label': node['label'],
-                'level': node['level'],
-                'cells': cells,
-                'totals': dict(node['totals'])
-            }
-            
-            if node['children']:
-                node_data['children'] = tree_to_list(node['children'])
-            
-            result.append(node_data)
-        
-        return result
-    
-    hierarchy = tree_to_list(root_children)
-    
-    grand_totals = {
-        'cells': {k: dict(v) for k, v in grand_totals_cells.items()},
-        'totals': dict(grand_totals_totals)
-    }
-    
-    # Convert column tree to list - sort numeric for date buckets
-    has_date_bucket = any(c.get('bucket') for c in (columns_meta or []))
-    column_headers = column_tree_to_list(column_tree, sort_numeric=has_date_bucket)
-    
-    return hierarchy, grand_totals, column_headers
-
-# 10. Sort data by row fields for consistent grouping order
-def get_sort_key(record: Dict, rows_meta: List[Dict]) -> tuple:
-    """Get a sortable key tuple from record based on row fields"""
-    keys = []
-    for row_meta in rows_meta:
-        field = row_meta['field']
-        lookup_config = row_meta.get('lookup')
-        
-        # Get the value to sort by
-        if lookup_config:
-            # For lookups, use the label (formatted value) for sorting
-            label = format_lookup_value(record, field, lookup_config)
-            keys.append(label.lower() if label else '')
-        else:
-            value = record.get(field, '')
-            keys.append(str(value).lower() if value else '')
-    
-    return tuple(keys)
-
-# Sort data by row fields
-try:
-    flattened_data.sort(key=lambda r: get_sort_key(r, rows_meta))
-    debug_log(f'Sorted {len(flattened_data)} records by row fields')
-except Exception as e:
-    debug_log(f'Warning: Could not sort data: {str(e)}')
+# 6. Pre-flight: distinct keys of every level estimated from the records (date buckets computed first),
+# result size and memory projected from them and checked against the thresholds
+preflight_report = None
+if preflight_params is not None:
+    with metrics.stage('preflight') as counts:
+        records = with_date_buckets(records, columns_meta or [], timezone)
+        shown_levels = min(max_depth or len(rows_meta), len(rows_meta))
+        rows_meta, columns_meta, preflight_report, exceeded = preflight(
+            records, rows_meta, columns_meta or [], len(values_meta), shown_levels, cell_format == DENSE_CELLS, thresholds(preflight_params)
+        )
+        counts['rows'] = records.height
+    if exceeded:
+        debug_log(f'Pivot over its pre-flight thresholds: {exceeded}')
+        send_rpc_error(PREFLIGHT_ERROR_CODE, f'Pivot too large: projected {", ".join(exceeded)}', preflight_report)
+        sys.exit(1)
 
-# 11. Build pivot
+# 7. Build pivot: group-by over the row/column key fields, rollup subtotals, tree from the aggregates
+aggregate_started = time.perf_counter()
 try:
-    hierarchy, grand_totals, column_headers = build_pivot_hierarchy(
-        flattened_data,
+    state, column_headers = aggregate_pivot(
+        records,
         rows_meta,
         columns_meta if columns_meta else None,
-        values_meta
+        values_meta,
+        BLANK_TEXT,
+        timezone,
+        partitions,
+        others_text,
     )
-    
-    # Sort hierarchy at each level alphabetically by label
-    def sort_hierarchy(nodes: List[Dict]) -> List[Dict]:
-        nodes.sort(key=lambda n: n.get('label', '').lower())
-        for node in nodes:
-            if 'children' in node and node['children']:
-                node['children'] = sort_hierarchy(node['children'])
-        return nodes
-    
-    hierarchy = sort_hierarchy(hierarchy)
-    
+    # Depth-limited: the state is cached for pivot.expand and the last nodes carry its expansion keys
+    node_key = None
+    if max_depth is not None and max_depth < state.depth:
+        token = save_state(state, values_meta, owner)
+        node_key = lambda path: expansion_key(token, path)  # noqa: E731
+    hierarchy, grand_totals = pivot_tree(state, max_depth, node_key, cell_format)
+
     result = {
         'data': hierarchy,
         'grandTotals': grand_totals,
         'columnHeaders': column_headers  # Hierarchical column headers
     }
-    
+    # Compact cells: column keys and value fields are listed once, cells index into them
+    if cell_format != KEYED_CELLS:
+        result['cellLayout'] = cell_layout(state, cell_format)
+    # Levels the pre-flight limited to their top keys, with the estimate that made it
+    if preflight_report is not None:
+        result['preflight'] = preflight_report
+
     debug_log(f'Built hierarchy with {len(hierarchy)} top-level nodes, {len(column_headers)} top-level columns')
-    
+
 except Exception as e:
     import traceback
     debug_log(f'Error building pivot: {str(e)}\n{traceback.format_exc()}')
-    error_response = json.dumps({
-        'jsonrpc': '2.0',
-        'error': {'code': -32603, 'message': f'Error building pivot table: {str(e)}'}
-    })
-    print(error_response, flush=True)
+    send_rpc_error(-32603, f'Error building pivot table: {str(e)}')
     sys.exit(1)
 
-# 12. Send RPC response header
-response = json.dumps({
-    'jsonrpc': '2.0',
-    'result': {'status': 'success', 'rowCount': len(result['data']), 'columnCount': len(result.get('columnHeaders', []))}
-})
-print(response, flush=True)
+metrics.add('aggregate', time.perf_counter() - aggregate_started, rows=records.height)
 
-# 13. Send result as JSON
-print(json.dumps(result), flush=True)
+# 8. Send the RPC response header (with per-stage metrics) and the result, as JSON or NDJSON frames
+send_result(result, output_format)
@@ -0,0 +1,92 @@
+# stage_metrics.py
+# Per-stage timing and memory metrics reported by the analytics scripts in their JSON-RPC header.
+# Each stage accumulates wall time and, optionally, rows and bytes processed, and records the
+# current and peak RSS of the process when it last ran. Stages keep their first-seen order.
+#
+# Stage names used by the scripts:
+#   read, decode, flatten, dataframe, aggregate, join, render, serialize
+# Writing the payload happens after the header, so Node derives it from its own wall time
+# minus totalMs.
+# ADR-0010: no-magic-numbers, functional style.
+
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+MS_PER_SECOND = 1000
+BYTES_PER_MB = 1024 * 1024
+BYTES_PER_KB = 1024
+MS_DECIMALS = 1
+MB_DECIMALS = 1
+STATM_PATH = '/proc/self/statm'
+STATM_RSS_FIELD = 1
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 0
+
+
+def peak_rss_mb() -> float:
+    """High-water RSS of the process (ru_maxrss is KB on Linux, bytes on macOS)."""
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_bytes = peak if sys.platform == 'darwin' else peak * BYTES_PER_KB
+    return round(peak_bytes / BYTES_PER_MB, MB_DECIMALS)
+
+
+def current_rss_mb() -> float:
+    """Current RSS of the process, falling back to the peak where /proc is unavailable."""
+    try:
+        with open(STATM_PATH, 'rb') as statm:
+            pages = int(statm.read().split()[STATM_RSS_FIELD])
+        return round(pages * PAGE_SIZE / BYTES_PER_MB, MB_DECIMALS)
+    except (OSError, ValueError, IndexError):
+        return peak_rss_mb()
+
+
+def rss_snapshot() -> Dict[str, float]:
+    """Current and peak RSS; the peak never reads below the current value (the two sources round differently)."""
+    current = current_rss_mb()
+    return {'rssMb': current, 'peakRssMb': max(current, peak_rss_mb())}
+
+
+class StageMetrics:
+    """Accumulates per-stage wall time, row/byte counts and RSS for one request."""
+
+    __slots__ = ('started', 'stages')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, name: str, seconds: float, rows: Optional[int] = None, size: Optional[int] = None) -> None:
+        stage = self.stages.setdefault(name, {'name': name, 'ms': 0.0})
+        stage['ms'] += seconds * MS_PER_SECOND
+        if rows is not None:
+            stage['rows'] = stage.get('rows', 0) + rows
+        if size is not None:
+            stage['bytes'] = stage.get('bytes', 0) + size
+        stage.update(rss_snapshot())
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[Dict[str, int]]:
+        """Time a block; set 'rows' / 'bytes' on the yielded dict to record counts."""
+        counts: Dict[str, int] = {}
+        start = time.perf_counter()
+        try:
+            yield counts
+        finally:
+            self.add(name, time.perf_counter() - start, counts.get('rows'), counts.get('bytes'))
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'totalMs': round((time.perf_counter() - self.started) * MS_PER_SECOND, MS_DECIMALS),
+            **rss_snapshot(),
+            'stages': [{**stage, 'ms': round(stage['ms'], MS_DECIMALS)} for stage in self.stages.values()],
+        }
@@ -0,0 +1,106 @@
+# /// script
+# dependencies = [
+#   "polars",
+#   "pytest",
+# ]
+# ///
+
+"""
+Tests for stage_metrics.py
+Run with: uv run --script pytest stage_metrics.test.py
+"""
+
+import io
+import json
+import subprocess
+import time
+from pathlib import Path
+
+from data_ingest import read_ndjson_frame
+from stage_metrics import StageMetrics
+
+SCRIPTS_DIR = Path(__file__).parent
+SUBPROCESS_TIMEOUT = 60
+SLEEP_SECONDS = 0.01
+MIN_SLEEP_MS = 10
+SMALL_CHUNK_BYTES = 64
+SAMPLE_DATA = [{'_id': str(i), 'status': 'Nova' if i % 2 else 'Ganha', 'amount': {'value': i}} for i in range(20)]
+
+
+def run_script(script: str, request: dict) -> list:
+    """Helper: runs a script with NDJSON input and returns the parsed RPC header line."""
+    stdin_input = '\n'.join([json.dumps(request), *(json.dumps(row) for row in SAMPLE_DATA)]) + '\n'
+    result = subprocess.run(
+        ['uv', 'run', '--script', str(SCRIPTS_DIR / script)],
+        input=stdin_input,
+        capture_output=True,
+        text=True,
+        timeout=SUBPROCESS_TIMEOUT,
+    )
+    return json.loads(result.stdout.splitlines()[0])
+
+
+def stage_names(header: dict) -> list:
+    return [stage['name'] for stage in header['metrics']['stages']]
+
+
+def test_stage_accumulates_time_and_counts():
+    metrics = StageMetrics()
+    for _ in range(2):
+        with metrics.stage('decode') as counts:
+            time.sleep(SLEEP_SECONDS)
+            counts['rows'] = 5
+    metrics.add('read', 0.0, size=128)
+
+    summary = metrics.summary()
+    decode, read = summary['stages']
+    assert (decode['name'], decode['rows']) == ('decode', 10)
+    assert decode['ms'] >= 2 * MIN_SLEEP_MS
+    assert (read['name'], read['bytes']) == ('read', 128)
+    assert 'rows' not in read
+    assert summary['totalMs'] >= decode['ms']
+    assert summary['peakRssMb'] >= summary['rssMb'] > 0
+
+
+def test_stage_is_recorded_when_block_raises():
+    metrics = StageMetrics()
+    try:
+        with metrics.stage('aggregate'):
+            raise ValueError('boom')
+    except ValueError:
+        pass
+
+    assert [stage['name'] for stage in metrics.summary()['stages']] == ['aggregate']
+
+
+def test_ndjson_reader_records_read_and_decode():
+    metrics = StageMetrics()
+    stream = io.BytesIO(b''.join(json.dumps(row).encode() + b'\n' for row in SAMPLE_DATA))
+    df = read_ndjson_frame(stream, SMALL_CHUNK_BYTES, metrics=metrics)
+
+    stages = {stage['name']: stage for stage in metrics.summary()['stages']}
+    assert stages['read']['bytes'] == len(stream.getvalue())
+    assert stages['decode']['rows'] == df.height == len(SAMPLE_DATA)
+
+
+def test_kpi_header_carries_metrics():
+    header = run_script('kpi_aggregator.py', {'jsonrpc': '2.0', 'method': 'aggregate', 'params': {'config': {'operation': 'sum', 'field': 'amount.value'}}})
+
+    assert header['result'] == 'ok'
+    assert stage_names(header) == ['read', 'decode', 'aggregate', 'serialize']
+
+
+def test_pivot_header_carries_metrics():
+    config = {'rows': [{'field': 'status'}], 'values': [{'field': 'amount.value', 'aggregator': 'sum'}]}
+    header = run_script('pivot_table.py', {'jsonrpc': '2.0', 'method': 'pivot', 'params': {'config': config}})
+
+    assert header['result']['status'] == 'success'
+    assert stage_names(header) == ['read', 'decode', 'flatten', 'aggregate', 'serialize']
+    assert header['metrics']['stages'][1]['rows'] == len(SAMPLE_DATA)
+
+
+def test_cross_module_header_carries_metrics():
+    header = run_script('cross_module_join.py', {'jsonrpc': '2.0', 'method': 'aggregate', 'params': {'config': {'parentDataset': 'opportunity', 'relations': []}}})
+
+    assert header['result'] == 'ok'
+    assert stage_names(header) == ['read', 'decode', 'join', 'serialize']
@@ -1,15 +1,17 @@
 import { FastifyPluginCallback } from 'fastify';
 import fp from 'fastify-plugin';
+import { Readable } from 'node:stream';
 
 import isObject from 'lodash/isObject';
 import isString from 'lodash/isString';
 
 import { getAuthTokenIdFromReq } from '@imports/utils/sessionUtils';
 
-import { find, pivotStream, graphStream, kpiStream } from '@imports/data/api';
+import { find, pivotStream, pivotExpand, pivotFrames, graphStream, kpiStream } from '@imports/data/api';
+import { NEWLINE_SEPARATOR } from '@imports/data/api/streamConstants';
 import { update } from '@imports/data/api/update';
 import { create, deleteData, findById, findByLookup, getNextUserFromQueue, historyFind, relationCreate, saveLead } from '@imports/data/data';
-import { PivotConfig } from '@imports/types/pivot';
+import { PivotCellFormat, PivotConfig } from '@imports/types/pivot';
 import { GraphConfig } from '@imports/types/graph';
 
 import { getUserSafe } from '@imports/auth/getUser';
@@ -512,6 +514,8 @@ export const dataApi: FastifyPluginCallback = (fastify, _, done) => {
 			withDetailFields?: string;
 			pivotConfig?: string;
 			cacheTTL?: string;
+			/** 'ndjson' streams the result as PivotResultFrame lines instead of one JSON document (not cached) */
+			outputFormat?: string;
 		};
 	}>(
 		'/rest/data/:document/pivot',
@@ -603,8 +607,11 @@ export const dataApi: FastifyPluginCallback = (fastify, _, done) => {
 			const acceptLanguage = req.headers['accept-language'] || 'pt-BR';
 			const lang = acceptLanguage.startsWith('pt') ? 'pt_BR' : 'en';
 
-			// ADR-0049: Cache for pivot endpoint (same dual-layer pattern as KPI)
-			const cacheTTL = req.query.cacheTTL != null ? parseInt(req.query.cacheTTL, 10) : DEFAULT_CACHE_TTL_SECONDS;
+			// ADR-0049: Cache for pivot endpoint (same dual-layer pattern as KPI). Depth-limited pivots hand out expansion keys
+			// of a state that expires, so their responses (stale window included) must not outlive it
+			const requestedCacheTTL = req.query.cacheTTL != null ? parseInt(req.query.cacheTTL, 10) : DEFAULT_CACHE_TTL_SECONDS;
+			const cacheTTL =
+				pivotConfig.options?.maxDepth != null ? Math.min(requestedCacheTTL, PIVOT_STATE_TTL_SECONDS - STALE_WHILE_REVALIDATE_SECONDS) : requestedCacheTTL;
 
 			const userResult = await getUserSafe(authTokenId);
 			if (userResult.success === false) {
@@ -613,6 +620,43 @@ export const dataApi: FastifyPluginCallback = (fastify, _, done) => {
 			}
 			const userId = userResult.data._id;
 
+			const pivotParams = {
+				authTokenId,
+				document: req.params.document,
+				displayName: req.query.displayName,
+				displayType: req.query.displayType,
+				fields: req.query.fields,
+				filter: parsedFilter,
+				sort: req.query.sort,
+				limit: req.query.limit,
+				start: req.query.start,
+				withDetailFields: req.query.withDetailFields,
+				pivotConfig,
+				lang,
+				ownerId: userId,
+				tracingSpan,
+			};
+
+			// Streamed result: rows are forwarded as pivot_table.py writes them, so it bypasses the blob cache
+			if (req.query.outputFormat === 'ndjson') {
+				const framesResult = await pivotFrames(pivotParams);
+				if (framesResult.success === false) {
+					tracingSpan.end();
+					return framesResult;
+				}
+
+				const body = Readable.from(
+					(async function* () {
+						for await (const frame of framesResult.frames) {
+							yield JSON.stringify(frame) + NEWLINE_SEPARATOR;
+						}
+					})(),
+				);
+				body.once('close', () => tracingSpan.end());
+				reply.type('application/x-ndjson');
+				return reply.send(body);
+			}
+
 			const cacheResult = await withBlobCache({
 				req: req as unknown as { headers: Record<string, string | string[] | undefined> },
 				reply,
@@ -623,21 +667,7 @@ export const dataApi: FastifyPluginCallback = (fastify, _, done) => {
 				filter: parsedFilter,
 				cacheTTL,
 				compute: async () => {
-					const result = await pivotStream({
-						authTokenId,
-						document: req.params.document,
-						displayName: req.query.displayName,
-						displayType: req.query.displayType,
-						fields: req.query.fields,
-						filter: parsedFilter,
-						sort: req.query.sort,
-						limit: req.query.limit,
-						start: req.query.start,
-						withDetailFields: req.query.withDetailFields,
-						pivotConfig,
-						lang,
-						tracingSpan,
-					});
+					const result = await pivotStream(pivotParams);
 
 					return JSON.stringify(result);
 				},
@@ -654,6 +684,45 @@ export const dataApi: FastifyPluginCallback = (fastify, _, done) => {
 		},
 	);
 
+	// Children of a node of a depth-limited pivot (pivotConfig.options.maxDepth), from its expansionKey
+	fastify.get<{
+		Params: { document: string };
+		Querystring: {
+			expansionKey?: string;
+			maxDepth?: string;
+			cellFormat?: PivotCellFormat;
+		};
+	}>('/rest/data/:document/pivot/expand', async (req, reply) => {
+		const { tracer } = req.openTelemetry();
+		const tracingSpan = tracer.startSpan('GET pivot expand');
+
+		const authTokenId = getAuthTokenIdFromReq(req);
+		tracingSpan.setAttribute('authTokenId', authTokenId ?? 'undefined');
+		tracingSpan.setAttribute('document', req.params.document);
+
+		if (!isString(req.query.expansionKey) || req.query.expansionKey.length === 0) {
+			tracingSpan.end();
+			return errorReturn(`[${req.params.document}] expansionKey is required`);
+		}
+
+		const userResult = await getUserSafe(authTokenId);
+		if (userResult.success === false) {
+			tracingSpan.end();
+			return reply.status(500).send(userResult);
+		}
+
+		const result = await pivotExpand({
+			expansionKey: req.query.expansionKey,
+			maxDepth: req.query.maxDepth != null ? parseInt(req.query.maxDepth, 10) : undefined,
+			cellFormat: req.query.cellFormat,
+			ownerId: userResult.data._id,
+			tracingSpan,
+		});
+
+		tracingSpan.end();
+		reply.send(result);
+	});
+
 	fastify.get<{
 		Params: { document: string };
 		Querystring: {
@@ -867,6 +936,8 @@ export const dataApi: FastifyPluginCallback = (fastify, _, done) => {
 	// --- Cache constants (ADR-0012: no-magic-numbers) ---
 	const DEFAULT_CACHE_TTL_SECONDS = 300;
 	const STALE_WHILE_REVALIDATE_SECONDS = 60;
+	// Expiry of the aggregated state of a depth-limited pivot (pivot_state_cache.py CACHE_TTL_SECONDS)
+	const PIVOT_STATE_TTL_SECONDS = 3600;
 	const HTTP_NOT_MODIFIED = 304;
 	const HASH_ALGORITHM = 'sha256';
 	const HASH_ENCODING = 'hex' as const;